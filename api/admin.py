@@ -4,12 +4,14 @@ from .models import (
     Author,
     Category,
     Book,
-    Borrow
+    Borrow,
+    ArchivedBorrow,
+    Hold,
 )
 
 @admin.register(UserAccount)
 class UserAccountAdmin(admin.ModelAdmin):
-    list_display = ('id', 'email', 'username', 'penalty_point', 'is_active', 'is_staff')
+    list_display = ('id', 'email', 'username', 'penalty_point', 'active_borrow_count', 'is_active', 'is_staff')
 
 admin.site.register(Author)
 admin.site.register(Category)
@@ -20,4 +22,12 @@ class BookAdmin(admin.ModelAdmin):
 
 @admin.register(Borrow)
 class BorrowAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user__username', 'book__title')
\ No newline at end of file
+    list_display = ('id', 'user__username', 'book__title')
+
+@admin.register(ArchivedBorrow)
+class ArchivedBorrowAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user__username', 'book__title', 'return_date')
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user__username', 'book__title', 'status', 'created_at', 'expires_at')
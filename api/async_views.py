@@ -0,0 +1,202 @@
+"""
+Async versions of the read-only endpoints, for the ASGI deployment.
+
+DRF views are synchronous, so under ASGI every request to them is pushed
+through a thread-sensitive ``sync_to_async`` adapter. These views are plain
+async Django views that use the async ORM directly and return the same
+payloads as their counterparts in ``api.views``, behind the same throttles,
+catalog cache and conditional GET handling.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.views import View
+from rest_framework.exceptions import Throttled
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .authentication import aget_user
+from .cache import catalog_cache
+from .conditional import conditional_get
+from .circulation import borrow_history, merge_history, BorrowError
+from .models import Book, Author, Category
+from .pagination import KeysetPaginator, InvalidCursor
+from .views import BOOK_LIST_PARAMS, book_list_key
+from .serializers import (
+    BookInfoSerializer,
+    BookInfoValuesSerializer,
+    AuthorValuesSerializer,
+    CategoryValuesSerializer,
+    BorrowListValuesSerializer,
+    PenaltyPointSerializer,
+)
+
+User = get_user_model()
+
+NOT_AUTHENTICATED = {"detail": "Authentication credentials were not provided."}
+PERMISSION_DENIED = {"detail": "You do not have permission to perform this action."}
+
+
+async def authenticate(request):
+    """
+    Resolve the user of a ``Bearer`` JWT, or return ``None``.
+    Token validation is pure CPU work; the user comes from the same cache as
+    ``CachedUserJWTAuthentication`` and only a miss hits the database.
+    """
+    jwt = JWTAuthentication()
+    header = jwt.get_header(request)
+    raw_token = jwt.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        token = jwt.get_validated_token(raw_token)
+        return await aget_user(token)
+    except (InvalidToken, TokenError):
+        return None
+
+
+class AsyncAPIView(View):
+    """
+    Authenticates the request into ``request.user`` (anonymous without a
+    valid token) and applies ``DEFAULT_THROTTLE_CLASSES`` before the handler
+    runs. The throttles are the ones the DRF views use, so both share each
+    client's budget.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = await authenticate(request) or AnonymousUser()
+        throttled = self.check_throttles(request)
+        if throttled is not None:
+            return throttled
+        return await super().dispatch(request, *args, **kwargs)
+
+    def check_throttles(self, request):
+        # The counters are single cache round trips, like in the DRF views.
+        waits = [
+            throttle.wait()
+            for throttle in (throttle_class() for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES)
+            if not throttle.allow_request(request, self)
+        ]
+        if not waits:
+            return None
+        exc = Throttled(max(waits))
+        response = JsonResponse({"detail": str(exc.detail)}, status=exc.status_code)
+        response['Retry-After'] = '%d' % exc.wait
+        return response
+
+
+def cached_response(data, hit, status=200):
+    response = JsonResponse(data, status=status, safe=False)
+    response['X-Cache'] = 'HIT' if hit else 'MISS'
+    return response
+
+
+class AsyncBookInfoView(AsyncAPIView):
+    replica_reads = True
+
+    @conditional_get('book', 'author', 'category')
+    async def get(self, request, id=None):
+        if id:
+            data, hit = await catalog_cache.aget_or_set(f"book:{id}", lambda: self.book_detail(id))
+            if data is None:
+                return JsonResponse({"msg": "no book found"}, status=404)
+            return cached_response(data, hit)
+
+        params = {key: request.GET.get(key) for key in BOOK_LIST_PARAMS}
+        try:
+            data, hit = await catalog_cache.aget_or_set(book_list_key(params), lambda: self.book_list(**params))
+        except InvalidCursor:
+            return JsonResponse({"msg": "invalid cursor"}, status=400)
+        return cached_response(data, hit)
+
+    async def book_detail(self, id):
+        book = await Book.objects.select_related('author', 'category').filter(id=id).afirst()
+        if not book:
+            return None
+        return dict(BookInfoSerializer(book).data)
+
+    async def book_list(self, author=None, category=None, cursor=None, page_size=None):
+        books = Book.objects.all()
+        if author:
+            books = books.filter(author__name__icontains=author)
+        if category:
+            books = books.filter(category__name__icontains=category)
+
+        if cursor is None and page_size is None:
+            return await BookInfoValuesSerializer.aserialize(books)
+
+        paginator = KeysetPaginator(ordering=('title', 'id'), page_size=page_size)
+        rows = await BookInfoValuesSerializer.aserialize(paginator.page_queryset(books, cursor))
+        results, next_cursor = paginator.page(rows)
+        return {"results": results, "next": next_cursor}
+
+
+class AsyncAdminListView(AsyncAPIView):
+    replica_reads = True
+    queryset = None
+    serializer_class = None
+
+    async def get(self, request):
+        if not request.user.is_authenticated:
+            return JsonResponse(NOT_AUTHENTICATED, status=401)
+        if not request.user.is_staff:
+            return JsonResponse(PERMISSION_DENIED, status=403)
+        return await self.list(request)
+
+    async def list(self, request):
+        return JsonResponse(await self.serializer_class.aserialize(self.queryset.all()), safe=False)
+
+
+class AsyncAuthorsView(AsyncAdminListView):
+    queryset = Author.objects.all()
+    serializer_class = AuthorValuesSerializer
+
+    @conditional_get('author')
+    async def list(self, request):
+        return await super().list(request)
+
+
+class AsyncCategoryView(AsyncAdminListView):
+    queryset = Category.objects.all()
+    serializer_class = CategoryValuesSerializer
+
+    @conditional_get('category')
+    async def list(self, request):
+        return await super().list(request)
+
+
+class AsyncBorrowListView(AsyncAPIView):
+    async def get(self, request):
+        user = request.user
+        if not user.is_authenticated:
+            return JsonResponse(NOT_AUTHENTICATED, status=401)
+        params = {key: request.GET.get(key) for key in ("status", "cursor", "page_size")}
+        try:
+            querysets, paginator = borrow_history({'user_id': user.pk}, **params)
+            rows = merge_history(
+                [await BorrowListValuesSerializer.aserialize(queryset) for queryset in querysets], paginator
+            )
+        except BorrowError as e:
+            return JsonResponse({"msg": str(e)}, status=400)
+        except InvalidCursor:
+            return JsonResponse({"msg": "invalid cursor"}, status=400)
+
+        if paginator is None:
+            return JsonResponse(rows, safe=False)
+        results, next_cursor = paginator.page(rows)
+        return JsonResponse({"results": results, "next": next_cursor})
+
+
+class AsyncPenaltiesInfoView(AsyncAPIView):
+    async def get(self, request, id):
+        req_user = request.user
+        if not req_user.is_authenticated:
+            return JsonResponse(NOT_AUTHENTICATED, status=401)
+
+        if not (req_user.is_staff or req_user.pk == id):
+            return JsonResponse({"error": "Permission denied"}, status=403)
+        user = await User.objects.filter(id=id).afirst()
+        if user is None:
+            return JsonResponse({"detail": "Not found."}, status=404)
+        return JsonResponse(PenaltyPointSerializer(user).data)
@@ -0,0 +1,112 @@
+import copy
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .cache import LRUCache
+
+User = get_user_model()
+
+# Claims copied from the user into every token, see LibraryTokenObtainPairSerializer.
+USER_CLAIMS = ('is_staff', 'is_active')
+
+
+def build_user_cache():
+    config = {'MAX_ENTRIES': 10000, 'TIMEOUT': 60}
+    config.update(getattr(settings, 'AUTH_USER_CACHE', {}))
+    return LRUCache(config['MAX_ENTRIES']), config['TIMEOUT']
+
+
+user_cache, USER_CACHE_TIMEOUT = build_user_cache()
+
+
+def invalidate_cached_user(user_id):
+    user_cache.delete(str(user_id))
+
+
+def invalidate_cached_users(user_ids):
+    """
+    Drop ``user_ids`` after a queryset ``update()``, which sends no
+    ``post_save``. Dropped again after commit, so that a request that cached
+    the row before the update committed is not served until the timeout.
+    """
+    user_ids = list(user_ids)
+
+    def drop():
+        for user_id in user_ids:
+            invalidate_cached_user(user_id)
+
+    drop()
+    transaction.on_commit(drop)
+
+
+def cached_user(token):
+    """
+    Return a private copy of the cached user for ``token``, or ``None``.
+
+    Inactive tokens are rejected from their claims alone. A cached entry
+    whose flags disagree with a newer token (the user was promoted or
+    demoted and logged in again on another worker) counts as a miss.
+    """
+    if token.get('is_active') is False:
+        raise AuthenticationFailed("User is inactive", code="user_inactive")
+    user = user_cache.get(str(token[jwt_settings.USER_ID_CLAIM]))
+    if user is None:
+        return None
+    if any(claim in token and token[claim] != getattr(user, claim) for claim in USER_CLAIMS):
+        return None
+    # Views may modify request.user; never hand out the shared instance.
+    return copy.copy(user)
+
+
+def remember_user(user):
+    if user is not None and user.is_active:
+        user_cache.set(str(user.pk), copy.copy(user), USER_CACHE_TIMEOUT)
+    return user
+
+
+def token_user_id(token):
+    try:
+        return token[jwt_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken("Token contained no recognizable user identification")
+
+
+class CachedUserJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that resolves the user from a short-lived
+    per-process cache instead of querying ``UserAccount`` on every request.
+
+    Entries are dropped when the user is saved, deleted or updated by
+    ``api.circulation`` in this process; other workers pick up the change
+    once the entry expires after ``AUTH_USER_CACHE['TIMEOUT']`` seconds.
+    """
+
+    def get_user(self, validated_token):
+        token_user_id(validated_token)
+        user = cached_user(validated_token)
+        if user is None:
+            user = remember_user(super().get_user(validated_token))
+        return user
+
+
+async def aget_user(validated_token):
+    """
+    Async counterpart of ``CachedUserJWTAuthentication.get_user`` that
+    returns ``None`` instead of raising.
+    """
+    user_id = token_user_id(validated_token)
+    try:
+        user = cached_user(validated_token)
+    except AuthenticationFailed:
+        return None
+    if user is None:
+        user = await User.objects.filter(**{jwt_settings.USER_ID_FIELD: user_id}).afirst()
+        if user is None or not user.is_active:
+            return None
+        remember_user(user)
+    return user
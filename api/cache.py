@@ -0,0 +1,237 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .routers import primary_reads_after
+
+MISSING = object()
+
+# Backends whose data is private to each process.
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+class LRUCache:
+    """
+    Small thread-safe per-process LRU with optional per-entry expiry.
+    Implements the subset of the Django cache API that ``CatalogCache`` uses.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is MISSING:
+                return default
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.monotonic() + timeout if timeout else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCache:
+    """
+    Lazily resolves a configured Django cache on every call, since
+    ``caches[alias]`` hands out one connection per thread.
+    """
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    def __getattr__(self, name):
+        return getattr(caches[self.alias], name)
+
+
+class CatalogCache:
+    """
+    Read-through cache for serialized catalog responses.
+
+    Every key embeds the current catalog version. Changing a book, author or
+    category bumps the version (see ``api.signals``), which makes every cached
+    entry unreachable at once; stale entries then age out of the store on
+    their own. Inventory counters are not part of the cached payloads, and
+    writes that only touch them do not bump the version, so borrowing and
+    returning books never evicts the catalog.
+
+    While the catalog changed less than ``REPLICA_ROUTING['STICKY_SECONDS']``
+    ago, misses are built from the primary rather than a read replica.
+    The version lives in a Django cache so every process sees the same one;
+    point ``VERSION_CACHE`` at a shared backend when running several workers.
+    """
+
+    version_key = 'catalog:version'
+    tables = ('book', 'author', 'category')
+
+    def __init__(self, store, versions, timeout=None):
+        self.store = store
+        self.versions = versions
+        # Bumped together with the version, see api.signals.
+        self.markers = ChangeMarkers(versions)
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    def version(self):
+        version = self.versions.get(self.version_key)
+        if version is None:
+            self.versions.add(self.version_key, 1, None)
+            version = self.versions.get(self.version_key, 1)
+        return version
+
+    def invalidate(self):
+        try:
+            self.versions.incr(self.version_key)
+        except ValueError:
+            self.versions.add(self.version_key, 2, None)
+
+    def lookup(self, name):
+        """
+        Return ``(key, value)`` for ``name``; ``value`` is ``MISSING`` on a miss.
+        """
+        key = f"catalog:{self.version()}:{name}"
+        value = self.store.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key, value
+
+    def get_or_set(self, name, build):
+        """
+        Return ``(value, hit)`` for ``name``, calling ``build()`` on a miss.
+        """
+        key, value = self.lookup(name)
+        if value is not MISSING:
+            return value, True
+
+        # A lagging replica could still return data from before the change
+        # that bumped the version, and it would be kept under the new one.
+        with primary_reads_after(self.markers.last_changed(*self.tables)):
+            value = build()
+        self.store.set(key, value, self.timeout)
+        return value, False
+
+    async def aget_or_set(self, name, build):
+        """
+        ``get_or_set()`` for a coroutine function ``build``.
+        """
+        key, value = self.lookup(name)
+        if value is not MISSING:
+            return value, True
+
+        with primary_reads_after(self.markers.last_changed(*self.tables)):
+            value = await build()
+        self.store.set(key, value, self.timeout)
+        return value, False
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else None,
+            'version': self.version(),
+        }
+
+    def clear(self):
+        self.store.clear()
+        self.hits = self.misses = 0
+
+
+class ChangeMarkers:
+    """
+    Per-table "last changed" markers kept in a Django cache.
+
+    A marker is the ``time.time_ns()`` of the latest change to a table. Reading
+    a few markers is far cheaper than querying or rendering the data they
+    stand for, which makes them a good source for HTTP validators.
+    """
+
+    key_prefix = 'catalog:changed:'
+
+    def __init__(self, store):
+        self.store = store
+
+    def shared(self):
+        """
+        Whether every worker sees the same markers. A process-local store
+        only sees the changes made by its own process.
+        """
+        return not isinstance(caches[self.store.alias], PROCESS_LOCAL_BACKENDS)
+
+    def touch(self, table):
+        self.store.set(self.key_prefix + table, time.time_ns(), None)
+
+    def last_changed(self, *tables):
+        """
+        Unix time of the latest known change to ``tables``, or ``None`` if no
+        change was seen since the cache was emptied.
+        """
+        found = self.store.get_many([self.key_prefix + table for table in tables])
+        return max(found.values()) / 1_000_000_000 if found else None
+
+    def get(self, *tables):
+        keys = [self.key_prefix + table for table in tables]
+        found = self.store.get_many(keys)
+        markers = []
+        for key in keys:
+            marker = found.get(key)
+            if marker is None:
+                # Unknown since the cache was emptied: start counting from now.
+                marker = time.time_ns()
+                self.store.add(key, marker, None)
+                marker = self.store.get(key, marker)
+            markers.append(marker)
+        return markers
+
+
+def build_catalog_cache():
+    config = {
+        'BACKEND': 'lru',
+        'MAX_ENTRIES': 2048,
+        'TIMEOUT': 300,
+        'CACHE_ALIAS': 'default',
+        'VERSION_CACHE': 'default',
+    }
+    config.update(getattr(settings, 'CATALOG_CACHE', {}))
+
+    if config['BACKEND'] == 'django':
+        store = DjangoCache(config['CACHE_ALIAS'])
+    else:
+        store = LRUCache(config['MAX_ENTRIES'])
+    return CatalogCache(store, DjangoCache(config['VERSION_CACHE']), config['TIMEOUT'])
+
+
+def build_change_markers():
+    alias = getattr(settings, 'CATALOG_CACHE', {}).get('VERSION_CACHE', 'default')
+    return ChangeMarkers(DjangoCache(alias))
+
+
+catalog_cache = build_catalog_cache()
+change_markers = build_change_markers()
@@ -0,0 +1,629 @@
+import heapq
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Greatest
+from django.http import Http404
+from django.utils import timezone
+
+from .authentication import invalidate_cached_users
+from .models import ArchivedBorrow, Book, Borrow, Hold
+from .pagination import KeysetPaginator
+
+User = get_user_model()
+
+BORROW_LIMIT = 3
+LOAN_PERIOD = timedelta(days=14)
+PICKUP_WINDOW = timedelta(days=3)
+
+
+class BorrowError(Exception):
+    pass
+
+
+def borrow_book(user, book_id):
+    """
+    Lend one copy of ``book_id`` to ``user``.
+
+    Both the copy and the borrow slot are taken with conditional UPDATEs, so
+    concurrent borrowers can never push ``available_copies`` below zero or a
+    user past ``BORROW_LIMIT``, and nobody's decrement gets lost. If either
+    condition fails the whole transaction is rolled back. A copy put aside
+    for the user's ready hold is taken instead of one from the shelf.
+    """
+    with transaction.atomic():
+        taken = claim_ready_holds(user, [book_id]) or Book.objects.filter(
+            id=book_id, available_copies__gt=0
+        ).update(available_copies=F('available_copies') - 1)
+        if not taken:
+            if not Book.objects.filter(id=book_id).exists():
+                raise Http404("No Book matches the given query.")
+            raise BorrowError("this book is currenlty unavailable")
+
+        slot = User.objects.filter(pk=user.pk, active_borrow_count__lt=BORROW_LIMIT).update(
+            active_borrow_count=F('active_borrow_count') + 1
+        )
+        if not slot:
+            raise BorrowError("can't borrow book. borrow limit reached")
+        invalidate_cached_users([user.pk])
+
+        today = date.today()
+        return Borrow.objects.create(
+            user=user,
+            book_id=book_id,
+            borrow_date=today,
+            due_date=today + LOAN_PERIOD,
+        )
+
+
+def release_borrow_slots(counts):
+    """
+    Give back borrow slots after returns; ``counts`` maps user id to the
+    number of borrows returned.
+    """
+    if not counts:
+        return
+    User.objects.filter(pk__in=counts).update(
+        active_borrow_count=Greatest(F('active_borrow_count') - _case_by_pk(counts), Value(0))
+    )
+    invalidate_cached_users(counts)
+
+
+def add_penalty_points(counts):
+    """
+    Charge penalty points for late returns; ``counts`` maps user id to the
+    number of late borrows returned.
+    """
+    if not counts:
+        return
+    User.objects.filter(pk__in=counts).update(penalty_point=F('penalty_point') + _case_by_pk(counts))
+    invalidate_cached_users(counts)
+
+
+def reconcile_active_borrow_counts(batch_size=1000):
+    """
+    Recompute ``active_borrow_count`` for every user from the open borrows
+    with one grouped aggregate and write back only the counters that drifted.
+    Returns the number of users corrected.
+    """
+    actual = dict(
+        Borrow.objects.filter(return_date__isnull=True)
+        .values_list('user_id').annotate(n=Count('id')).order_by()
+    )
+    stored = dict(User.objects.filter(active_borrow_count__gt=0).values_list('pk', 'active_borrow_count'))
+
+    drifted = [
+        User(pk=pk, active_borrow_count=actual.get(pk, 0))
+        for pk in stored.keys() | actual.keys()
+        if stored.get(pk, 0) != actual.get(pk, 0)
+    ]
+    User.objects.bulk_update(drifted, ['active_borrow_count'], batch_size=batch_size)
+    invalidate_cached_users(user.pk for user in drifted)
+    return len(drifted)
+
+
+def reconcile_available_copies(chunk_size=10000, batch_size=1000, dry_run=False, pause=0.01):
+    """
+    Recompute ``available_copies`` for every book as ``total_copies`` minus
+    its open borrows and the copies put aside for ready holds, and write back
+    only the books that drifted.
+
+    Books are walked in primary key ranges of ``chunk_size``, each read with
+    one grouped aggregate per table and fixed in its own short write-locked
+    transaction. Between ranges it sleeps ``pause`` seconds so that waiting
+    borrows and returns get the lock; they wait at most for one range.
+
+    Drift is applied as ``F() + delta`` rather than as the recomputed value,
+    so nothing that committed before the lock was taken is undone.
+
+    Returns a report: books checked, books drifted, total copies gained and
+    lost, and ``overcommitted`` books with more copies out than they own,
+    which are set to 0.
+    """
+    report = Counter(books=0, drifted=0, copies_added=0, copies_removed=0, overcommitted=0)
+    last_id = None
+    while True:
+        with write_transaction():
+            last_id, found = _reconcile_book_range(last_id, chunk_size, batch_size, dry_run)
+        if not found['books']:
+            return dict(report)
+        report.update(found)
+        time.sleep(pause)
+
+
+@contextmanager
+def write_transaction():
+    """
+    ``transaction.atomic()`` that holds the write lock from its first read.
+    SQLite cannot lock rows, and a deferred transaction that reads and then
+    writes fails with "database is locked" when another writer got in
+    between, so SQLite starts it with ``BEGIN IMMEDIATE`` instead.
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic():
+            yield
+        return
+    connection.ensure_connection()
+    mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic():
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
+
+
+def _reconcile_book_range(after, chunk_size, batch_size, dry_run):
+    books = Book.objects.order_by('id')
+    if after is not None:
+        books = books.filter(id__gt=after)
+    if connection.features.has_select_for_update:
+        books = books.select_for_update()
+    rows = list(books.values_list('id', 'total_copies', 'available_copies')[:chunk_size])
+    found = Counter(books=len(rows))
+    if not rows:
+        return after, found
+    first_id, last_id = rows[0][0], rows[-1][0]
+
+    out = Counter(dict(
+        Borrow.objects.filter(return_date__isnull=True, book_id__gte=first_id, book_id__lte=last_id)
+        .values_list('book_id').annotate(n=Count('id')).order_by()
+    ))
+    out.update(dict(
+        Hold.objects.filter(status=Hold.Status.READY, book_id__gte=first_id, book_id__lte=last_id)
+        .values_list('book_id').annotate(n=Count('id')).order_by()
+    ))
+
+    drifted = []
+    for book_id, total, available in rows:
+        expected = total - out[book_id]
+        if expected < 0:
+            found['overcommitted'] += 1
+            expected = 0
+        delta = expected - (available or 0)
+        if available is not None and not delta:
+            continue
+        found['copies_added' if delta > 0 else 'copies_removed'] += abs(delta)
+        drifted.append(Book(pk=book_id, available_copies=(
+            Value(expected) if available is None else F('available_copies') + delta
+        )))
+    found['drifted'] = len(drifted)
+    if drifted and not dry_run:
+        Book.objects.bulk_update(drifted, ['available_copies'], batch_size=batch_size)
+    return last_id, found
+
+
+# Newest first; served by borrow_user_history_idx for one user and by
+# borrow_history_idx / borrow_active_history_idx across all users, and by
+# their archive_* counterparts on ArchivedBorrow.
+HISTORY_ORDERING = ('-borrow_date', '-id')
+
+BORROW_STATUSES = {
+    'active': lambda today: {'return_date__isnull': True},
+    'returned': lambda today: {'return_date__isnull': False},
+    'overdue': lambda today: {'return_date__isnull': True, 'due_date__lt': today},
+}
+
+
+def borrow_history(filters=None, status=None, cursor=None, page_size=None, paged=False):
+    """
+    Querysets for a history listing of the borrows matching ``filters``,
+    newest first: one on ``Borrow`` and, unless ``status`` only covers open
+    loans, one on ``ArchivedBorrow``.
+
+    Returns ``(querysets, paginator)``. Without ``cursor``, ``page_size`` and
+    ``paged`` the paginator is ``None`` and the querysets hold every matching
+    row; otherwise each holds one page plus one row. Serialize each and combine
+    them with ``merge_history()``. Raises ``BorrowError`` for an unknown
+    ``status`` and ``InvalidCursor`` for a bad cursor.
+    """
+    filters = dict(filters or {})
+    if status:
+        if status not in BORROW_STATUSES:
+            raise BorrowError(f"status must be one of {', '.join(BORROW_STATUSES)}")
+        filters.update(BORROW_STATUSES[status](date.today()))
+
+    querysets = [Borrow.objects.filter(**filters)]
+    if not filters.get('return_date__isnull'):
+        querysets.append(ArchivedBorrow.objects.filter(**filters))
+
+    if cursor is None and page_size is None and not paged:
+        return [queryset.order_by(*HISTORY_ORDERING) for queryset in querysets], None
+    paginator = KeysetPaginator(ordering=HISTORY_ORDERING, page_size=page_size)
+    return [paginator.page_queryset(queryset, cursor) for queryset in querysets], paginator
+
+
+def merge_history(row_lists, paginator=None):
+    """
+    Merge the serialized rows of ``borrow_history()``'s querysets into one
+    newest-first list, cut back to one page plus one row when paginated.
+    """
+    if len(row_lists) == 1:
+        return row_lists[0]
+    rows = heapq.merge(*row_lists, key=lambda row: (row['borrow_date'], row['id']), reverse=True)
+    return list(islice(rows, paginator.page_size + 1 if paginator else None))
+
+
+def archive_settings():
+    config = {
+        'AFTER_DAYS': 365,
+        'BATCH_SIZE': 5000,
+    }
+    config.update(getattr(settings, 'BORROW_ARCHIVE', {}))
+    return config
+
+
+ARCHIVED_FIELDS = ('id', 'user_id', 'book_id', 'borrow_date', 'due_date', 'return_date')
+
+
+def archive_returned_borrows(after_days=None, batch_size=None, pause=0.01):
+    """
+    Move borrows returned more than ``after_days`` ago to ``ArchivedBorrow``.
+
+    Candidates are walked in primary key order, ``batch_size`` at a time.
+    Each batch is copied with ``bulk_create`` and deleted in one short
+    write-locked transaction, so every borrow is in exactly one of the two
+    tables at any time, and borrows and returns get the lock between batches.
+    Defaults come from ``settings.BORROW_ARCHIVE``. Returns the number of
+    borrows moved.
+    """
+    config = archive_settings()
+    after_days = config['AFTER_DAYS'] if after_days is None else after_days
+    batch_size = batch_size or config['BATCH_SIZE']
+    cutoff = date.today() - timedelta(days=after_days)
+
+    moved = 0
+    last_id = None
+    while True:
+        with write_transaction():
+            candidates = Borrow.objects.filter(return_date__lt=cutoff).order_by('id')
+            if last_id is not None:
+                candidates = candidates.filter(id__gt=last_id)
+            rows = list(candidates.values_list(*ARCHIVED_FIELDS)[:batch_size])
+            if not rows:
+                return moved
+            ArchivedBorrow.objects.bulk_create(
+                [ArchivedBorrow(**dict(zip(ARCHIVED_FIELDS, row))) for row in rows],
+                ignore_conflicts=True,
+            )
+            Borrow.objects.filter(id__in=[row[0] for row in rows]).delete()
+        last_id = rows[-1][0]
+        moved += len(rows)
+        time.sleep(pause)
+
+
+MAX_BATCH_SIZE = 50
+
+
+def _parse_ids(raw_ids):
+    """
+    Return ``(items, ids)``: one ``(raw, id, error)`` triple per requested
+    value, and the distinct valid ids in request order.
+    """
+    items = []
+    ids = []
+    for raw in raw_ids:
+        try:
+            value = uuid.UUID(str(raw))
+        except ValueError:
+            items.append((raw, None, "invalid id"))
+            continue
+        if value in ids:
+            items.append((raw, None, "duplicate id in request"))
+            continue
+        ids.append(value)
+        items.append((raw, value, None))
+    return items, ids
+
+
+def _error(key, raw, msg):
+    return {key: str(raw), "status": "error", "msg": msg}
+
+
+def borrow_books(user, book_ids):
+    """
+    Lend one copy of each of ``book_ids`` to ``user`` in a single transaction.
+
+    Uses a fixed number of queries whatever the batch size: one each to read
+    the user's borrow count, the requested books and the user's ready holds
+    on them, one conditional UPDATE each for the inventory and the borrow
+    count, and one bulk INSERT for the borrows, plus one UPDATE to claim the
+    ready holds among them. Books are granted in request order until the
+    borrow limit is reached. Returns one result dict per requested id, in
+    request order.
+    """
+    items, ids = _parse_ids(book_ids)
+    granted = []
+    outcome = {}
+
+    with write_transaction():
+        users = User.objects.filter(pk=user.pk)
+        if connection.features.has_select_for_update:
+            users = users.select_for_update()
+        slots = BORROW_LIMIT - users.values_list('active_borrow_count', flat=True).get()
+
+        books = Book.objects.filter(id__in=ids)
+        if connection.features.has_select_for_update:
+            books = books.select_for_update()
+        available = dict(books.values_list('id', 'available_copies'))
+        held = ready_holds(user, ids)
+
+        for book_id in ids:
+            if book_id not in available:
+                outcome[book_id] = "No Book matches the given query."
+            elif available[book_id] < 1 and book_id not in held:
+                outcome[book_id] = "this book is currenlty unavailable"
+            elif len(granted) >= slots:
+                outcome[book_id] = "can't borrow book. borrow limit reached"
+            else:
+                granted.append(book_id)
+
+        if granted:
+            from_holds = [book_id for book_id in granted if book_id in held]
+            from_shelf = [book_id for book_id in granted if book_id not in held]
+            taken = claim_ready_holds(user, from_holds) if from_holds else 0
+            if from_shelf:
+                taken += Book.objects.filter(id__in=from_shelf, available_copies__gt=0).update(
+                    available_copies=F('available_copies') - 1
+                )
+            if taken != len(granted):
+                raise BorrowError("inventory changed during the request, please retry")
+            claimed = User.objects.filter(
+                pk=user.pk, active_borrow_count__lte=BORROW_LIMIT - len(granted)
+            ).update(active_borrow_count=F('active_borrow_count') + len(granted))
+            if not claimed:
+                raise BorrowError("borrow count changed during the request, please retry")
+            invalidate_cached_users([user.pk])
+
+            today = date.today()
+            borrows = Borrow.objects.bulk_create([
+                Borrow(user=user, book_id=book_id, borrow_date=today, due_date=today + LOAN_PERIOD)
+                for book_id in granted
+            ])
+            for borrow in borrows:
+                outcome[borrow.book_id] = borrow
+
+    results = []
+    for raw, book_id, error in items:
+        result = error or outcome[book_id]
+        if isinstance(result, Borrow):
+            results.append({
+                "book_id": str(raw), "status": "borrowed",
+                "borrow_id": str(result.id), "due_date": result.due_date,
+            })
+        else:
+            results.append(_error("book_id", raw, result))
+    return results
+
+
+def return_books(actor, borrow_ids):
+    """
+    Return every borrow in ``borrow_ids`` in a single transaction.
+
+    Non-staff users can only return their own borrows. Inventory, borrow
+    counts and penalty points are adjusted with one UPDATE each, grouped by
+    book and by user, so the number of queries does not grow with the batch
+    size, except for two more per returned book that has a hold queue.
+    """
+    items, ids = _parse_ids(borrow_ids)
+    outcome = {}
+    returned = []
+    today = date.today()
+
+    with write_transaction():
+        borrows = Borrow.objects.filter(id__in=ids)
+        if connection.features.has_select_for_update:
+            borrows = borrows.select_for_update()
+        rows = {
+            row['id']: row
+            for row in borrows.values('id', 'user_id', 'book_id', 'due_date', 'return_date')
+        }
+
+        for borrow_id in ids:
+            row = rows.get(borrow_id)
+            if row is None or not (actor.is_staff or row['user_id'] == actor.pk):
+                outcome[borrow_id] = "No Borrow matches the given query."
+            elif row['return_date']:
+                outcome[borrow_id] = "book already returned"
+            else:
+                returned.append(row)
+                outcome[borrow_id] = None
+
+        if returned:
+            closed = Borrow.objects.filter(
+                id__in=[row['id'] for row in returned], return_date__isnull=True
+            ).update(return_date=today)
+            if closed != len(returned):
+                raise BorrowError("borrow changed during the request, please retry")
+
+            release_copies(Counter(row['book_id'] for row in returned))
+            release_borrow_slots(Counter(row['user_id'] for row in returned))
+
+            add_penalty_points(Counter(row['user_id'] for row in returned if row['due_date'] < today))
+
+    results = []
+    for raw, borrow_id, error in items:
+        msg = error or outcome[borrow_id]
+        if msg:
+            results.append(_error("borrow_id", raw, msg))
+        else:
+            results.append({"borrow_id": str(raw), "status": "returned"})
+    return results
+
+
+# Hold queues: first come, first served; served by hold_queue_idx.
+QUEUE_ORDERING = ('created_at', 'id')
+OPEN_HOLDS = (Hold.Status.WAITING, Hold.Status.READY)
+
+
+def place_hold(user, book_id):
+    """
+    Queue ``user`` for the next returned copy of ``book_id``. Only books with
+    no copy on the shelf can be held, and only once per user.
+    """
+    with write_transaction():
+        available = Book.objects.filter(id=book_id).values_list('available_copies', flat=True).first()
+        if available is None:
+            raise Http404("No Book matches the given query.")
+        if available > 0:
+            raise BorrowError("this book is available, borrow it instead")
+        if Borrow.objects.filter(user=user, book_id=book_id, return_date__isnull=True).exists():
+            raise BorrowError("you have already borrowed this book")
+        try:
+            with transaction.atomic():
+                return Hold.objects.create(user=user, book_id=book_id)
+        except IntegrityError:
+            raise BorrowError("you already have a hold on this book")
+
+
+def cancel_hold(user, hold_id):
+    """
+    Cancel an open hold of ``user``. A copy that was put aside for it goes
+    to the next holder or back on the shelf.
+    """
+    with write_transaction():
+        hold = Hold.objects.filter(id=hold_id, user=user, status__in=OPEN_HOLDS).values_list(
+            'book_id', 'status'
+        ).first()
+        if hold is None:
+            raise Http404("No Hold matches the given query.")
+        book_id, status = hold
+        if not Hold.objects.filter(id=hold_id, status=status).update(status=Hold.Status.CANCELLED):
+            raise BorrowError("hold changed during the request, please retry")
+        if status == Hold.Status.READY:
+            release_copies({book_id: 1})
+
+
+def with_queue_position(holds):
+    """
+    Annotate ``holds`` with ``position``: 1 for the first waiting hold on its
+    book, ``None`` once a copy is ready. Each position is an index range
+    count on hold_queue_idx, all within the same query.
+    """
+    ahead = (
+        Hold.objects
+        .filter(book_id=OuterRef('book_id'), status=Hold.Status.WAITING)
+        .filter(
+            Q(created_at__lt=OuterRef('created_at'))
+            | Q(created_at=OuterRef('created_at'), id__lte=OuterRef('id'))
+        )
+        .order_by().values('book_id').annotate(n=Count('id')).values('n')
+    )
+    return holds.annotate(position=Case(
+        When(status=Hold.Status.WAITING, then=Subquery(ahead)),
+        default=None,
+        output_field=IntegerField(),
+    ))
+
+
+def ready_holds(user, book_ids):
+    """
+    Return the ids among ``book_ids`` that ``user`` has a copy put aside for.
+    """
+    return set(
+        Hold.objects.filter(
+            user=user, book_id__in=book_ids, status=Hold.Status.READY, expires_at__gt=timezone.now()
+        ).values_list('book_id', flat=True)
+    )
+
+
+def claim_ready_holds(user, book_ids):
+    """
+    Mark the user's ready holds on ``book_ids`` fulfilled; returns how many
+    there were. Their copies are already off the shelf.
+    """
+    return Hold.objects.filter(
+        user=user, book_id__in=book_ids, status=Hold.Status.READY, expires_at__gt=timezone.now()
+    ).update(status=Hold.Status.FULFILLED)
+
+
+def release_copies(copies, now=None):
+    """
+    Put freed copies back into circulation; ``copies`` maps book id to the
+    number of copies. Each copy goes to the next waiting hold on its book,
+    which is ready for ``PICKUP_WINDOW``, and to the shelf when nobody is
+    waiting. One query finds the books with a queue and one UPDATE restocks
+    the shelf; only books with a queue cost two more. Must run inside the
+    transaction that freed the copies.
+    """
+    now = now or timezone.now()
+    queued = set(
+        Hold.objects.filter(book_id__in=copies, status=Hold.Status.WAITING)
+        .values_list('book_id', flat=True).distinct()
+    )
+    shelf = Counter()
+    for book_id, count in copies.items():
+        if book_id in queued:
+            count -= _promote_holds(book_id, count, now)
+        if count:
+            shelf[book_id] = count
+    if shelf:
+        Book.objects.filter(id__in=shelf).update(
+            available_copies=F('available_copies') + _case_by_pk(shelf)
+        )
+
+
+def _promote_holds(book_id, count, now):
+    # The next ``count`` holders in the queue, straight off hold_queue_idx.
+    next_ids = list(
+        Hold.objects.filter(book_id=book_id, status=Hold.Status.WAITING)
+        .order_by(*QUEUE_ORDERING).values_list('id', flat=True)[:count]
+    )
+    return Hold.objects.filter(id__in=next_ids, status=Hold.Status.WAITING).update(
+        status=Hold.Status.READY, ready_at=now, expires_at=now + PICKUP_WINDOW,
+    )
+
+
+def expire_holds(now=None, batch_size=1000):
+    """
+    Expire ready holds whose pickup window has passed, in batches of
+    ``batch_size``, and pass their copies on with ``release_copies``. Also
+    hands shelf copies to holders who queued while a copy was being returned.
+    Returns the number of holds expired.
+    """
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        with write_transaction():
+            rows = list(
+                Hold.objects.filter(status=Hold.Status.READY, expires_at__lte=now)
+                .order_by('expires_at').values_list('id', 'book_id')[:batch_size]
+            )
+            if not rows:
+                break
+            Hold.objects.filter(id__in=[pk for pk, _ in rows], status=Hold.Status.READY).update(
+                status=Hold.Status.EXPIRED
+            )
+            release_copies(Counter(book_id for _, book_id in rows), now)
+        expired += len(rows)
+
+    stranded = (
+        Hold.objects.filter(status=Hold.Status.WAITING, book__available_copies__gt=0)
+        .values_list('book_id', 'book__available_copies').distinct()
+    )
+    for book_id, available in stranded:
+        with write_transaction():
+            promoted = _promote_holds(book_id, available, now)
+            taken = Book.objects.filter(id=book_id, available_copies__gte=promoted).update(
+                available_copies=F('available_copies') - promoted
+            )
+            if not taken:
+                transaction.set_rollback(True)
+    return expired
+
+
+def _case_by_pk(amounts):
+    return Case(
+        *[When(pk=pk, then=Value(amount)) for pk, amount in amounts.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
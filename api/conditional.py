@@ -0,0 +1,102 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import change_markers
+from .routers import primary_reads_after
+
+
+def catalog_validators(request, tables):
+    """
+    Return ``(etag, last_modified)`` for a GET on data from ``tables``.
+
+    Both come from the tables' change markers, so they are known before the
+    view runs any query. The request path, query string and Accept header are
+    mixed into the ETag because they all select a different representation.
+    """
+    markers = change_markers.get(*tables)
+    source = "|".join([
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+        *(str(marker) for marker in markers),
+    ])
+    etag = quote_etag(hashlib.blake2b(source.encode(), digest_size=16).hexdigest())
+    last_modified = max(markers) // 1_000_000_000
+    return etag, last_modified
+
+
+def is_not_modified(request, etag, last_modified):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def validators_enabled():
+    """
+    Markers in a per-process cache would let a worker that did not see a
+    write answer 304 for data that changed, so validators are only used with
+    a shared marker cache or a single worker.
+    """
+    return getattr(settings, 'CATALOG_CACHE', {}).get('SINGLE_WORKER') or change_markers.shared()
+
+
+def conditional_get(*tables):
+    """
+    Add ETag and Last-Modified to successful responses of a GET handler, and
+    answer 304 when the client already has the current data. Works on APIView
+    handlers and on async Django view handlers.
+
+    Runs inside the handler, i.e. after authentication and permission checks,
+    but before the handler touches the database. While the tables changed
+    less than ``REPLICA_ROUTING['STICKY_SECONDS']`` ago the handler reads
+    from the primary, so a lagging replica cannot pair old data with the new
+    ETag. Does nothing unless ``validators_enabled()``.
+    """
+    def decorator(handler):
+        if iscoroutinefunction(handler):
+            @wraps(handler)
+            async def async_wrapper(self, request, *args, **kwargs):
+                if not validators_enabled():
+                    return await handler(self, request, *args, **kwargs)
+                etag, last_modified = catalog_validators(request, tables)
+                if is_not_modified(request, etag, last_modified):
+                    response = HttpResponseNotModified()
+                else:
+                    with primary_reads_after(last_modified):
+                        response = await handler(self, request, *args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return response
+                return add_validators(response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            if not validators_enabled():
+                return handler(self, request, *args, **kwargs)
+            etag, last_modified = catalog_validators(request, tables)
+            if is_not_modified(request, etag, last_modified):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                with primary_reads_after(last_modified):
+                    response = handler(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+            return add_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def add_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
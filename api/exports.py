@@ -0,0 +1,86 @@
+import csv
+import json
+from itertools import chain
+
+from django.http import StreamingHttpResponse
+
+from .models import ArchivedBorrow, Book, Borrow
+
+EXPORT_CHUNK_SIZE = 2000
+
+BOOK_EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('title', 'title'),
+    ('description', 'description'),
+    ('author', 'author__name'),
+    ('category', 'category__name'),
+    ('total_copies', 'total_copies'),
+    ('available_copies', 'available_copies'),
+]
+
+BORROW_EXPORT_FIELDS = [
+    ('id', 'id'),
+    ('user_id', 'user_id'),
+    ('username', 'user__username'),
+    ('book_id', 'book_id'),
+    ('book', 'book__title'),
+    ('borrow_date', 'borrow_date'),
+    ('due_date', 'due_date'),
+    ('return_date', 'return_date'),
+]
+
+
+class Echo:
+    """
+    File-like object whose ``write`` hands the value straight back, so
+    ``csv.writer`` can format one row at a time without buffering.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(names, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(names, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), default=str) + "\n"
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson', ndjson_lines),
+    'csv': ('text/csv', 'csv', csv_lines),
+}
+
+
+def stream_export(querysets, fields, fmt, filename):
+    """
+    Stream ``querysets``, one after the other, as NDJSON or CSV. Rows are
+    read with ``.iterator()`` as plain tuples and written out one by one, so
+    memory use does not depend on the table size and the response starts
+    before the query finishes.
+    """
+    content_type, extension, lines = EXPORT_FORMATS[fmt]
+    names = [name for name, _ in fields]
+    lookups = [lookup for _, lookup in fields]
+    rows = chain.from_iterable(
+        queryset.values_list(*lookups).iterator(chunk_size=EXPORT_CHUNK_SIZE) for queryset in querysets
+    )
+    response = StreamingHttpResponse(lines(names, rows), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
+
+
+def book_export(fmt):
+    return stream_export([Book.objects.order_by('id')], BOOK_EXPORT_FIELDS, fmt, 'books')
+
+
+def borrow_export(fmt):
+    # Open and recent borrows first, then the archive.
+    querysets = [Borrow.objects.order_by('id'), ArchivedBorrow.objects.order_by('id')]
+    return stream_export(querysets, BORROW_EXPORT_FIELDS, fmt, 'borrows')
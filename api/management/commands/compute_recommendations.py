@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.recommendations import update_neighbours
+
+
+class Command(BaseCommand):
+    help = "Recompute the \"readers also borrowed\" neighbours of books whose borrowers changed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="recompute every borrowed book")
+
+    def handle(self, *args, **options):
+        report = update_neighbours(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"recomputed {report['recomputed']} of {report['books']} books "
+            f"from {report['borrowers']} borrowers"
+        ))
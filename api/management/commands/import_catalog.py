@@ -0,0 +1,181 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import Author, Book, Category
+from api.signals import catalog_changed
+
+
+class InvalidRecord(Exception):
+    pass
+
+
+def read_records(path, fmt):
+    """
+    Stream records from a CSV (with a header row) or JSON Lines file.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def clean_record(record):
+    if not isinstance(record, dict):
+        raise InvalidRecord("not a record")
+    values = {}
+    for field in ('title', 'author', 'category'):
+        value = str(record.get(field) or '').strip()
+        if not value:
+            raise InvalidRecord(f"{field} is required")
+        values[field] = value
+    if len(values['title']) > Book._meta.get_field('title').max_length:
+        raise InvalidRecord("title is too long")
+    try:
+        values['total_copies'] = int(record.get('total_copies') or 1)
+    except (TypeError, ValueError):
+        raise InvalidRecord("total_copies must be a number")
+    if values['total_copies'] < 0:
+        raise InvalidRecord("total_copies must be positive")
+    values['author'] = values['author'][:Author._meta.get_field('name').max_length]
+    values['category'] = values['category'][:Category._meta.get_field('name').max_length]
+    values['description'] = str(record.get('description') or '')
+    values['author_bio'] = str(record.get('author_bio') or '')[:128]
+    return values
+
+
+class NameResolver:
+    """
+    Maps names to ids for a model with a ``name`` column. Unknown names are
+    looked up for a whole batch with one query, and whatever is still missing
+    is created with one bulk insert.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.ids = {}
+
+    def resolve(self, names, defaults=None):
+        defaults = defaults or {}
+        missing = set(names) - self.ids.keys()
+        if missing:
+            for name, pk in self.model.objects.filter(name__in=missing).values_list('name', 'id'):
+                self.ids.setdefault(name, pk)
+            new = [
+                self.model(name=name, **defaults.get(name, {}))
+                for name in missing - self.ids.keys()
+            ]
+            for obj in self.model.objects.bulk_create(new):
+                self.ids[obj.name] = obj.id
+        return self.ids
+
+
+class Command(BaseCommand):
+    help = "Bulk import books from a CSV or JSON Lines file (title, description, author, category, total_copies)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--checkpoint', help="checkpoint file (default: <path>.checkpoint)")
+        parser.add_argument('--restart', action='store_true', help="ignore an existing checkpoint")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        checkpoint_path = options['checkpoint'] or f"{path}.checkpoint"
+        batch_size = options['batch_size']
+
+        done = 0 if options['restart'] else self.read_checkpoint(checkpoint_path, path)
+        if done:
+            self.stdout.write(f"resuming after record {done}")
+
+        self.authors = NameResolver(Author)
+        self.categories = NameResolver(Category)
+        imported = skipped = 0
+        started = time.perf_counter()
+
+        batch = []
+        position = 0
+        for position, record in enumerate(read_records(path, fmt), start=1):
+            if position <= done:
+                continue
+            try:
+                batch.append(clean_record(record))
+            except InvalidRecord as e:
+                skipped += 1
+                self.stderr.write(f"record {position}: {e}")
+            if len(batch) == batch_size:
+                imported += self.import_batch(batch)
+                self.write_checkpoint(checkpoint_path, path, position)
+                batch = []
+                self.report(imported, skipped, started)
+        if batch:
+            imported += self.import_batch(batch)
+        if position > done:
+            self.write_checkpoint(checkpoint_path, path, position)
+
+        if imported:
+            for table in ('author', 'category', 'book'):
+                catalog_changed(table)
+        self.report(imported, skipped, started, final=True)
+
+    def import_batch(self, rows):
+        with transaction.atomic():
+            authors = self.authors.resolve(
+                [row['author'] for row in rows],
+                defaults={row['author']: {'bio': row['author_bio']} for row in rows},
+            )
+            categories = self.categories.resolve([row['category'] for row in rows])
+            Book.objects.bulk_create([
+                Book(
+                    title=row['title'],
+                    description=row['description'],
+                    author_id=authors[row['author']],
+                    category_id=categories[row['category']],
+                    total_copies=row['total_copies'],
+                    available_copies=row['total_copies'],
+                )
+                for row in rows
+            ])
+        return len(rows)
+
+    def read_checkpoint(self, checkpoint_path, path):
+        try:
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            raise CommandError(f"{checkpoint_path} is not a valid checkpoint, use --restart to ignore it")
+        if checkpoint.get('path') != os.path.abspath(path):
+            raise CommandError(f"{checkpoint_path} belongs to {checkpoint.get('path')}, use --restart to ignore it")
+        return checkpoint['records']
+
+    def write_checkpoint(self, checkpoint_path, path, records):
+        # Written after the batch commits and swapped in atomically, so a
+        # crash can at worst repeat the last batch, never skip records.
+        tmp = f"{checkpoint_path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'path': os.path.abspath(path), 'records': records}, f)
+        os.replace(tmp, checkpoint_path)
+
+    def report(self, imported, skipped, started, final=False):
+        elapsed = time.perf_counter() - started
+        rate = imported / elapsed if elapsed else 0
+        message = f"imported {imported} books, skipped {skipped} records, {rate:.0f} rows/sec"
+        self.stdout.write(self.style.SUCCESS(message) if final else message)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.circulation import reconcile_active_borrow_counts
+
+
+class Command(BaseCommand):
+    help = "Recompute every user's active borrow count from the open borrows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = reconcile_active_borrow_counts(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"corrected {fixed} users"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.circulation import reconcile_available_copies
+
+
+class Command(BaseCommand):
+    help = "Recompute every book's available copies from its total copies, open borrows and ready holds"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="report the drift without fixing it")
+
+    def handle(self, *args, **options):
+        report = reconcile_available_copies(
+            chunk_size=options['chunk_size'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        verb = "found" if options['dry_run'] else "corrected"
+        self.stdout.write(self.style.SUCCESS(
+            f"checked {report['books']} books, {verb} {report['drifted']} "
+            f"(+{report['copies_added']}/-{report['copies_removed']} copies)"
+        ))
+        if report['overcommitted']:
+            self.stdout.write(self.style.WARNING(
+                f"{report['overcommitted']} books have more copies out than total_copies"
+            ))
@@ -0,0 +1,207 @@
+import random
+import time
+import uuid
+from array import array
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.circulation import BORROW_LIMIT, LOAN_PERIOD
+from api.models import Author, Book, Borrow, Category, UserAccount
+from api.signals import catalog_changed
+
+FIRST_NAMES = [
+    "Ada", "Alan", "Chinua", "Clarice", "Doris", "Elena", "Gabriel", "Haruki",
+    "Isabel", "James", "Jorge", "Kazuo", "Leo", "Mary", "Naguib", "Octavia",
+    "Orhan", "Rabindranath", "Salman", "Toni", "Ursula", "Virginia", "Wole", "Zadie",
+]
+LAST_NAMES = [
+    "Achebe", "Allende", "Atwood", "Borges", "Butler", "Calvino", "Eco", "Ferrante",
+    "Ishiguro", "Joyce", "Lessing", "Mahfouz", "Morrison", "Murakami", "Pamuk",
+    "Rushdie", "Smith", "Soyinka", "Tagore", "Tolstoy", "Woolf", "Lispector",
+]
+CATEGORY_NAMES = [
+    "Fiction", "Fantasy", "Science Fiction", "Mystery", "Thriller", "Romance",
+    "History", "Biography", "Poetry", "Philosophy", "Science", "Travel",
+    "Children", "Young Adult", "Drama", "Essays", "Economics", "Art",
+]
+TITLE_WORDS = [
+    "Night", "River", "Garden", "Empire", "Silence", "Shadow", "House", "Winter",
+    "Memory", "Glass", "Stone", "Ocean", "City", "Fire", "Dream", "Road", "Library",
+    "Mirror", "Island", "Storm", "Light", "Secret", "Forest", "Letter", "Clock",
+]
+
+
+def base36(number):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        number, rest = divmod(number, 36)
+        out = digits[rest] + out
+        if not number:
+            return out
+
+
+def seeded_uuid(prefix, index):
+    # Ids are derived from a per-run random prefix and the row number, so
+    # borrows can refer to users and books without keeping every id in memory.
+    return uuid.UUID(int=(prefix << 64) | index)
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic library (authors, categories, books, users and borrow history)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--categories', type=int, default=len(CATEGORY_NAMES))
+        parser.add_argument('--books', type=int, default=20000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--borrows-per-user', type=int, default=10,
+                            help="average number of borrows in each user's history")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        authors = self.create_authors(options['authors'])
+        categories = self.create_categories(options['categories'])
+        book_prefix, totals = self.create_books(options['books'], authors, categories)
+        active = self.create_users_and_borrows(
+            options['users'], options['borrows_per_user'], book_prefix, totals
+        )
+        self.update_availability(book_prefix, totals, active)
+
+        for table in ('author', 'category', 'book'):
+            catalog_changed(table)
+        self.stdout.write(self.style.SUCCESS(
+            f"seeded library in {time.perf_counter() - started:.1f}s"
+        ))
+
+    def batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def create_authors(self, count):
+        rng = self.rng
+        ids = []
+        for batch in self.batches(
+            Author(
+                name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                bio=f"Author of {rng.randint(1, 40)} books.",
+            )
+            for _ in range(count)
+        ):
+            ids += [author.id for author in Author.objects.bulk_create(batch)]
+        self.stdout.write(f"authors: {count}")
+        return ids
+
+    def create_categories(self, count):
+        names = [
+            CATEGORY_NAMES[i % len(CATEGORY_NAMES)] + ("" if i < len(CATEGORY_NAMES) else f" {i}")
+            for i in range(count)
+        ]
+        categories = Category.objects.bulk_create([Category(name=name) for name in names])
+        self.stdout.write(f"categories: {count}")
+        return [category.id for category in categories]
+
+    def create_books(self, count, authors, categories):
+        rng = self.rng
+        prefix = rng.getrandbits(64)
+        totals = array('B', (rng.randint(1, 10) for _ in range(count)))
+
+        def books():
+            for i in range(count):
+                words = rng.sample(TITLE_WORDS, rng.randint(1, 3))
+                yield Book(
+                    id=seeded_uuid(prefix, i),
+                    title=f"The {' '.join(words)}"[:128],
+                    description=" ".join(rng.choices(TITLE_WORDS, k=rng.randint(10, 40))).lower(),
+                    author_id=rng.choice(authors),
+                    category_id=rng.choice(categories),
+                    total_copies=totals[i],
+                    available_copies=totals[i],
+                )
+
+        created = 0
+        for batch in self.batches(books()):
+            with transaction.atomic():
+                Book.objects.bulk_create(batch)
+            created += len(batch)
+            self.stdout.write(f"books: {created}/{count}")
+        return prefix, totals
+
+    def create_users_and_borrows(self, count, borrows_per_user, book_prefix, totals):
+        """
+        Create users with their borrow history. The newest borrows of a user
+        may still be open, limited by the borrow limit and the copies left.
+        Returns the number of open borrows per book.
+        """
+        rng = self.rng
+        prefix = rng.getrandbits(64)
+        password = make_password("password")
+        active = array('I', bytes(4 * len(totals)))
+        today = date.today()
+        tag = base36(prefix % 36 ** 4).rjust(4, "0")
+        created = borrows = 0
+
+        for start in range(0, count, self.batch_size):
+            users = []
+            history = []
+            for i in range(start, min(start + self.batch_size, count)):
+                user_id = seeded_uuid(prefix, i)
+                size = rng.randint(0, 2 * borrows_per_user) if totals else 0
+                open_slots = rng.randint(0, BORROW_LIMIT)
+                day = today - timedelta(days=rng.randint(size * 7, size * 21 + 30))
+                open_count = 0
+                for n in range(size):
+                    book = rng.randrange(len(totals))
+                    day += timedelta(days=rng.randint(1, 14))
+                    day = min(day, today)
+                    due = day + LOAN_PERIOD
+                    returned = None
+                    if n < size - open_slots or active[book] >= totals[book]:
+                        returned = day + timedelta(days=rng.randint(1, 20))
+                        if returned > today:
+                            returned = today
+                    else:
+                        active[book] += 1
+                        open_count += 1
+                    history.append(Borrow(
+                        user_id=user_id, book_id=seeded_uuid(book_prefix, book),
+                        borrow_date=day, due_date=due, return_date=returned,
+                    ))
+                users.append(UserAccount(
+                    id=user_id,
+                    email=f"reader.{tag}.{i}@example.com",
+                    username=f"r{tag}{base36(i)}",
+                    password=password,
+                    active_borrow_count=open_count,
+                ))
+
+            with transaction.atomic():
+                UserAccount.objects.bulk_create(users)
+                Borrow.objects.bulk_create(history, batch_size=self.batch_size)
+            created += len(users)
+            borrows += len(history)
+            self.stdout.write(f"users: {created}/{count}, borrows: {borrows}")
+        return active
+
+    def update_availability(self, book_prefix, totals, active):
+        def books():
+            for i, count in enumerate(active):
+                if count:
+                    yield Book(id=seeded_uuid(book_prefix, i), available_copies=totals[i] - count)
+
+        for batch in self.batches(books()):
+            Book.objects.bulk_update(batch, ['available_copies'])
@@ -0,0 +1,264 @@
+"""
+Per-request performance metrics.
+
+``MetricsMiddleware`` records, for every view and HTTP method, the wall time,
+number and duration of database queries, time spent building serializer
+data and the response size. Observations go into in-process histograms
+that ``MetricsAPIView`` exposes in the Prometheus text format; every worker
+process reports its own numbers, so scrape each one.
+
+Nothing is installed unless ``METRICS['ENABLED']`` is set: the middleware
+removes itself from the chain and DRF serializers are left untouched.
+"""
+import contextvars
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connections
+
+logger = logging.getLogger('api.slow_requests')
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+METRICS = {
+    'request_duration_seconds': ("Wall time of the request", TIME_BUCKETS),
+    'db_queries': ("Database queries per request", QUERY_BUCKETS),
+    'db_duration_seconds': ("Time spent in database queries per request", TIME_BUCKETS),
+    'serializer_duration_seconds': ("Time spent building serializer data per request", TIME_BUCKETS),
+    'response_size_bytes': ("Size of the response body", SIZE_BUCKETS),
+}
+
+current_request = contextvars.ContextVar('current_request_metrics', default=None)
+
+
+def metrics_settings():
+    config = {
+        'ENABLED': False,
+        'SLOW_REQUEST_SECONDS': 1.0,
+        'SLOW_REQUEST_SAMPLE_RATE': 0.0,
+    }
+    config.update(getattr(settings, 'METRICS', {}))
+    return config
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Histograms keyed by metric name and ``(view, method)`` labels.
+    """
+
+    prefix = 'library_'
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, values):
+        with self._lock:
+            for name, value in values.items():
+                histogram = self.histograms.get((name, labels))
+                if histogram is None:
+                    histogram = self.histograms[(name, labels)] = Histogram(METRICS[name][1])
+                histogram.observe(value)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self.histograms.items())
+            lines = []
+            for name, (description, _) in METRICS.items():
+                metric = self.prefix + name
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} histogram")
+                for (histogram_name, (view, method)), histogram in items:
+                    if histogram_name != name:
+                        continue
+                    labels = f'view="{view}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self.histograms.clear()
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """
+    Collects the numbers of one request. Called by the ``record_query``
+    execute wrapper, it counts and times every query; with ``capture_sql`` it also
+    keeps the statements for the slow-request log.
+    """
+
+    def __init__(self, capture_sql=False):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.sql = [] if capture_sql else None
+        self.view = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db_time += elapsed
+            if self.sql is not None:
+                self.sql.append((round(elapsed * 1000, 3), sql))
+
+    def finish(self, request, response):
+        duration = time.perf_counter() - self.started
+        method = request.method
+        view = self.view or 'unresolved'
+        if response.streaming:
+            size = int(response.get('Content-Length', 0))
+        else:
+            size = len(response.content)
+        registry.observe((view, method), {
+            'request_duration_seconds': duration,
+            'db_queries': self.queries,
+            'db_duration_seconds': self.db_time,
+            'serializer_duration_seconds': self.serializer_time,
+            'response_size_bytes': size,
+        })
+        if self.sql is not None and duration >= metrics_settings()['SLOW_REQUEST_SECONDS']:
+            logger.warning(
+                "slow request %s %s (%s) took %.1f ms with %d queries (%.1f ms)\n%s",
+                method, request.get_full_path(), view, duration * 1000,
+                self.queries, self.db_time * 1000,
+                "\n".join(f"  [{ms} ms] {sql}" for ms, sql in self.sql),
+            )
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def instrument_connections(**kwargs):
+    """
+    Add ``record_query`` to this thread's connections for good. Connected to
+    ``request_started``, which Django sends from the thread that runs the
+    request's queries: the request thread under WSGI, and the
+    ``sync_to_async`` thread the async ORM uses under ASGI. The wrapper finds
+    the request through ``current_request``, which ``sync_to_async`` carries
+    over to that thread.
+    """
+    for connection in connections.all():
+        if record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(record_query)
+
+
+def view_name(func):
+    view_class = getattr(func, 'view_class', None) or getattr(func, 'cls', None)
+    return (view_class or func).__name__
+
+
+_serializers_instrumented = False
+
+
+def instrument_serializers():
+    """
+    Time ``serializer.data`` for DRF serializers. The time includes queries
+    run while serializing, which also show up in the database numbers.
+    """
+    global _serializers_instrumented
+    if _serializers_instrumented:
+        return
+    from rest_framework.serializers import BaseSerializer
+
+    data = BaseSerializer.data
+
+    def timed_data(serializer):
+        metrics = current_request.get()
+        if metrics is None:
+            return data.fget(serializer)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            metrics.serializer_depth -= 1
+            if not metrics.serializer_depth:
+                metrics.serializer_time += time.perf_counter() - started
+
+    BaseSerializer.data = property(timed_data)
+    _serializers_instrumented = True
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = metrics_settings()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.sample_rate = config['SLOW_REQUEST_SAMPLE_RATE']
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        instrument_serializers()
+        request_started.connect(instrument_connections, dispatch_uid='api.metrics.instrument_connections')
+
+    def start(self):
+        metrics = RequestMetrics(capture_sql=self.sample_rate > 0 and random.random() < self.sample_rate)
+        return metrics, current_request.set(metrics)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = self.start()
+        request.metrics = metrics
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        metrics.finish(request, response)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token = self.start()
+        request.metrics = metrics
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        metrics.finish(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics.view = view_name(view_func)
@@ -0,0 +1,128 @@
+from django.db import migrations
+
+
+# The FTS5 table keeps its own copy of the searchable text. Its rowid comes from
+# api_book_search_key rather than api_book's implicit rowid, because VACUUM is
+# free to renumber implicit rowids.
+FORWARD_SQL = [
+    """
+    CREATE TABLE api_book_search_key (
+        rowid INTEGER PRIMARY KEY,
+        book_id char(32) NOT NULL UNIQUE
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE api_book_search USING fts5(
+        title, description, author, category,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    INSERT INTO api_book_search(api_book_search, rank)
+    VALUES ('rank', 'bm25(10.0, 1.0, 5.0, 2.0)')
+    """,
+    """
+    CREATE TRIGGER api_book_search_ai AFTER INSERT ON api_book BEGIN
+        INSERT INTO api_book_search_key(book_id) VALUES (new.id);
+        INSERT INTO api_book_search(rowid, title, description, author, category)
+        SELECT k.rowid, new.title, new.description, a.name, c.name
+        FROM api_book_search_key k, api_author a, api_category c
+        WHERE k.book_id = new.id AND a.id = new.author_id AND c.id = new.category_id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_book_search_ad AFTER DELETE ON api_book BEGIN
+        DELETE FROM api_book_search
+        WHERE rowid = (SELECT rowid FROM api_book_search_key WHERE book_id = old.id);
+        DELETE FROM api_book_search_key WHERE book_id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_book_search_au AFTER UPDATE ON api_book
+    WHEN old.title IS NOT new.title
+        OR old.description IS NOT new.description
+        OR old.author_id IS NOT new.author_id
+        OR old.category_id IS NOT new.category_id
+    BEGIN
+        UPDATE api_book_search SET
+            title = new.title,
+            description = new.description,
+            author = (SELECT name FROM api_author WHERE id = new.author_id),
+            category = (SELECT name FROM api_category WHERE id = new.category_id)
+        WHERE rowid = (SELECT rowid FROM api_book_search_key WHERE book_id = new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER api_author_search_au AFTER UPDATE OF name ON api_author
+    WHEN old.name IS NOT new.name
+    BEGIN
+        UPDATE api_book_search SET author = new.name
+        WHERE rowid IN (
+            SELECT k.rowid FROM api_book_search_key k
+            JOIN api_book b ON b.id = k.book_id
+            WHERE b.author_id = new.id
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER api_category_search_au AFTER UPDATE OF name ON api_category
+    WHEN old.name IS NOT new.name
+    BEGIN
+        UPDATE api_book_search SET category = new.name
+        WHERE rowid IN (
+            SELECT k.rowid FROM api_book_search_key k
+            JOIN api_book b ON b.id = k.book_id
+            WHERE b.category_id = new.id
+        );
+    END
+    """,
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS api_category_search_au",
+    "DROP TRIGGER IF EXISTS api_author_search_au",
+    "DROP TRIGGER IF EXISTS api_book_search_au",
+    "DROP TRIGGER IF EXISTS api_book_search_ad",
+    "DROP TRIGGER IF EXISTS api_book_search_ai",
+    "DROP TABLE IF EXISTS api_book_search",
+    "DROP TABLE IF EXISTS api_book_search_key",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in FORWARD_SQL:
+        schema_editor.execute(statement)
+    schema_editor.execute(
+        "INSERT INTO api_book_search_key(book_id) SELECT id FROM api_book"
+    )
+    schema_editor.execute(
+        """
+        INSERT INTO api_book_search(rowid, title, description, author, category)
+        SELECT k.rowid, b.title, b.description, a.name, c.name
+        FROM api_book_search_key k
+        JOIN api_book b ON b.id = k.book_id
+        JOIN api_author a ON a.id = b.author_id
+        JOIN api_category c ON c.id = b.category_id
+        """
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in REVERSE_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_book_title_id_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['user', 'borrow_date'], name='borrow_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['user', 'due_date'], name='borrow_active_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['due_date'], name='borrow_active_due_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:47
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_active_borrows(apps, schema_editor):
+    UserAccount = apps.get_model('api', 'UserAccount')
+    Borrow = apps.get_model('api', 'Borrow')
+    counts = (
+        Borrow.objects.filter(return_date__isnull=True)
+        .values_list('user_id').annotate(n=Count('id')).order_by()
+    )
+    users = [UserAccount(pk=user_id, active_borrow_count=n) for user_id, n in counts]
+    UserAccount.objects.bulk_update(users, ['active_borrow_count'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_borrow_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useraccount',
+            name='active_borrow_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(count_active_borrows, migrations.RunPython.noop),
+    ]
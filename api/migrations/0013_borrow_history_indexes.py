@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_useraccount_active_borrow_count'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='borrow',
+            name='borrow_user_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='borrow',
+            name='borrow_active_user_idx',
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['user', 'borrow_date', 'id'], name='borrow_user_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(fields=['borrow_date', 'id'], name='borrow_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['borrow_date', 'id'], name='borrow_active_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrow',
+            index=models.Index(condition=models.Q(('return_date__isnull', True)), fields=['user', 'borrow_date', 'id'], name='borrow_active_user_idx'),
+        ),
+    ]
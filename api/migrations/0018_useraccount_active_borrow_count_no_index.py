@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_book_neighbours'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='useraccount',
+            name='active_borrow_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -28,6 +28,8 @@ class UserAccount(AbstractBaseUser, PermissionsMixin):
     username = models.CharField(max_length=12, unique=True)
 
     penalty_point = models.PositiveIntegerField(default=0)
+    # Number of unreturned borrows, maintained by the borrow and return paths.
+    active_borrow_count = models.PositiveIntegerField(default=0)
 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
@@ -66,6 +68,11 @@ class Book(models.Model):
     total_copies = models.PositiveIntegerField()
     available_copies = models.PositiveIntegerField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if self.available_copies is None:
             self.available_copies = self.total_copies
@@ -82,5 +89,126 @@ class Borrow(models.Model):
     due_date = models.DateField()
     return_date = models.DateField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Borrow history of a user and across all users, newest first
+            # (keyset pagination on borrow_date, id).
+            models.Index(fields=['user', 'borrow_date', 'id'], name='borrow_user_history_idx'),
+            models.Index(fields=['borrow_date', 'id'], name='borrow_history_idx'),
+            models.Index(
+                fields=['borrow_date', 'id'], name='borrow_active_history_idx',
+                condition=models.Q(return_date__isnull=True),
+            ),
+            # Open loans only: the per-user active borrow check and active
+            # history ...
+            models.Index(
+                fields=['user', 'borrow_date', 'id'], name='borrow_active_user_idx',
+                condition=models.Q(return_date__isnull=True),
+            ),
+            # ... the due-date scan ...
+            models.Index(
+                fields=['due_date'], name='borrow_active_due_idx',
+                condition=models.Q(return_date__isnull=True),
+            ),
+            # ... and copies out per book, for inventory reconciliation.
+            models.Index(
+                fields=['book'], name='borrow_active_book_idx',
+                condition=models.Q(return_date__isnull=True),
+            ),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.book.title}"
+
+
+
+class ArchivedBorrow(models.Model):
+    """
+    Cold storage for borrows returned long ago, moved here by the
+    ``archive_borrows`` task so that ``Borrow`` only grows with the open
+    loans. Same columns as ``Borrow``; history views read both.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, related_name='archived_borrows')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='archived_borrows')
+    borrow_date = models.DateField()
+    due_date = models.DateField()
+    return_date = models.DateField()
+
+    class Meta:
+        indexes = [
+            # Same history orderings as Borrow.
+            models.Index(fields=['user', 'borrow_date', 'id'], name='archive_user_history_idx'),
+            models.Index(fields=['borrow_date', 'id'], name='archive_history_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.book.title} (archived)"
+
+class Hold(models.Model):
+    class Status(models.TextChoices):
+        WAITING = 'waiting'
+        READY = 'ready'
+        FULFILLED = 'fulfilled'
+        EXPIRED = 'expired'
+        CANCELLED = 'cancelled'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False, unique=True)
+    user = models.ForeignKey(UserAccount, on_delete=models.CASCADE, related_name='holds')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holds')
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.WAITING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when a returned copy is put aside for the holder.
+    ready_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'book'], name='hold_open_user_book_uniq',
+                condition=models.Q(status__in=['waiting', 'ready']),
+            ),
+        ]
+        indexes = [
+            # The queue of a book, first come first served: next holder on
+            # return and a holder's position.
+            models.Index(
+                fields=['book', 'created_at', 'id'], name='hold_queue_idx',
+                condition=models.Q(status='waiting'),
+            ),
+            # Copies put aside whose pickup window ran out.
+            models.Index(
+                fields=['expires_at'], name='hold_ready_expiry_idx',
+                condition=models.Q(status='ready'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.book.title} ({self.status})"
+
+
+class BookNeighbour(models.Model):
+    """
+    Precomputed "readers also borrowed" list: the ``rank``-th most similar
+    book to ``book`` by borrowers in common, built by
+    ``api.recommendations``.
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='neighbours')
+    neighbour = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also the index behind the per-book lookup, in rank order.
+            models.UniqueConstraint(fields=['book', 'rank'], name='neighbour_book_rank_uniq'),
+        ]
+
+
+class BookBorrowerCount(models.Model):
+    """
+    Distinct borrowers per book when its neighbours were last computed, so
+    the next run only recomputes the books whose count has changed.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    borrowers = models.PositiveIntegerField()
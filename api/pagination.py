@@ -0,0 +1,94 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPaginator:
+    """
+    Cursor (keyset) pagination over a fixed ordering.
+
+    The ordering must end in a unique column so that every row has a distinct
+    position. The cursor handed to clients is an opaque token holding the
+    ordering values of the last row on the page; the next page is fetched with
+    a range filter on those values instead of an OFFSET, so every page costs
+    the same regardless of how deep the client is.
+    """
+
+    default_page_size = 50
+    max_page_size = 200
+
+    def __init__(self, ordering, page_size=None):
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.page_size = self.clamp_page_size(page_size)
+
+    def clamp_page_size(self, page_size):
+        try:
+            page_size = int(page_size)
+        except (TypeError, ValueError):
+            return self.default_page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, values):
+        raw = json.dumps([str(value) for value in values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor, model=None):
+        """
+        Return the ordering values held by ``cursor``. With ``model`` each one
+        is also converted to the type of its field, so a tampered cursor
+        raises ``InvalidCursor`` here instead of failing in the query.
+        """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (ValueError, TypeError):
+            raise InvalidCursor()
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor()
+        # encode_cursor() only writes strings.
+        if not all(isinstance(value, str) for value in values):
+            raise InvalidCursor()
+        if model is None:
+            return values
+        try:
+            return [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except ValidationError:
+            raise InvalidCursor()
+
+    def after(self, values):
+        # (a, b, c) > (x, y, z)  ==  a > x OR (a = x AND (b > y OR (b = y AND c > z)))
+        condition = None
+        for order, field, value in reversed(list(zip(self.ordering, self.fields, values))):
+            lookup = 'lt' if order.startswith('-') else 'gt'
+            step = Q(**{f"{field}__{lookup}": value})
+            if condition is not None:
+                step |= Q(**{field: value}) & condition
+            condition = step
+        return condition
+
+    def position(self, row):
+        if isinstance(row, dict):
+            return [row[field] for field in self.fields]
+        return [getattr(row, field) for field in self.fields]
+
+    def page_queryset(self, queryset, cursor=None):
+        queryset = queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor, queryset.model)))
+        return queryset[:self.page_size + 1]
+
+    def page(self, rows):
+        if len(rows) <= self.page_size:
+            return rows, None
+        rows = rows[:self.page_size]
+        return rows, self.encode_cursor(self.position(rows[-1]))
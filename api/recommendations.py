@@ -0,0 +1,123 @@
+"""
+"Readers also borrowed" recommendations, computed offline.
+
+Every borrow, open, returned or archived, marks a 1 in a sparse users x books
+matrix. Two books are similar when the same people borrowed them. The
+similarity is the cosine of their borrower columns: borrowers in common over
+the geometric mean of their borrower counts. The ``NEIGHBOURS`` most similar
+books of each book are stored in ``BookNeighbour``, so the endpoint is a
+single indexed lookup.
+
+Only books whose distinct borrower count changed since the last run are
+recomputed. Their neighbours are the ones most likely to have moved; pass
+``full=True`` to rebuild everything.
+
+Needs NumPy and SciPy, which only the worker running the task has to have
+installed (``pip install numpy scipy``).
+"""
+from array import array
+
+import numpy as np
+from django.db import transaction
+from scipy import sparse
+
+from .models import ArchivedBorrow, BookBorrowerCount, BookNeighbour, Borrow
+from .serializers import uuid_text
+
+NEIGHBOURS = 10
+# Books whose similarity rows are computed and written together.
+CHUNK_SIZE = 1000
+READ_CHUNK_SIZE = 10000
+
+
+def borrow_pairs():
+    """
+    Stream ``(user_id, book_id)`` for every borrow, current and archived,
+    with the ids read as text.
+    """
+    for model in (Borrow, ArchivedBorrow):
+        yield from (
+            model.objects.values_list(uuid_text('user_id'), uuid_text('book_id'))
+            .iterator(chunk_size=READ_CHUNK_SIZE)
+        )
+
+
+def borrower_matrix(pairs):
+    """
+    Return ``(matrix, book_ids)``: a CSC users x books matrix holding 1 where
+    the user borrowed the book at least once, and the id of each column.
+    """
+    users, books = {}, {}
+    rows, cols = array('q'), array('q')
+    for user_id, book_id in pairs:
+        rows.append(users.setdefault(user_id, len(users)))
+        cols.append(books.setdefault(book_id, len(books)))
+    rows, cols = np.frombuffer(rows, dtype=np.int64), np.frombuffer(cols, dtype=np.int64)
+    matrix = sparse.csc_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(len(users), len(books)),
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix, list(books)
+
+
+def top_neighbours(normalized, columns, k):
+    """
+    Yield ``(column, [(neighbour_column, score), ...])`` with the ``k`` best
+    cosine scores for each of ``columns`` of the column-normalized matrix,
+    best first.
+    """
+    similarities = (normalized[:, columns].T @ normalized).tocsr()
+    for row, column in enumerate(columns):
+        start, end = similarities.indptr[row], similarities.indptr[row + 1]
+        others = similarities.indices[start:end]
+        scores = similarities.data[start:end]
+        keep = others != column
+        others, scores = others[keep], scores[keep]
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            others, scores = others[best], scores[best]
+        order = np.lexsort((others, -scores))
+        yield column, [(int(others[i]), float(scores[i])) for i in order]
+
+
+def update_neighbours(full=False, k=NEIGHBOURS, chunk_size=CHUNK_SIZE):
+    """
+    Recompute the stored neighbours of every book whose borrower count
+    changed (every borrowed book with ``full``). Each chunk of books is
+    replaced in its own transaction. Returns a report with the number of
+    borrowers and books seen and the books recomputed.
+    """
+    matrix, book_ids = borrower_matrix(borrow_pairs())
+    borrowers = np.diff(matrix.indptr)
+    previous = dict(BookBorrowerCount.objects.values_list(uuid_text('book_id'), 'borrowers'))
+    changed = [
+        column for column, book_id in enumerate(book_ids)
+        if full or previous.get(book_id) != borrowers[column]
+    ]
+
+    scale = sparse.diags(1 / np.sqrt(np.maximum(borrowers, 1)).astype(np.float32))
+    normalized = (matrix @ scale).tocsc()
+    for start in range(0, len(changed), chunk_size):
+        columns = changed[start:start + chunk_size]
+        neighbours = [
+            BookNeighbour(
+                book_id=book_ids[column], neighbour_id=book_ids[other], rank=rank, score=round(score, 6),
+            )
+            for column, best in top_neighbours(normalized, columns, k)
+            for rank, (other, score) in enumerate(best, 1)
+        ]
+        ids = [book_ids[column] for column in columns]
+        counts = [
+            BookBorrowerCount(book_id=book_ids[column], borrowers=int(borrowers[column]))
+            for column in columns
+        ]
+        with transaction.atomic():
+            BookNeighbour.objects.filter(book_id__in=ids).delete()
+            BookNeighbour.objects.bulk_create(neighbours, batch_size=5000)
+            BookBorrowerCount.objects.bulk_create(
+                counts, batch_size=5000,
+                update_conflicts=True, unique_fields=['book'], update_fields=['borrowers'],
+            )
+
+    return {'borrowers': matrix.shape[0], 'books': len(book_ids), 'recomputed': len(changed)}
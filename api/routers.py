@@ -0,0 +1,238 @@
+"""
+Read-replica routing.
+
+Reads go to a replica only while handling a GET or HEAD request for a view
+that opts in with ``replica_reads = True`` (the catalog views). Everything
+else uses the primary: writes, reads inside a transaction, reads later in a
+request that wrote, background tasks and management commands.
+
+A client that wrote recently is pinned to the primary for
+``REPLICA_ROUTING['STICKY_SECONDS']``, so it reads its own writes despite
+replication lag. Clients are recognised by their ``Authorization`` header
+(the pin lives in the default cache, shared by all workers) or, without
+one, by a cookie.
+"""
+import contextvars
+import hashlib
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+PIN_COOKIE = 'db_primary'
+# Connecting alone proves little: SQLite creates an empty file for a missing
+# replica. A replica is healthy once it can read the schema's tables.
+HEALTH_CHECK_SQL = "SELECT 1 FROM api_book LIMIT 1"
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def routing_settings():
+    config = {
+        'STICKY_SECONDS': 10,
+        'HEALTH_CHECK_SECONDS': 5,
+        'RETRY_SECONDS': 30,
+    }
+    config.update(getattr(settings, 'REPLICA_ROUTING', {}))
+    return config
+
+
+def replicas_configured():
+    return bool(getattr(settings, 'DATABASE_REPLICAS', None))
+
+
+class ReplicaPool:
+    """
+    Weighted random choice among the replicas in ``DATABASE_REPLICAS``
+    (alias -> weight). A replica that fails ``HEALTH_CHECK_SQL`` is skipped
+    for ``RETRY_SECONDS``; one that passed is not checked again for
+    ``HEALTH_CHECK_SECONDS``.
+    """
+
+    def __init__(self):
+        self.checked = {}
+        self.down_until = {}
+        self._lock = threading.Lock()
+
+    def replicas(self):
+        return {
+            alias: weight
+            for alias, weight in getattr(settings, 'DATABASE_REPLICAS', {}).items()
+            if weight > 0
+        }
+
+    def healthy(self, alias, now):
+        config = routing_settings()
+        with self._lock:
+            if self.down_until.get(alias, 0) > now:
+                return False
+            if now - self.checked.get(alias, float('-inf')) < config['HEALTH_CHECK_SECONDS']:
+                return True
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(HEALTH_CHECK_SQL)
+        except DatabaseError:
+            with self._lock:
+                self.down_until[alias] = now + config['RETRY_SECONDS']
+            return False
+        with self._lock:
+            self.checked[alias] = now
+        return True
+
+    def choose(self):
+        now = time.monotonic()
+        candidates = {alias: weight for alias, weight in self.replicas().items() if self.healthy(alias, now)}
+        if not candidates:
+            return DEFAULT_DB_ALIAS
+        return random.choices(list(candidates), weights=list(candidates.values()))[0]
+
+    def reset(self):
+        with self._lock:
+            self.checked.clear()
+            self.down_until.clear()
+
+
+replica_pool = ReplicaPool()
+
+
+class RequestRouting:
+    def __init__(self):
+        self.replica_ok = False
+        self.wrote = False
+        self.alias = None
+
+    def read_alias(self):
+        # One replica per request, so its reads see a single snapshot.
+        if self.alias is None:
+            self.alias = replica_pool.choose()
+        return self.alias
+
+
+current_routing = contextvars.ContextVar('current_db_routing', default=None)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send the current request's reads to the primary inside the block, for
+    results that outlive the request and must not be older than the data's
+    change markers (cached payloads, responses validated by an ETag).
+    """
+    state = current_routing.get()
+    if state is None or not state.replica_ok:
+        yield
+        return
+    state.replica_ok = False
+    try:
+        yield
+    finally:
+        state.replica_ok = True
+
+
+def primary_reads_after(changed_at):
+    """
+    ``primary_reads()`` while ``changed_at`` (a Unix time, or ``None`` when
+    unknown) is less than ``STICKY_SECONDS`` ago, the lag a replica is
+    allowed; otherwise the reads keep their usual route.
+    """
+    if changed_at is not None and time.time() - changed_at <= routing_settings()['STICKY_SECONDS']:
+        return primary_reads()
+    return nullcontext()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = current_routing.get()
+        if state is None or not state.replica_ok or state.wrote:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = current_routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        return db not in getattr(settings, 'DATABASE_REPLICAS', {})
+
+
+def client_pin_key(request):
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return None
+    return 'db:primary:' + hashlib.sha256(authorization.encode()).hexdigest()
+
+
+def is_pinned(request):
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    key = client_pin_key(request)
+    return key is not None and cache.get(key) is not None
+
+
+def pin_to_primary(request, response):
+    seconds = routing_settings()['STICKY_SECONDS']
+    key = client_pin_key(request)
+    if key is not None:
+        cache.set(key, 1, seconds)
+    response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+
+
+def replica_reads(view_func):
+    view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+    return getattr(view_class or view_func, 'replica_reads', False)
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RequestRouting()
+        token = current_routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if state.wrote and replicas_configured():
+            pin_to_primary(request, response)
+        return response
+
+    async def __acall__(self, request):
+        state = RequestRouting()
+        token = current_routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if state.wrote and replicas_configured():
+            pin_to_primary(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = current_routing.get()
+        state.replica_ok = (
+            request.method in SAFE_METHODS
+            and replica_reads(view_func)
+            and replicas_configured()
+            and not is_pinned(request)
+        )
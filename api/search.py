@@ -0,0 +1,98 @@
+import re
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Book
+
+TOKEN_RE = re.compile(r"\w+\*?", re.UNICODE)
+
+MAX_TERMS = 8
+
+
+def build_match_expression(query):
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+
+    Every word is quoted so FTS5 operators typed by users are treated as plain
+    text; a trailing ``*`` on a word is kept as a prefix query. Terms are
+    implicitly ANDed. Returns ``None`` when there is nothing to search for.
+    """
+    terms = []
+    for token in TOKEN_RE.findall(query or "")[:MAX_TERMS]:
+        prefix = token.endswith("*")
+        word = token.rstrip("*")
+        if not word:
+            continue
+        terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return " ".join(terms) or None
+
+
+def search_book_ids(query, limit=20):
+    """
+    Return the ids of the best matching books, best match first.
+    """
+    expression = build_match_expression(query)
+    if expression is None:
+        return []
+
+    if connection.vendor != 'sqlite':
+        words = [term.strip('"*') for term in expression.split()]
+        condition = Q()
+        for word in words:
+            condition &= (
+                Q(title__icontains=word)
+                | Q(description__icontains=word)
+                | Q(author__name__icontains=word)
+                | Q(category__name__icontains=word)
+            )
+        return list(Book.objects.filter(condition).values_list('id', flat=True)[:limit])
+
+    # ORDER BY rank + LIMIT lets FTS5 keep only the top rows while scoring.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT k.book_id
+            FROM api_book_search s
+            JOIN api_book_search_key k ON k.rowid = s.rowid
+            WHERE api_book_search MATCH %s
+            ORDER BY s.rank
+            LIMIT %s
+            """,
+            [expression, limit],
+        )
+        return [uuid.UUID(row[0]) for row in cursor.fetchall()]
+
+
+def search_books(query, limit=20):
+    ids = search_book_ids(query, limit)
+    books = Book.objects.select_related('author', 'category').in_bulk(ids)
+    return [books[book_id] for book_id in ids if book_id in books]
+
+
+def rebuild_search_index():
+    """
+    Repopulate the search index from the book, author and category tables.
+    Returns the number of indexed books.
+    """
+    if connection.vendor != 'sqlite':
+        return 0
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DELETE FROM api_book_search")
+        cursor.execute("DELETE FROM api_book_search_key")
+        cursor.execute("INSERT INTO api_book_search_key(book_id) SELECT id FROM api_book")
+        cursor.execute(
+            """
+            INSERT INTO api_book_search(rowid, title, description, author, category)
+            SELECT k.rowid, b.title, b.description, a.name, c.name
+            FROM api_book_search_key k
+            JOIN api_book b ON b.id = k.book_id
+            JOIN api_author a ON a.id = b.author_id
+            JOIN api_category c ON c.id = b.category_id
+            """
+        )
+        cursor.execute("INSERT INTO api_book_search(api_book_search) VALUES ('optimize')")
+        cursor.execute("SELECT COUNT(*) FROM api_book_search_key")
+        return cursor.fetchone()[0]
@@ -1,5 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db.models import CharField
+from django.db.models.functions import Cast
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import Book, Author, Category, Borrow
 
 User = get_user_model()
@@ -24,6 +27,16 @@ class UserLoginSerializer(serializers.Serializer):
     password = serializers.CharField(required=True, write_only=True)
 
 
+class LibraryTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        # Copied into the access token too; see api.authentication.
+        token = super().get_token(user)
+        token['is_staff'] = user.is_staff
+        token['is_active'] = user.is_active
+        return token
+
+
 class BookInfoSerializer(serializers.ModelSerializer):
     author = serializers.SerializerMethodField()
     category = serializers.SerializerMethodField()
@@ -39,6 +52,79 @@ class BookInfoSerializer(serializers.ModelSerializer):
     def get_category(self, book):
         return book.category.name
 
+def uuid_text(lookup):
+    # Reading the column as text skips building a uuid.UUID per row, which
+    # costs more than the rest of the row put together.
+    return Cast(lookup, output_field=CharField())
+
+
+def hyphenated_uuid(value):
+    # SQLite and MySQL store the 32 hex digits, PostgreSQL returns the
+    # hyphenated form already.
+    if len(value) == 32:
+        return f"{value[:8]}-{value[8:12]}-{value[12:16]}-{value[16:20]}-{value[20:]}"
+    return value
+
+
+def iso_date(value):
+    return value.isoformat() if value is not None else None
+
+
+def row_mapper(fields):
+    """
+    Return a function turning a ``values_list`` row into a dict, for
+    ``ValuesSerializer.fields``.
+    """
+    columns = [(name, i, convert) for i, (name, _, convert) in enumerate(fields)]
+
+    def map_row(row):
+        return {
+            name: row[i] if convert is None else convert(row[i])
+            for name, i, convert in columns
+        }
+    return map_row
+
+
+class ValuesSerializer:
+    """
+    Read-only list serializer that skips model instances and DRF fields.
+
+    ``fields`` lists ``(name, lookup, convert)``: rows are fetched with
+    ``values_list`` on the lookups (field paths or expressions, joined columns
+    included) and turned into dicts by a row mapper built once per class.
+    ``convert`` (or ``None``) must match what the equivalent DRF field's
+    ``to_representation`` does, so the output is the same as the
+    ModelSerializer's.
+    """
+
+    fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.lookups = [lookup for _, lookup, _ in cls.fields]
+        cls.map_row = staticmethod(row_mapper(cls.fields))
+
+    @classmethod
+    def serialize(cls, queryset):
+        map_row = cls.map_row
+        return [map_row(row) for row in queryset.values_list(*cls.lookups)]
+
+    @classmethod
+    async def aserialize(cls, queryset):
+        map_row = cls.map_row
+        return [map_row(row) async for row in queryset.values_list(*cls.lookups)]
+
+
+class BookInfoValuesSerializer(ValuesSerializer):
+    fields = (
+        ('id', uuid_text('id'), hyphenated_uuid),
+        ('title', 'title', None),
+        ('description', 'description', None),
+        ('author', 'author__name', None),
+        ('category', 'category__name', None),
+    )
+
+
 class BookCreateSerializer(serializers.ModelSerializer):
     author = serializers.UUIDField()
     category = serializers.UUIDField()
@@ -71,6 +157,13 @@ class AuthorSerializer(serializers.ModelSerializer):
         author.save()
         return author
 
+class AuthorValuesSerializer(ValuesSerializer):
+    fields = (
+        ('id', uuid_text('id'), hyphenated_uuid),
+        ('name', 'name', None),
+        ('bio', 'bio', None),
+    )
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -81,6 +174,12 @@ class CategorySerializer(serializers.ModelSerializer):
         category = Category.objects.create(name=data['name'])
         category.save()
         return category
+
+class CategoryValuesSerializer(ValuesSerializer):
+    fields = (
+        ('id', uuid_text('id'), hyphenated_uuid),
+        ('name', 'name', None),
+    )
     
 class BorrowListSerializser(serializers.ModelSerializer):
     book = serializers.CharField(source='book.title')
@@ -89,6 +188,40 @@ class BorrowListSerializser(serializers.ModelSerializer):
         fields = ['id', 'book', 'borrow_date', 'due_date']
         read_only_fields = ['id']
 
+class BorrowListValuesSerializer(ValuesSerializer):
+    fields = (
+        ('id', uuid_text('id'), hyphenated_uuid),
+        ('book', 'book__title', None),
+        ('borrow_date', 'borrow_date', iso_date),
+        ('due_date', 'due_date', iso_date),
+    )
+
+class BorrowHistoryValuesSerializer(ValuesSerializer):
+    fields = BorrowListValuesSerializer.fields + (
+        ('return_date', 'return_date', iso_date),
+        ('user', uuid_text('user_id'), hyphenated_uuid),
+        ('username', 'user__username', None),
+    )
+
+class HoldValuesSerializer(ValuesSerializer):
+    fields = (
+        ('id', uuid_text('id'), hyphenated_uuid),
+        ('book_id', uuid_text('book_id'), hyphenated_uuid),
+        ('book', 'book__title', None),
+        ('status', 'status', None),
+        ('position', 'position', None),
+        ('created_at', 'created_at', iso_date),
+        ('expires_at', 'expires_at', iso_date),
+    )
+
+class BookNeighbourValuesSerializer(ValuesSerializer):
+    fields = (
+        ('id', uuid_text('neighbour_id'), hyphenated_uuid),
+        ('title', 'neighbour__title', None),
+        ('author', 'neighbour__author__name', None),
+        ('score', 'score', None),
+    )
+
 class PenaltyPointSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -0,0 +1,47 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .authentication import invalidate_cached_user
+from .cache import catalog_cache, change_markers
+from .models import Book, Author, Category, UserAccount
+
+# Saves limited to these fields only move inventory and leave cached catalog
+# payloads valid.
+INVENTORY_FIELDS = frozenset({'available_copies', 'total_copies'})
+
+
+def catalog_changed(table):
+    def bump():
+        catalog_cache.invalidate()
+        change_markers.touch(table)
+
+    # Bump right away so this process stops serving the old data, and again
+    # after commit so nothing a concurrent reader cached from the not yet
+    # committed state survives.
+    bump()
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Category)
+def invalidate_catalog_on_save(sender, update_fields=None, **kwargs):
+    if update_fields and INVENTORY_FIELDS.issuperset(update_fields):
+        return
+    catalog_changed(sender._meta.model_name)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_on_delete(sender, **kwargs):
+    catalog_changed(sender._meta.model_name)
+
+
+@receiver(post_save, sender=UserAccount)
+@receiver(post_delete, sender=UserAccount)
+def invalidate_cached_user_on_change(sender, instance, **kwargs):
+    # Deactivation and role changes go through save(); the counter and penalty
+    # updates in api.circulation invalidate the entry themselves.
+    invalidate_cached_user(instance.pk)
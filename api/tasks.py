@@ -1,44 +1,218 @@
-from celery import shared_task
+import logging
+from datetime import date
+
+from celery import chord, shared_task
+from django.core.mail import EmailMessage, get_connection
 from django.utils.timezone import now
-from django.core.mail import send_mail
+from .circulation import archive_returned_borrows, expire_holds, reconcile_available_copies
 from .models import Borrow
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
-# @shared_task
-# def send_due_date_notifications():
-#     today = now().date()
-#     borrows_due_today = Borrow.objects.filter(due_date=today, return_date__isnull=True)
-
-#     for borrow in borrows_due_today:
-#         user = borrow.user
-#         book = borrow.book
-#         send_mail(
-#             subject="📚 Book Due Reminder",
-#             message=f"Dear {user.username}, your borrowed book '{book.title}' is due today.",
-#             from_email=None,
-#             recipient_list=[user.email],
-#         )
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_CHUNK_SIZE = 500
+
+
+def due_borrows(today):
+    return Borrow.objects.filter(return_date__isnull=True, due_date__lte=today, user__is_active=True)
+
+
+def due_borrow_rows(today, first_id=None, last_id=None, user_ids=None):
+    """
+    Stream ``(user_id, username, email, title, due_date)`` for every unreturned
+    borrow due today or earlier, grouped by user. ``first_id``/``last_id``
+    limit it to an inclusive range of user ids, ``user_ids`` to those users.
+    """
+    borrows = due_borrows(today)
+    if first_id is not None:
+        borrows = borrows.filter(user_id__gte=first_id, user_id__lte=last_id)
+    if user_ids is not None:
+        borrows = borrows.filter(user_id__in=user_ids)
+    return (
+        borrows
+        .order_by('user_id', 'due_date')
+        .values_list('user_id', 'user__username', 'user__email', 'book__title', 'due_date')
+        .iterator(chunk_size=2000)
+    )
+
+
+def due_user_ranges(today, size):
+    """
+    Stream ``(first_id, last_id)`` ranges that each cover ``size`` users with
+    a due borrow, in user id order.
+    """
+    user_ids = (
+        due_borrows(today).order_by('user_id').values_list('user_id', flat=True)
+        .distinct().iterator(chunk_size=2000)
+    )
+    for chunk in chunked(user_ids, size):
+        yield str(chunk[0]), str(chunk[-1])
+
+
+def due_recipients(today, *args, **kwargs):
+    """
+    Fold the due borrow rows into one JSON-serialisable recipient per user;
+    takes the same filters as ``due_borrow_rows()``.
+    """
+    current = None
+    for user_id, username, email, title, due_date in due_borrow_rows(today, *args, **kwargs):
+        if current is None or current['user_id'] != str(user_id):
+            if current is not None:
+                yield current
+            current = {'user_id': str(user_id), 'username': username, 'email': email, 'due_today': [], 'overdue': []}
+        if due_date == today:
+            current['due_today'].append(title)
+        else:
+            current['overdue'].append([title, due_date.isoformat()])
+    if current is not None:
+        yield current
+
+
+def build_due_date_message(recipient, connection):
+    lines = [f"Dear {recipient['username']},", ""]
+    if recipient['due_today']:
+        lines.append("The following borrowed books are due today:")
+        lines += [f"  - {title}" for title in recipient['due_today']]
+        lines.append("")
+    if recipient['overdue']:
+        lines.append("The following borrowed books are overdue:")
+        lines += [f"  - {title} (due {due_date})" for title, due_date in recipient['overdue']]
+        lines.append("")
+    lines += ["Please return them to avoid penalty points.", "", "Your Library Team"]
+
+    return EmailMessage(
+        subject="📚 Book Due Reminder",
+        body="\n".join(lines),
+        from_email=None,            # uses DEFAULT_FROM_EMAIL
+        to=[recipient['email']],
+        connection=connection,
+    )
+
+
+def chunked(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
 
 @shared_task
-def send_due_date_notifications():
-    """
-    Test task: sends a verification email to every active user.
-    """
-    # Fetch all active users
-    users = User.objects.filter(is_active=True)
-    
-    for user in users:
-        send_mail(
-            subject="✅ Test Email from Library System",
-            message=(
-                f"Hello {user.username},\n\n"
-                "This is a test email sent via Celery to verify that "
-                "email delivery is working correctly.\n\n"
-                "Cheers,\n"
-                "Your Library Team"
-            ),
-            from_email=None,            # uses DEFAULT_FROM_EMAIL
-            recipient_list=[user.email],
-            fail_silently=False,
-        )
\ No newline at end of file
+def send_due_date_notifications(chunk_size=NOTIFICATION_CHUNK_SIZE):
+    """
+    Notify every user with a borrow that is due today or overdue.
+
+    The users are split into user id ranges of ``chunk_size`` users, one per
+    ``send_due_date_chunk`` subtask; each subtask loads its own recipients,
+    so the chord message only carries the ranges. The subtasks run in
+    parallel and a ``summarize_due_date_notifications`` callback adds up
+    their sent/failed counts once all of them have finished.
+    """
+    today = now().date()
+    chunks = [
+        send_due_date_chunk.s(today.isoformat(), first_id, last_id)
+        for first_id, last_id in due_user_ranges(today, chunk_size)
+    ]
+    if not chunks:
+        return {'chunks': 0, 'summary_id': None}
+    summary = chord(chunks)(summarize_due_date_notifications.s())
+    return {'chunks': len(chunks), 'summary_id': summary.id}
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def send_due_date_chunk(self, today, first_id, last_id, user_ids=None, sent=0):
+    """
+    Send the reminders of the users with ids from ``first_id`` to ``last_id``
+    that have a borrow due on or before ``today`` over a single mail
+    connection.
+
+    Users whose message fails are retried by id; ``sent`` carries the count
+    of earlier attempts so the final result covers the whole chunk.
+    """
+    recipients = list(due_recipients(date.fromisoformat(today), first_id, last_id, user_ids))
+    failed = []
+    attempted = 0
+    try:
+        with get_connection(fail_silently=False) as connection:
+            for recipient in recipients:
+                attempted += 1
+                try:
+                    build_due_date_message(recipient, connection).send()
+                    sent += 1
+                except Exception:
+                    logger.exception("due date notification to %s failed", recipient['email'])
+                    failed.append(recipient)
+    except Exception:
+        logger.exception("mail connection failed")
+    failed += recipients[attempted:]
+
+    if failed and self.request.retries < self.max_retries:
+        raise self.retry(
+            args=(today, first_id, last_id),
+            kwargs={'user_ids': [recipient['user_id'] for recipient in failed], 'sent': sent},
+        )
+    return {'sent': sent, 'failed': len(failed)}
+
+
+@shared_task
+def summarize_due_date_notifications(results):
+    totals = {'sent': 0, 'failed': 0}
+    for result in results:
+        totals['sent'] += result['sent']
+        totals['failed'] += result['failed']
+    logger.info("due date notifications: %(sent)d sent, %(failed)d failed", totals)
+    return totals
+
+
+@shared_task
+def process_expired_holds():
+    """
+    Expire holds whose pickup window has passed and hand their copies to
+    the next holders. Meant to run every few minutes from celery beat.
+    """
+    expired = expire_holds()
+    logger.info("holds: %d expired", expired)
+    return {'expired': expired}
+
+
+@shared_task
+def reconcile_inventory():
+    """
+    Fix ``available_copies`` drift across the catalog; see
+    ``reconcile_available_copies``. Safe to run during opening hours.
+    """
+    report = reconcile_available_copies()
+    logger.info(
+        "inventory: %(books)d books checked, %(drifted)d drifted "
+        "(+%(copies_added)d/-%(copies_removed)d copies), %(overcommitted)d overcommitted",
+        report,
+    )
+    return report
+
+
+@shared_task
+def archive_borrows():
+    """
+    Move borrows returned more than ``BORROW_ARCHIVE['AFTER_DAYS']`` ago to
+    the archive table; see ``archive_returned_borrows``.
+    """
+    moved = archive_returned_borrows()
+    logger.info("borrow archive: %d borrows moved", moved)
+    return {'moved': moved}
+
+
+@shared_task
+def compute_recommendations(full=False):
+    """
+    Refresh the "readers also borrowed" neighbours of books whose borrowers
+    changed; see ``api.recommendations``. Needs NumPy and SciPy on the worker.
+    """
+    from .recommendations import update_neighbours
+
+    report = update_neighbours(full=full)
+    logger.info("recommendations: %(recomputed)d of %(books)d books recomputed", report)
+    return report
@@ -0,0 +1,53 @@
+"""
+Test helpers for keeping query counts in check.
+"""
+from contextlib import ContextDecorator
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class query_budget(ContextDecorator):
+    """
+    Fail when the wrapped block or test runs more than ``max_queries``
+    queries. Usable as a context manager or a decorator::
+
+        @query_budget(2)
+        def test_book_list(self):
+            ...
+    """
+
+    def __init__(self, max_queries, using=DEFAULT_DB_ALIAS):
+        self.max_queries = max_queries
+        self.using = using
+
+    def __enter__(self):
+        self.context = CaptureQueriesContext(connections[self.using])
+        self.context.__enter__()
+        return self.context
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return False
+        executed = len(self.context.captured_queries)
+        if executed > self.max_queries:
+            queries = "\n".join(
+                f"{i}. {query['sql']}" for i, query in enumerate(self.context.captured_queries, start=1)
+            )
+            raise AssertionError(
+                f"{executed} queries executed, budget is {self.max_queries}\n{queries}"
+            )
+        return False
+
+
+def count_queries(func, *args, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Call ``func`` and return ``(result, captured_queries)``. Streaming
+    responses are consumed inside the capture so their queries count too.
+    """
+    with CaptureQueriesContext(connections[using]) as context:
+        result = func(*args, **kwargs)
+        if getattr(result, 'streaming', False):
+            result.streaming_content = [b''.join(result.streaming_content)]
+    return result, context.captured_queries
@@ -1,3 +1,1567 @@
-from django.test import TestCase
+import base64
+import importlib.util
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+from collections import Counter
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from core.celery import app as celery_app
+from core.sqlite import production_profile
+from . import tasks
+from .authentication import user_cache
+from .cache import CatalogCache, DjangoCache, LRUCache, catalog_cache, change_markers
+from .conditional import conditional_get
+from .metrics import registry
+from .pagination import KeysetPaginator
+from .routers import ReplicaRouter, ReplicaRoutingMiddleware, ReplicaPool, PIN_COOKIE, replica_pool
+from .testing import count_queries, query_budget
+from .throttling import SlidingWindowRateThrottle
+from .models import ArchivedBorrow, Book, BookNeighbour, Author, Category, Borrow, Hold, UserAccount
+from .serializers import (
+    AuthorSerializer,
+    AuthorValuesSerializer,
+    BookInfoSerializer,
+    BookInfoValuesSerializer,
+    BorrowListSerializser,
+    BorrowListValuesSerializer,
+    CategorySerializer,
+    CategoryValuesSerializer,
+)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LibraryTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_cache.clear()
+        user_cache.clear()
+        self.client = APIClient()
+
+    def make_user(self, username="reader", **kwargs):
+        return UserAccount.objects.create_regularuser(
+            email=f"{username}@example.com", username=username, password="password", **kwargs
+        )
+
+    def make_books(self, count, author=None, category=None, **kwargs):
+        author = author or Author.objects.create(name="Author", bio="bio")
+        category = category or Category.objects.create(name="Category")
+        kwargs.setdefault('total_copies', 2)
+        return Book.objects.bulk_create([
+            Book(
+                title=f"Book {i:04d}",
+                description="description",
+                author=author,
+                category=category,
+                available_copies=kwargs['total_copies'],
+                **kwargs
+            )
+            for i in range(count)
+        ])
+
+
+class BookCatalogListTests(LibraryTestCase):
+    def test_list_runs_a_single_query(self):
+        self.make_books(20)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/book/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 20)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_cursor_pagination_walks_every_book_once(self):
+        books = self.make_books(7)
+        seen = []
+        cursor = None
+        while True:
+            params = {'page_size': 3}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/book/', params)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['title'] for row in response.data['results']]
+            cursor = response.data['next']
+            if cursor is None:
+                break
+        self.assertEqual(seen, sorted(book.title for book in books))
+
+    def test_invalid_cursor_is_rejected(self):
+        paginator = KeysetPaginator(('title', 'id'))
+        for cursor in ('not-a-cursor', paginator.encode_cursor(['Book', 'not-a-uuid'])):
+            response = self.client.get('/api/book/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+        raw = base64.urlsafe_b64encode(json.dumps(['Book', 7]).encode()).decode()
+        response = self.client.get('/api/book/', {'cursor': raw})
+        self.assertEqual(response.status_code, 400)
+
+
+class BookSearchTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = Author.objects.create(name="Ursula Le Guin", bio="bio")
+        self.category = Category.objects.create(name="Fantasy")
+        self.wizard = Book.objects.create(
+            title="A Wizard of Earthsea", description="A young mage.",
+            author=self.author, category=self.category, total_copies=1,
+        )
+        Book.objects.create(
+            title="The Dispossessed", description="Anarchist wizard mentioned once in passing.",
+            author=self.author, category=self.category, total_copies=1,
+        )
+
+    def search(self, q):
+        response = self.client.get('/api/book/search/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [row['title'] for row in response.data]
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search("wizard"), ["A Wizard of Earthsea", "The Dispossessed"])
+
+    def test_prefix_query(self):
+        self.assertEqual(self.search("earth*"), ["A Wizard of Earthsea"])
+
+    def test_index_follows_book_and_author_changes(self):
+        self.author.name = "Ursula K. Le Guin"
+        self.author.save()
+        self.assertEqual(len(self.search("ursula")), 2)
+
+        self.wizard.title = "Earthsea"
+        self.wizard.save()
+        self.assertEqual(self.search("earthsea"), ["Earthsea"])
+
+        self.wizard.delete()
+        self.assertEqual(self.search("earthsea"), [])
+
+    def test_operators_in_user_input_are_not_interpreted(self):
+        self.assertEqual(self.search('wizard" OR "NEAR('), [])
+
+    def test_rebuild_command_reindexes_everything(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM api_book_search")
+        self.assertEqual(self.search("wizard"), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.search("wizard")), 2)
+
+
+class BorrowBookTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.client.force_authenticate(self.user)
+        self.book = self.make_books(1, total_copies=1)[0]
+
+    def borrow(self, book):
+        return self.client.post('/api/borrow/', {'book_id': str(book.id)})
+
+    def test_borrow_takes_one_copy(self):
+        response = self.borrow(self.book)
+        self.assertEqual(response.status_code, 200)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(Borrow.objects.filter(user=self.user, book=self.book).count(), 1)
+
+    def test_unavailable_book_is_rejected_without_side_effects(self):
+        self.borrow(self.book)
+        other = self.make_user("other")
+        self.client.force_authenticate(other)
+        response = self.borrow(self.book)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Borrow.objects.filter(user=other).exists())
+
+    def test_borrow_limit_rolls_back_the_copy(self):
+        books = self.make_books(4, author=self.book.author, category=self.book.category)
+        for book in books[:3]:
+            self.assertEqual(self.borrow(book).status_code, 200)
+        response = self.borrow(books[3])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['msg'], "can't borrow book. borrow limit reached")
+        books[3].refresh_from_db()
+        self.assertEqual(books[3].available_copies, 2)
+
+    def test_unknown_book_is_404(self):
+        response = self.client.post('/api/borrow/', {'book_id': '00000000-0000-0000-0000-000000000000'})
+        self.assertEqual(response.status_code, 404)
+
+
+class BatchCirculationTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.client.force_authenticate(self.user)
+
+    def test_batch_borrow_reports_each_item_and_respects_limit(self):
+        books = self.make_books(4, total_copies=1)
+        Book.objects.filter(id=books[1].id).update(available_copies=0)
+        payload = {'book_ids': [str(b.id) for b in books] + ['nope']}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/borrow/batch/', payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [row['status'] for row in response.data['results']],
+            ['borrowed', 'error', 'borrowed', 'borrowed', 'error'],
+        )
+        self.assertEqual(Borrow.objects.filter(user=self.user).count(), 3)
+        self.assertLessEqual(len(ctx.captured_queries), 8)
+
+        response = self.client.post('/api/borrow/batch/', {'book_ids': [str(books[1].id)]}, format='json')
+        self.assertEqual(response.data['results'][0]['msg'], "this book is currenlty unavailable")
+
+    def test_batch_borrow_for_a_patron_checks_the_user_id(self):
+        book = self.make_books(1)[0]
+        patron = self.make_user("patron")
+        self.client.force_authenticate(self.make_user("admin", is_staff=True))
+        for user_id, code in (('nope', 400), (str(uuid.uuid4()), 404), (str(patron.id), 200)):
+            with self.subTest(user_id=user_id):
+                payload = {'book_ids': [str(book.id)], 'user_id': user_id}
+                response = self.client.post('/api/borrow/batch/', payload, format='json')
+                self.assertEqual(response.status_code, code)
+        self.assertTrue(Borrow.objects.filter(user=patron, book=book).exists())
+
+    def test_batch_return_restores_inventory_and_penalises_late_returns(self):
+        books = self.make_books(2, total_copies=1)
+        self.client.post('/api/borrow/batch/', {'book_ids': [str(b.id) for b in books]}, format='json')
+        borrows = list(Borrow.objects.filter(user=self.user))
+        Borrow.objects.filter(id=borrows[0].id).update(due_date=date.today() - timedelta(days=1))
+
+        payload = {'borrow_ids': [str(b.id) for b in borrows]}
+        response = self.client.post('/api/return/batch/', payload, format='json')
+        self.assertEqual([row['status'] for row in response.data['results']], ['returned', 'returned'])
+        self.assertEqual(
+            sorted(Book.objects.values_list('available_copies', flat=True)), [1, 1]
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.penalty_point, 1)
+
+        response = self.client.post('/api/return/batch/', payload, format='json')
+        self.assertEqual(response.data['results'][0]['msg'], "book already returned")
+
+    def test_batch_return_hides_other_users_borrows(self):
+        book = self.make_books(1)[0]
+        other = self.make_user("other")
+        borrow = Borrow.objects.create(user=other, book=book, borrow_date=date.today(), due_date=date.today())
+        response = self.client.post('/api/return/batch/', {'borrow_ids': [str(borrow.id)]}, format='json')
+        self.assertEqual(response.data['results'][0]['status'], 'error')
+        borrow.refresh_from_db()
+        self.assertIsNone(borrow.return_date)
+
+
+class HoldTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.book = self.make_books(1, total_copies=1)[0]
+        self.borrow = Borrow.objects.create(
+            user=self.user, book=self.book, borrow_date=date.today(), due_date=date.today() + timedelta(days=14),
+        )
+        Book.objects.filter(id=self.book.id).update(available_copies=0)
+        UserAccount.objects.filter(pk=self.user.pk).update(active_borrow_count=1)
+        self.holders = [self.make_user(f"holder{i}") for i in range(3)]
+        for holder in self.holders:
+            self.as_user(holder)
+            self.assertEqual(self.client.post('/api/holds/', {'book_id': str(self.book.id)}).status_code, 200)
+
+    def as_user(self, user):
+        self.client.force_authenticate(user)
+
+    def give_back(self):
+        self.as_user(self.user)
+        return self.client.post('/api/return/', {'borrow_id': str(self.borrow.id)})
+
+    def available(self):
+        self.book.refresh_from_db()
+        return self.book.available_copies
+
+    def test_holders_see_their_place_in_the_queue(self):
+        for position, holder in enumerate(self.holders, 1):
+            self.as_user(holder)
+            with self.assertNumQueries(1):
+                response = self.client.get('/api/holds/')
+            self.assertEqual([(row['book'], row['position']) for row in response.json()], [(self.book.title, position)])
+
+        response = self.client.post('/api/holds/', {'book_id': str(self.book.id)})
+        self.assertEqual(response.data['msg'], "you already have a hold on this book")
+        self.as_user(self.user)
+        response = self.client.post('/api/holds/', {'book_id': str(self.book.id)})
+        self.assertEqual(response.data['msg'], "you have already borrowed this book")
+
+    def test_books_on_the_shelf_cannot_be_held(self):
+        book = self.make_books(1, author=self.book.author, category=self.book.category)[0]
+        response = self.client.post('/api/holds/', {'book_id': str(book.id)})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post('/api/holds/', {'book_id': 'nope'}).status_code, 400)
+
+    def test_return_puts_the_copy_aside_for_the_first_holder(self):
+        self.assertEqual(self.give_back().status_code, 200)
+        self.assertEqual(self.available(), 0)
+        self.assertEqual(
+            list(Hold.objects.order_by('created_at').values_list('status', flat=True)),
+            ['ready', 'waiting', 'waiting'],
+        )
+
+        self.as_user(self.holders[1])
+        self.assertEqual(self.client.post('/api/borrow/', {'book_id': str(self.book.id)}).status_code, 400)
+        self.assertEqual(self.client.get('/api/holds/').json()[0]['position'], 1)
+
+        self.as_user(self.holders[0])
+        self.assertEqual(self.client.post('/api/borrow/', {'book_id': str(self.book.id)}).status_code, 200)
+        self.assertEqual(Hold.objects.get(user=self.holders[0]).status, 'fulfilled')
+        self.assertEqual(self.available(), 0)
+
+    def test_unclaimed_copies_pass_down_the_queue_then_to_the_shelf(self):
+        self.give_back()
+        for holder in self.holders:
+            self.assertEqual(Hold.objects.get(user=holder).status, 'ready')
+            Hold.objects.filter(user=holder).update(expires_at=timezone.now() - timedelta(minutes=1))
+            self.assertEqual(tasks.process_expired_holds(), {'expired': 1})
+            self.assertEqual(Hold.objects.get(user=holder).status, 'expired')
+        self.assertEqual(self.available(), 1)
+
+    def test_cancelling_a_ready_hold_passes_the_copy_on(self):
+        self.give_back()
+        self.as_user(self.holders[0])
+        hold = Hold.objects.get(user=self.holders[0])
+        self.assertEqual(self.client.delete(f'/api/holds/{hold.id}/').status_code, 200)
+        self.assertEqual(self.client.delete(f'/api/holds/{hold.id}/').status_code, 404)
+        self.assertEqual(Hold.objects.get(user=self.holders[1]).status, 'ready')
+
+    def test_holders_who_queued_during_a_return_are_served_by_the_task(self):
+        Hold.objects.all().delete()
+        self.give_back()
+        self.assertEqual(self.available(), 1)
+        Hold.objects.create(user=self.holders[0], book=self.book)
+        tasks.process_expired_holds()
+        self.assertEqual(Hold.objects.get().status, 'ready')
+        self.assertEqual(self.available(), 0)
+
+    def test_return_without_holds_restocks_the_shelf(self):
+        Hold.objects.all().delete()
+        self.give_back()
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.available_copies, self.book.total_copies), (1, 1))
+
+
+class BorrowArchiveTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        today = date.today()
+        self.books = self.make_books(4)
+        self.old = [
+            Borrow.objects.create(
+                user=self.user, book=book, borrow_date=today - timedelta(days=500),
+                due_date=today - timedelta(days=486), return_date=today - timedelta(days=490),
+            )
+            for book in self.books[:3]
+        ]
+        self.recent = Borrow.objects.create(
+            user=self.user, book=self.books[3], borrow_date=today - timedelta(days=10),
+            due_date=today + timedelta(days=4), return_date=today,
+        )
+        self.open = Borrow.objects.create(
+            user=self.user, book=self.books[0], borrow_date=today, due_date=today + timedelta(days=14),
+        )
+
+    @override_settings(BORROW_ARCHIVE={'AFTER_DAYS': 365, 'BATCH_SIZE': 2})
+    def test_old_returns_move_in_batches(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(tasks.archive_borrows(), {'moved': 3})
+        self.assertEqual(sum(q['sql'].startswith('DELETE') for q in ctx.captured_queries), 2)
+        self.assertEqual(set(Borrow.objects.values_list('id', flat=True)), {self.recent.id, self.open.id})
+        archived = ArchivedBorrow.objects.get(id=self.old[0].id)
+        self.assertEqual(
+            (archived.user_id, archived.book_id, archived.return_date),
+            (self.user.id, self.books[0].id, self.old[0].return_date),
+        )
+        self.assertEqual(tasks.archive_borrows(), {'moved': 0})
+
+    def test_export_includes_the_archive(self):
+        from .circulation import archive_returned_borrows
+        archive_returned_borrows(pause=0)
+        self.client.force_authenticate(self.make_user("admin", is_staff=True))
+        response = self.client.get('/api/export/borrows/')
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 5)
+
+
+class CatalogCacheTests(LibraryTestCase):
+    def test_detail_is_served_from_cache_until_the_book_changes(self):
+        book = self.make_books(1)[0]
+        url = f'/api/book/{book.id}/'
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        book.title = "Renamed"
+        book.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['title'], "Renamed")
+
+    def test_list_is_keyed_by_filters_and_invalidated_by_author_changes(self):
+        author = Author.objects.create(name="Tolkien", bio="bio")
+        self.make_books(2, author=author)
+        self.client.get('/api/book/', {'author': 'tolk'})
+        self.assertEqual(self.client.get('/api/book/', {'author': 'tolk'})['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/api/book/', {'author': 'x'})['X-Cache'], 'MISS')
+
+        author.name = "Pratchett"
+        author.save()
+        self.assertEqual(self.client.get('/api/book/', {'author': 'tolk'}).data, [])
+
+    def test_borrowing_does_not_evict_the_catalog(self):
+        book = self.make_books(1)[0]
+        self.client.get('/api/book/')
+        self.client.force_authenticate(self.make_user())
+        self.client.post('/api/borrow/', {'book_id': str(book.id)})
+        self.assertEqual(self.client.get('/api/book/')['X-Cache'], 'HIT')
+        self.assertEqual(catalog_cache.stats()['hits'], 1)
+
+
+# The tests' locmem markers are per process; validators need SINGLE_WORKER.
+@override_settings(CATALOG_CACHE={'SINGLE_WORKER': True})
+class ConditionalGetTests(LibraryTestCase):
+    @override_settings(CATALOG_CACHE={'SINGLE_WORKER': False})
+    def test_no_validators_with_per_process_markers(self):
+        response = self.client.get('/api/book/')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(self.client.get('/api/book/', HTTP_IF_NONE_MATCH='*').status_code, 200)
+
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+        }}):
+            self.assertTrue(self.client.get('/api/book/').has_header('ETag'))
+            self.assertEqual(self.client.get('/api/book/', HTTP_IF_NONE_MATCH='*').status_code, 304)
+
+    def test_matching_etag_returns_304_without_queries(self):
+        self.make_books(3)
+        response = self.client.get('/api/book/')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/book/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_with_the_data_and_the_url(self):
+        author = Author.objects.create(name="Author", bio="bio")
+        etag = self.client.get('/api/book/')['ETag']
+        self.assertNotEqual(self.client.get('/api/book/', {'author': 'a'})['ETag'], etag)
+
+        author.name = "Someone else"
+        author.save()
+        response = self.client.get('/api/book/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        response = self.client.get('/api/book/')
+        response = self.client.get('/api/book/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_admin_lists_check_permissions_first(self):
+        response = self.client.get('/api/authors/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 401)
+        self.client.force_authenticate(self.make_user(is_staff=True))
+        etag = self.client.get('/api/categories/')['ETag']
+        Category.objects.create(name="New")
+        self.assertEqual(self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class DueDateNotificationTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        celery_app.conf.update(task_always_eager=True, task_store_eager_result=True)
+        self.addCleanup(celery_app.conf.update, task_always_eager=False, task_store_eager_result=False)
+
+        book = self.make_books(1)[0]
+        today = date.today()
+        self.due = []
+        for i, due_date in enumerate([today, today - timedelta(days=3), today + timedelta(days=1)]):
+            user = self.make_user(f"reader{i}")
+            Borrow.objects.create(user=user, book=book, borrow_date=today, due_date=due_date)
+            self.due.append(user)
+        returned = self.make_user("returned")
+        Borrow.objects.create(user=returned, book=book, borrow_date=today, due_date=today, return_date=today)
+
+    def test_only_due_and_overdue_borrowers_are_notified_in_chunks(self):
+        result = tasks.send_due_date_notifications.apply(kwargs={'chunk_size': 1}).get()
+        self.assertEqual(result['chunks'], 2)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ["reader0@example.com", "reader1@example.com"],
+        )
+        bodies = {message.to[0]: message.body for message in mail.outbox}
+        self.assertIn("due today", bodies["reader0@example.com"])
+        self.assertIn("overdue", bodies["reader1@example.com"])
+
+    def test_chunks_carry_user_id_ranges_not_recipients(self):
+        with mock.patch.object(tasks, 'chord') as chord:
+            tasks.send_due_date_notifications(chunk_size=1)
+        ranges = [signature.args for signature in chord.call_args.args[0]]
+        ids = sorted(str(user.id) for user in self.due[:2])
+        today = date.today().isoformat()
+        self.assertEqual(ranges, [(today, ids[0], ids[0]), (today, ids[1], ids[1])])
+
+    def test_failed_sends_are_retried_and_counted(self):
+        today = date.today().isoformat()
+        first, last = sorted(str(user.id) for user in self.due[:2])
+        with mock.patch.object(tasks, 'build_due_date_message', side_effect=RuntimeError("esp down")), \
+                self.assertLogs('api.tasks', 'ERROR') as logs:
+            result = tasks.send_due_date_chunk.apply(args=(today, first, last)).get()
+        self.assertEqual(result, {'sent': 0, 'failed': 2})
+        self.assertEqual(len(logs.records), 2 * (tasks.send_due_date_chunk.max_retries + 1))
+
+        calls = []
+        build = tasks.build_due_date_message
+
+        def fail_once(recipient, connection):
+            calls.append(recipient['user_id'])
+            if len(calls) == 1:
+                raise RuntimeError("esp down")
+            return build(recipient, connection)
+
+        with mock.patch.object(tasks, 'build_due_date_message', fail_once), self.assertLogs('api.tasks', 'ERROR'):
+            result = tasks.send_due_date_chunk.apply(args=(today, first, last)).get()
+        self.assertEqual(result, {'sent': 2, 'failed': 0})
+        # Only the failed user is loaded and sent to again.
+        self.assertEqual(calls, [first, last, first])
+        self.assertEqual(tasks.summarize_due_date_notifications([result, result]), {'sent': 4, 'failed': 0})
+
+
+def query_plans(func):
+    """
+    Run ``func`` and return the SQLite query plan of every statement it
+    executed, as a list of ``(sql, [plan details])``.
+    """
+    executed = []
+
+    def record(execute, sql, params, many, context):
+        executed.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        func()
+
+    plans = []
+    with connection.cursor() as cursor:
+        for sql, params in executed:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plans.append((sql, [row[-1] for row in cursor.fetchall()]))
+    return plans
+
+
+@skipUnless(
+    importlib.util.find_spec('scipy'),
+    "NumPy and SciPy are not installed: pip install -r requirements-worker.txt",
+)
+class RecommendationTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c, self.d = self.make_books(4)
+        self.users = [self.make_user(f"reader{i}") for i in range(4)]
+        today = date.today()
+        for user, books in zip(self.users, [(self.a, self.b), (self.a, self.b, self.c), (self.a, self.c)]):
+            for book in books:
+                Borrow.objects.create(user=user, book=book, borrow_date=today, due_date=today)
+        ArchivedBorrow.objects.create(
+            id=uuid.uuid4(), user=self.users[3], book=self.c, borrow_date=today, due_date=today, return_date=today,
+        )
+
+    def neighbours(self, book):
+        return [
+            (n.neighbour_id, round(n.score, 3))
+            for n in BookNeighbour.objects.filter(book=book).order_by('rank')
+        ]
+
+    def test_neighbours_are_ranked_by_cosine_similarity(self):
+        report = tasks.compute_recommendations()
+        self.assertEqual(report, {'borrowers': 4, 'books': 3, 'recomputed': 3})
+        # A: 3 borrowers, B: 2, C: 3 (one archived); A and B share 2, A and C 2, B and C 1.
+        self.assertEqual(self.neighbours(self.a), [(self.b.id, 0.816), (self.c.id, 0.667)])
+        self.assertEqual(self.neighbours(self.b), [(self.a.id, 0.816), (self.c.id, 0.408)])
+        self.assertEqual(self.neighbours(self.c), [(self.a.id, 0.667), (self.b.id, 0.408)])
+        self.assertEqual(self.neighbours(self.d), [])
+
+    def test_only_books_with_new_borrowers_are_recomputed(self):
+        tasks.compute_recommendations()
+        self.assertEqual(tasks.compute_recommendations()['recomputed'], 0)
+
+        today = date.today()
+        Borrow.objects.create(user=self.users[1], book=self.b, borrow_date=today, due_date=today)
+        self.assertEqual(tasks.compute_recommendations()['recomputed'], 0)
+        Borrow.objects.create(user=self.users[3], book=self.b, borrow_date=today, due_date=today)
+        self.assertEqual(tasks.compute_recommendations()['recomputed'], 1)
+        # B: 3 borrowers now, two shared with A and two with C.
+        self.assertCountEqual(self.neighbours(self.b), [(self.a.id, 0.667), (self.c.id, 0.667)])
+        self.assertEqual(tasks.compute_recommendations(full=True)['recomputed'], 3)
+
+    def test_endpoint_is_a_single_query(self):
+        call_command('compute_recommendations', stdout=StringIO())
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/book/{self.a.id}/recommendations/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(
+            [(row['id'], row['title'], row['author']) for row in response.data],
+            [(str(self.b.id), self.b.title, "Author"), (str(self.c.id), self.c.title, "Author")],
+        )
+        self.assertEqual(self.client.get(f'/api/book/{self.d.id}/recommendations/').data, [])
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN is SQLite specific")
+class BorrowQueryPlanTests(LibraryTestCase):
+    """
+    Fails when a hot query on a large table stops using an index.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        book = self.make_books(1)[0]
+        Borrow.objects.create(user=self.user, book=book, borrow_date=date.today(), due_date=date.today())
+
+    def assertIndexed(self, func, scans=()):
+        """
+        Fail on a full scan of any table not listed in ``scans``.
+        """
+        plans = query_plans(func)
+        self.assertTrue(plans)
+        for sql, details in plans:
+            for detail in details:
+                if detail.startswith('SCAN ') and ' INDEX ' not in detail and detail.split()[1] not in scans:
+                    self.fail(f"table scan in {detail!r} for query:\n{sql}\nplan: {details}")
+
+    def test_active_borrow_count(self):
+        self.assertIndexed(
+            lambda: Borrow.objects.filter(user=self.user, return_date__isnull=True).count()
+        )
+
+    def test_active_borrow_count_uses_the_partial_index(self):
+        plans = query_plans(
+            lambda: Borrow.objects.filter(user=self.user, return_date__isnull=True).count()
+        )
+        self.assertIn('borrow_active_user_idx', " ".join(plans[0][1]))
+
+    def test_borrow_list(self):
+        self.assertIndexed(lambda: list(Borrow.objects.filter(user=self.user)))
+
+    def assertOrderedByIndex(self, filters, **params):
+        from .circulation import borrow_history
+
+        def run():
+            for queryset in borrow_history(filters, **params)[0]:
+                list(queryset)
+
+        self.assertIndexed(run)
+        for sql, details in query_plans(run):
+            self.assertFalse(
+                any('TEMP B-TREE' in detail for detail in details),
+                f"history ordering needs a sort for:\n{sql}\nplan: {details}",
+            )
+
+    def test_borrow_history_pages(self):
+        cursor = KeysetPaginator(('-borrow_date', '-id')).encode_cursor([date.today(), uuid.uuid4()])
+        for status in (None, 'active', 'returned', 'overdue'):
+            with self.subTest(status=status):
+                self.assertOrderedByIndex({'user': self.user}, status=status, page_size=50)
+                self.assertOrderedByIndex({'user': self.user}, status=status, cursor=cursor)
+
+    def test_staff_borrow_history_pages(self):
+        cursor = KeysetPaginator(('-borrow_date', '-id')).encode_cursor([date.today(), uuid.uuid4()])
+        for status in (None, 'active', 'returned', 'overdue'):
+            with self.subTest(status=status):
+                self.assertOrderedByIndex({}, status=status, page_size=50)
+                self.assertOrderedByIndex({}, status=status, cursor=cursor)
+
+    def test_active_borrow_reconciliation(self):
+        from .circulation import reconcile_active_borrow_counts
+        # A nightly pass over every user: an index on the counter would cost
+        # every borrow and return more than it saves here.
+        self.assertIndexed(reconcile_active_borrow_counts, scans=('api_useraccount',))
+
+    def test_due_date_scan(self):
+        self.assertIndexed(lambda: list(tasks.due_borrow_rows(date.today())))
+        self.assertIndexed(lambda: list(tasks.due_user_ranges(date.today(), 500)))
+        user_id = str(self.user.id)
+        self.assertIndexed(lambda: list(tasks.due_borrow_rows(date.today(), user_id, user_id)))
+
+    def test_inventory_reconciliation(self):
+        from .circulation import reconcile_available_copies
+        self.assertIndexed(reconcile_available_copies)
+
+    def test_hold_queue(self):
+        from .circulation import expire_holds, release_copies, with_queue_position
+        book = Book.objects.get()
+        Hold.objects.create(user=self.user, book=book)
+        with transaction.atomic():
+            self.assertIndexed(lambda: release_copies({book.id: 1}))
+        self.assertIndexed(lambda: list(with_queue_position(Hold.objects.filter(user=self.user))))
+        self.assertIndexed(expire_holds)
+
+    def test_recommendations(self):
+        from .serializers import BookNeighbourValuesSerializer
+        book = Book.objects.get()
+        plans = query_plans(
+            lambda: BookNeighbourValuesSerializer.serialize(BookNeighbour.objects.filter(book=book).order_by('rank'))
+        )
+        # neighbour_book_rank_uniq, which SQLite reports as an autoindex.
+        details = " ".join(plans[0][1])
+        self.assertRegex(details, r'SEARCH api_bookneighbour USING INDEX \S+ \(book_id=\?\)')
+        self.assertNotIn('TEMP B-TREE', details)
+
+
+class ActiveBorrowCountTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.client.force_authenticate(self.user)
+        self.books = self.make_books(4)
+
+    def active_count(self):
+        self.user.refresh_from_db()
+        return self.user.active_borrow_count
+
+    def test_borrow_and_return_maintain_the_counter(self):
+        self.client.post('/api/borrow/', {'book_id': str(self.books[0].id)})
+        self.client.post('/api/borrow/batch/', {'book_ids': [str(b.id) for b in self.books[1:3]]}, format='json')
+        self.assertEqual(self.active_count(), 3)
+
+        borrows = list(Borrow.objects.filter(user=self.user))
+        self.client.post('/api/return/', {'borrow_id': str(borrows[0].id)})
+        self.client.post('/api/return/', {'borrow_id': str(borrows[0].id)})
+        self.assertEqual(self.active_count(), 2)
+        self.client.post('/api/return/batch/', {'borrow_ids': [str(b.id) for b in borrows[1:]]}, format='json')
+        self.assertEqual(self.active_count(), 0)
+
+    def test_limit_is_enforced_by_the_counter(self):
+        UserAccount.objects.filter(pk=self.user.pk).update(active_borrow_count=3)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/borrow/', {'book_id': str(self.books[0].id)})
+        self.assertEqual(response.data['msg'], "can't borrow book. borrow limit reached")
+        self.assertFalse(any('COUNT(' in q['sql'] for q in ctx.captured_queries))
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].available_copies, 2)
+
+    def test_reconcile_command_fixes_drift(self):
+        today = date.today()
+        Borrow.objects.create(user=self.user, book=self.books[0], borrow_date=today, due_date=today)
+        other = self.make_user("other", active_borrow_count=2)
+        out = StringIO()
+        call_command('reconcile_borrow_counts', stdout=out)
+        self.assertIn("corrected 2 users", out.getvalue())
+        self.assertEqual(self.active_count(), 1)
+        other.refresh_from_db()
+        self.assertEqual(other.active_borrow_count, 0)
+
+
+class InventoryReconciliationTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.books = self.make_books(5, total_copies=2)
+        today = date.today()
+        for book in self.books[:3]:
+            Borrow.objects.create(user=self.user, book=book, borrow_date=today, due_date=today)
+        Borrow.objects.create(user=self.user, book=self.books[3], borrow_date=today, due_date=today, return_date=today)
+        Hold.objects.create(
+            user=self.make_user("holder"), book=self.books[4], status='ready',
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+
+    def available(self):
+        return [b.available_copies for b in Book.objects.filter(id__in=[b.id for b in self.books])]
+
+    def test_only_drifted_books_are_corrected(self):
+        from .circulation import reconcile_available_copies
+        Book.objects.filter(id=self.books[0].id).update(available_copies=0)
+        expected = {book.id: 1 for book in self.books}
+        expected[self.books[3].id] = 2
+        report = reconcile_available_copies(chunk_size=2)
+        self.assertEqual(
+            report,
+            {'books': 5, 'drifted': 4, 'copies_added': 1, 'copies_removed': 3, 'overcommitted': 0},
+        )
+        self.assertEqual(dict(Book.objects.values_list('id', 'available_copies')), expected)
+        self.assertEqual(reconcile_available_copies()['drifted'], 0)
+
+    def test_overcommitted_books_are_clamped_and_reported(self):
+        from .circulation import reconcile_available_copies
+        Book.objects.filter(id=self.books[0].id).update(total_copies=0)
+        report = reconcile_available_copies()
+        self.assertEqual(report['overcommitted'], 1)
+        self.assertEqual(Book.objects.get(id=self.books[0].id).available_copies, 0)
+
+    def test_command_and_dry_run(self):
+        out = StringIO()
+        call_command('reconcile_inventory', '--dry-run', stdout=out)
+        self.assertIn("checked 5 books, found 4 (+0/-4 copies)", out.getvalue())
+        self.assertEqual(self.available(), [2] * 5)
+
+        self.assertEqual(tasks.reconcile_inventory()['drifted'], 4)
+        self.assertEqual(sorted(self.available()), [1, 1, 1, 1, 2])
+
+
+class SeedLibraryTests(LibraryTestCase):
+    def test_seeded_library_is_consistent(self):
+        call_command(
+            'seed_library', authors=5, categories=3, books=40, users=10,
+            borrows_per_user=4, batch_size=7, seed=1, stdout=StringIO(),
+        )
+        self.assertEqual(Book.objects.count(), 40)
+        self.assertEqual(UserAccount.objects.count(), 10)
+        self.assertTrue(Borrow.objects.exists())
+
+        from .circulation import reconcile_active_borrow_counts
+        self.assertEqual(reconcile_active_borrow_counts(), 0)
+        open_loans = Borrow.objects.filter(return_date__isnull=True)
+        for book in Book.objects.all():
+            self.assertEqual(
+                book.available_copies,
+                book.total_copies - open_loans.filter(book=book).count(),
+            )
+
+
+class ImportCatalogTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        Author.objects.create(name="Existing Author", bio="bio")
+
+    def write(self, name, content):
+        path = os.path.join(self.dir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_csv_import_resolves_names_and_skips_bad_rows(self):
+        path = self.write('books.csv', (
+            "title,description,author,category,total_copies\n"
+            "One,d,Existing Author,Poetry,2\n"
+            "Two,d,New Author,Poetry,1\n"
+            ",d,New Author,Poetry,1\n"
+            "Three,d,New Author,Drama,x\n"
+            "Four,d,New Author,Drama,3\n"
+        ))
+        err = StringIO()
+        call_command('import_catalog', path, batch_size=2, stdout=StringIO(), stderr=err)
+        self.assertEqual(sorted(Book.objects.values_list('title', flat=True)), ["Four", "One", "Two"])
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(Book.objects.get(title="Four").available_copies, 3)
+        self.assertIn("record 3: title is required", err.getvalue())
+
+    def test_jsonl_import_resumes_from_checkpoint(self):
+        lines = [json.dumps({'title': f"Book {i}", 'author': "A", 'category': "C"}) for i in range(5)]
+        path = self.write('books.jsonl', "\n".join(lines) + "\n")
+        with open(path + '.checkpoint', 'w') as f:
+            json.dump({'path': os.path.abspath(path), 'records': 3}, f)
+
+        call_command('import_catalog', path, stdout=StringIO())
+        self.assertEqual(sorted(Book.objects.values_list('title', flat=True)), ["Book 3", "Book 4"])
+
+        call_command('import_catalog', path, stdout=StringIO())
+        self.assertEqual(Book.objects.count(), 2)
+
+
+class ExportTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.make_user("admin", is_staff=True))
+        self.books = self.make_books(3)
+
+    def test_book_export_streams_ndjson(self):
+        response = self.client.get('/api/export/books/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['author'], "Author")
+
+    def test_borrow_export_streams_csv(self):
+        user = self.make_user()
+        Borrow.objects.create(user=user, book=self.books[0], borrow_date=date.today(), due_date=date.today())
+        response = self.client.get('/api/export/borrows/', {'output': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "id,user_id,username,book_id,book,borrow_date,due_date,return_date")
+        self.assertIn(",reader,", lines[1])
+
+    def test_exports_are_admin_only(self):
+        self.client.force_authenticate(self.make_user())
+        self.assertEqual(self.client.get('/api/export/books/').status_code, 403)
+
+
+class CachedUserAuthenticationTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.books = self.make_books(2)
+        Borrow.objects.create(user=self.user, book=self.books[0], borrow_date=date.today(), due_date=date.today())
+        self.login()
+
+    def login(self):
+        response = self.client.post('/api/login/', {'email': self.user.email, 'password': 'password'})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return response
+
+    def test_login_tokens_carry_user_flags(self):
+        token = AccessToken(self.login().data['access'])
+        self.assertIs(token['is_staff'], False)
+        self.assertIs(token['is_active'], True)
+
+    def test_cached_user_skips_the_user_query(self):
+        self.client.get('/api/borrow/')
+        # Only the borrow and archive queries.
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/borrow/')
+        self.assertEqual([row['book'] for row in response.data], [self.books[0].title])
+
+        # Penalties are read from the database, not from the cached user.
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/users/{self.user.id}/penalties/')
+        self.assertEqual(response.data['penalty_point'], 0)
+
+    def test_late_returns_are_not_lost_on_the_cached_user(self):
+        late = date.today() - timedelta(days=1)
+        first, second = (
+            Borrow.objects.create(user=self.user, book=book, borrow_date=late, due_date=late)
+            for book in self.books
+        )
+        self.client.get('/api/borrow/')
+        self.client.post('/api/return/batch/', {'borrow_ids': [str(first.id)]}, format='json')
+        response = self.client.get(f'/api/users/{self.user.id}/penalties/')
+        self.assertEqual(response.data['penalty_point'], 1)
+
+        self.client.post('/api/return/', {'borrow_id': str(second.id)})
+        response = self.client.get(f'/api/users/{self.user.id}/penalties/')
+        self.assertEqual(response.data['penalty_point'], 2)
+
+    def test_late_return_charges_the_borrower(self):
+        late = date.today() - timedelta(days=1)
+        borrow = Borrow.objects.create(user=self.user, book=self.books[1], borrow_date=late, due_date=late)
+        admin = self.make_user("admin", is_staff=True)
+        self.client.force_authenticate(admin)
+        self.client.post('/api/return/', {'borrow_id': str(borrow.id)})
+        self.user.refresh_from_db()
+        admin.refresh_from_db()
+        self.assertEqual((self.user.penalty_point, admin.penalty_point), (1, 0))
+
+    def test_saving_the_user_invalidates_the_cache(self):
+        self.client.get('/api/borrow/')
+        self.user.penalty_point = 4
+        self.user.save()
+        response = self.client.get(f'/api/users/{self.user.id}/penalties/')
+        self.assertEqual(response.data['penalty_point'], 4)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/borrow/').status_code, 401)
+
+    def test_role_change_in_a_newer_token_refreshes_the_entry(self):
+        self.assertEqual(self.client.get('/api/authors/').status_code, 403)
+
+        # Promoted elsewhere: the cached entry here is stale but not evicted.
+        UserAccount.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.assertEqual(self.client.get('/api/authors/').status_code, 403)
+        self.login()
+        self.assertEqual(self.client.get('/api/authors/').status_code, 200)
+
+
+class FiveAMinuteThrottle(SlidingWindowRateThrottle):
+    rate = '5/min'
+
+    def get_cache_key(self, request, view):
+        return 'throttle:client'
+
+
+class SlidingWindowThrottleTests(LibraryTestCase):
+    def make_throttle(self, now, blocked=None):
+        # Each "process" has its own blocked map; counters live in the shared cache.
+        throttle = FiveAMinuteThrottle()
+        throttle.timer = lambda: now
+        throttle.blocked = blocked if blocked is not None else LRUCache()
+        return throttle
+
+    def allowed(self, count, now, blocked=None):
+        return [self.make_throttle(now, blocked).allow_request(None, None) for _ in range(count)]
+
+    def test_limit_is_shared_between_processes(self):
+        first, second = LRUCache(), LRUCache()
+        self.assertEqual(self.allowed(3, 0, first), [True] * 3)
+        self.assertEqual(self.allowed(3, 1, second), [True, True, False])
+        self.assertEqual(self.allowed(1, 2, first), [False])
+
+    def test_previous_window_is_weighted_by_overlap(self):
+        self.assertEqual(self.allowed(5, 0), [True] * 5)
+        # Halfway through the next window half of the old requests still count.
+        self.assertEqual(self.allowed(3, 90), [True, True, False])
+
+    def test_wait_until_a_slot_frees_up(self):
+        self.allowed(5, 0)
+        throttle = self.make_throttle(0)
+        self.assertFalse(throttle.allow_request(None, None))
+        self.assertAlmostEqual(throttle.wait(), 72)
+        self.assertEqual(self.allowed(2, 72), [True, False])
+
+    def test_blocked_client_is_rejected_without_the_shared_cache(self):
+        blocked = LRUCache()
+        self.allowed(6, 0, blocked)
+        with mock.patch.object(FiveAMinuteThrottle, 'cache') as shared:
+            self.assertEqual(self.allowed(1, 10, blocked), [False])
+        shared.assert_not_called()
+        self.assertEqual(shared.method_calls, [])
+
+
+@override_settings(METRICS={'ENABLED': True, 'SLOW_REQUEST_SECONDS': 0, 'SLOW_REQUEST_SAMPLE_RATE': 1})
+class RequestMetricsTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+        self.make_books(3)
+
+    def scrape(self):
+        self.client.force_authenticate(self.make_user("admin", is_staff=True))
+        with self.assertLogs('api.slow_requests'):
+            response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_records_timings_per_view_and_method(self):
+        with self.assertLogs('api.slow_requests'):
+            response = self.client.get('/api/book/')
+        metrics = self.scrape()
+        labels = '{view="BookInfoAPIView",method="GET"}'
+        self.assertIn('# TYPE library_request_duration_seconds histogram', metrics)
+        self.assertIn(f'library_db_queries_count{labels} 1', metrics)
+        self.assertIn(f'library_db_queries_sum{labels} 1', metrics)
+        self.assertIn(f'library_response_size_bytes_sum{labels} {len(response.content)}', metrics)
+        self.assertIn(f'library_serializer_duration_seconds_count{labels} 1', metrics)
+        self.assertIn('library_db_queries_bucket{view="BookInfoAPIView",method="GET",le="+Inf"} 1', metrics)
+
+    def test_slow_request_log_includes_the_sql(self):
+        with self.assertLogs('api.slow_requests') as logs:
+            self.client.get('/api/book/')
+        self.assertIn('BookInfoAPIView', logs.output[0])
+        self.assertIn('FROM "api_book"', logs.output[0])
+
+    def test_metrics_endpoint_is_admin_only(self):
+        self.client.force_authenticate(self.make_user())
+        with self.assertLogs('api.slow_requests'):
+            self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+    async def test_async_views_are_measured(self):
+        with self.assertLogs('api.slow_requests'):
+            await self.async_client.get('/api/async/book/')
+        metrics = registry.render()
+        labels = '{view="AsyncBookInfoView",method="GET"}'
+        # The queries run on the sync_to_async thread, not the event loop's.
+        self.assertIn(f'library_db_queries_sum{labels} 1', metrics)
+        self.assertNotIn(f'library_db_duration_seconds_sum{labels} 0.0\n', metrics)
+
+    @override_settings(METRICS={'ENABLED': False})
+    def test_nothing_is_recorded_when_disabled(self):
+        self.client.get('/api/book/')
+        self.assertNotIn('BookInfoAPIView', registry.render())
+
+
+class BorrowHistoryTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.other = self.make_user("other")
+        today = date.today()
+        books = self.make_books(6)
+        # (days ago, returned, overdue)
+        self.borrows = [
+            Borrow.objects.create(
+                user=self.user, book=book,
+                borrow_date=today - timedelta(days=days),
+                due_date=today - timedelta(days=days) + timedelta(days=14),
+                return_date=today if returned else None,
+            )
+            for book, (days, returned) in zip(books, [(1, False), (3, True), (3, True), (20, False), (40, True)])
+        ]
+        Borrow.objects.create(user=self.other, book=books[5], borrow_date=today, due_date=today + timedelta(days=14))
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, **params):
+        rows, cursor = [], None
+        while True:
+            query = dict(params, page_size=2, **({'cursor': cursor} if cursor else {}))
+            page = self.client.get(url, query).json()
+            self.assertLessEqual(len(page['results']), 2)
+            rows += page['results']
+            cursor = page['next']
+            if cursor is None:
+                return rows
+
+    def expected_ids(self, borrows):
+        ordered = sorted(borrows, key=lambda b: (b.borrow_date, str(b.id)), reverse=True)
+        return [str(b.id) for b in ordered]
+
+    def test_history_reads_across_the_archive(self):
+        from .circulation import archive_returned_borrows
+        listings = [('/api/borrow/', {'status': status}) for status in ('', 'active', 'returned', 'overdue')]
+        before = [self.walk(url, **params) for url, params in listings]
+        before.append(self.client.get('/api/borrow/').json())
+
+        Borrow.objects.filter(return_date__isnull=False).update(return_date=date.today() - timedelta(days=400))
+        self.assertEqual(archive_returned_borrows(pause=0), 3)
+        self.assertEqual(Borrow.objects.filter(user=self.user).count(), 2)
+
+        after = [self.walk(url, **params) for url, params in listings]
+        after.append(self.client.get('/api/borrow/').json())
+        for rows in before[:-1]:
+            for row in rows:
+                row.pop('return_date', None)
+        self.assertEqual(after, before)
+
+    def test_history_is_paged_newest_first(self):
+        rows = self.walk('/api/borrow/')
+        self.assertEqual([row['id'] for row in rows], self.expected_ids(self.borrows))
+        self.assertEqual(rows[0]['book'], self.borrows[0].book.title)
+        self.assertEqual(self.client.get('/api/borrow/').json(), rows)
+
+    def test_status_filters(self):
+        active = [b for b in self.borrows if b.return_date is None]
+        returned = [b for b in self.borrows if b.return_date]
+        overdue = [self.borrows[3]]
+        for status, borrows in (('active', active), ('returned', returned), ('overdue', overdue)):
+            with self.subTest(status=status):
+                rows = self.walk('/api/borrow/', status=status)
+                self.assertEqual([row['id'] for row in rows], self.expected_ids(borrows))
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get('/api/borrow/', {'status': 'lost'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/borrow/', {'cursor': 'nope'}).status_code, 400)
+
+    def test_cursor_with_bad_values_is_rejected(self):
+        paginator = KeysetPaginator(('-borrow_date', '-id'))
+        self.client.force_authenticate(self.make_user("admin", is_staff=True))
+        for values in (['nodate', 'x'], [str(date.today()), 'x']):
+            cursor = paginator.encode_cursor(values)
+            for url in ('/api/borrow/', '/api/borrows/'):
+                with self.subTest(url=url, values=values):
+                    self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 400)
+
+    def test_staff_history_across_users(self):
+        self.assertEqual(self.client.get('/api/borrows/').status_code, 403)
+
+        self.client.force_authenticate(self.make_user("admin", is_staff=True))
+        rows = self.walk('/api/borrows/')
+        self.assertEqual(len(rows), 6)
+        self.assertEqual({row['username'] for row in rows}, {"reader", "other"})
+        returned = [row for row in rows if row['return_date']]
+        self.assertEqual(len(returned), 3)
+
+        rows = self.walk('/api/borrows/', user=str(self.other.id), status='active')
+        self.assertEqual([row['user'] for row in rows], [str(self.other.id)])
+        self.assertEqual(self.client.get('/api/borrows/', {'user': 'x'}).status_code, 400)
+
+    def test_staff_history_is_always_paged(self):
+        self.client.force_authenticate(self.make_user("admin", is_staff=True))
+        with mock.patch.object(KeysetPaginator, 'default_page_size', 4):
+            page = self.client.get('/api/borrows/').json()
+        self.assertEqual(len(page['results']), 4)
+        self.assertIsNotNone(page['next'])
+
+    def test_one_query_per_table_per_page(self):
+        self.client.force_authenticate(self.make_user("admin", is_staff=True))
+        with self.assertNumQueries(2):
+            self.client.get('/api/borrows/', {'page_size': 3, 'status': 'returned'})
+        # Open loans are never archived.
+        with self.assertNumQueries(1):
+            self.client.get('/api/borrows/', {'page_size': 3, 'status': 'active'})
+
+    async def test_async_history_matches(self):
+        token = RefreshToken.for_user(self.user).access_token
+        auth = {'Authorization': f"Bearer {token}"}
+        sync_page = await sync_to_async(lambda: self.client.get('/api/borrow/', {'page_size': 2}).json())()
+        response = await self.async_client.get('/api/async/borrow/', {'page_size': 2}, headers=auth)
+        self.assertEqual(response.json(), sync_page)
+
+
+class ValuesSerializerTests(LibraryTestCase):
+    def test_output_matches_the_model_serializers(self):
+        author = Author.objects.create(name="Ünïcode Author", bio="")
+        self.make_books(5, author=author)
+        Category.objects.create(name="Empty")
+        user = self.make_user()
+        for book in Book.objects.all()[:2]:
+            Borrow.objects.create(user=user, book=book, borrow_date=date(2024, 1, 2), due_date=date(2024, 1, 16))
+        pairs = [
+            (BorrowListSerializser, BorrowListValuesSerializer, Borrow.objects.select_related('book')),
+            (BookInfoSerializer, BookInfoValuesSerializer, Book.objects.select_related('author', 'category')),
+            (AuthorSerializer, AuthorValuesSerializer, Author.objects.all()),
+            (CategorySerializer, CategoryValuesSerializer, Category.objects.all()),
+        ]
+        for serializer, values_serializer, queryset in pairs:
+            with self.subTest(serializer=serializer.__name__):
+                expected = json.loads(json.dumps(serializer(queryset.order_by('pk'), many=True).data))
+                self.assertEqual(values_serializer.serialize(queryset.order_by('pk')), expected)
+
+    def test_paginated_book_list_is_unchanged(self):
+        self.make_books(5)
+        first = self.client.get('/api/book/', {'page_size': 2}).json()
+        second = self.client.get('/api/book/', {'page_size': 2, 'cursor': first['next']}).json()
+        expected = BookInfoSerializer(Book.objects.order_by('title', 'id')[2:4], many=True).data
+        self.assertEqual(second['results'], json.loads(json.dumps(expected)))
+
+
+class ListQueryBudgetTests(LibraryTestCase):
+    """
+    Every list endpoint runs a fixed number of queries however many rows it
+    returns. A serializer that starts following a relation per row makes the
+    500-row count differ from the 1-row count.
+    """
+
+    # (url, rows to seed, query budget); {book} is the id of self.book.
+    ENDPOINTS = [
+        ('/api/book/', 'books', 1),
+        ('/api/book/?page_size=200', 'books', 1),
+        ('/api/book/?author=Author&category=Category', 'books', 1),
+        ('/api/book/search/?q=Book&limit=100', 'books', 2),
+        ('/api/authors/', 'authors', 1),
+        ('/api/categories/', 'categories', 1),
+        ('/api/borrow/', 'borrows', 2),
+        ('/api/borrows/', 'borrows', 2),
+        ('/api/borrows/?status=active&page_size=200', 'borrows', 2),
+        ('/api/export/books/', 'books', 1),
+        ('/api/export/borrows/', 'borrows', 2),
+        ('/api/holds/', 'holds', 1),
+        ('/api/book/{book}/recommendations/', 'neighbours', 1),
+        # The async views resolve the token's user for the throttles.
+        ('/api/async/book/', 'books', 2),
+        ('/api/async/book/?page_size=200', 'books', 2),
+        ('/api/async/authors/', 'authors', 2),
+        ('/api/async/categories/', 'categories', 2),
+        ('/api/async/borrow/', 'borrows', 3),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user("admin", is_staff=True)
+        self.client.force_authenticate(self.user)
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.author = Author.objects.create(name="Author", bio="bio")
+        self.category = Category.objects.create(name="Category")
+        self.book = Book.objects.create(
+            title="Detail", description="description", author=self.author, category=self.category, total_copies=1,
+        )
+
+    def seed(self, kind, count):
+        if kind == 'books':
+            self.make_books(count, author=self.author, category=self.category)
+        elif kind == 'authors':
+            Author.objects.bulk_create([Author(name=f"Author {i}", bio="bio") for i in range(count)])
+        elif kind == 'categories':
+            Category.objects.bulk_create([Category(name=f"Category {i}") for i in range(count)])
+        elif kind == 'borrows':
+            books = self.make_books(count, author=self.author, category=self.category)
+            Borrow.objects.bulk_create([
+                Borrow(user=self.user, book=book, borrow_date=date.today(), due_date=date.today())
+                for book in books
+            ])
+        elif kind == 'neighbours':
+            start = BookNeighbour.objects.filter(book=self.book).count()
+            books = self.make_books(count, author=self.author, category=self.category)
+            BookNeighbour.objects.bulk_create([
+                BookNeighbour(book=self.book, neighbour=book, rank=start + rank, score=0.5)
+                for rank, book in enumerate(books, 1)
+            ])
+        elif kind == 'holds':
+            books = self.make_books(count, author=self.author, category=self.category, total_copies=0)
+            Hold.objects.bulk_create([Hold(user=self.user, book=book) for book in books])
+
+    def queries_for(self, url):
+        cache.clear()
+        catalog_cache.clear()
+        user_cache.clear()
+        response, queries = count_queries(self.client.get, url)
+        self.assertEqual(response.status_code, 200, url)
+        return queries
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for url, kind, budget in self.ENDPOINTS:
+            url = url.format(book=self.book.id)
+            with self.subTest(url=url):
+                sid = transaction.savepoint()
+                self.seed(kind, 1)
+                one = self.queries_for(url)
+                self.seed(kind, 499)
+                with query_budget(budget):
+                    many = self.queries_for(url)
+                self.assertEqual(
+                    len(one), len(many),
+                    "\n".join(query['sql'] for query in many[len(one):]) or url,
+                )
+                transaction.savepoint_rollback(sid)
+
+    def test_exceeding_the_budget_lists_the_queries(self):
+        with self.assertRaisesMessage(AssertionError, "2 queries executed, budget is 1"):
+            with query_budget(1):
+                Author.objects.count()
+                Category.objects.count()
+
+    @query_budget(1)
+    def test_book_detail_within_budget(self):
+        self.assertEqual(self.client.get(f'/api/book/{self.book.id}/').status_code, 200)
+
+
+@skipUnless(connection.vendor == 'sqlite', "SQLite specific")
+class SQLiteProductionProfileTests(SimpleTestCase):
+    def setUp(self):
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.addCleanup(lambda: [os.path.exists(p) and os.unlink(p) for p in (path, path + '-wal', path + '-shm')])
+        database = production_profile({'ENGINE': 'django.db.backends.sqlite3', 'NAME': path})
+        database['OPTIONS']['timeout'] = 0.05
+        # Aliases of their own: the test runner guards the project's aliases.
+        self.connections = ConnectionHandler({'default': {}, 'first': database, 'second': dict(database)})
+        self.addCleanup(self.connections.close_all)
+        patcher = mock.patch('django.db.transaction.connections', self.connections)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pragmas_are_set_on_every_connection(self):
+        expected = {
+            'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 50,
+            'mmap_size': 268435456, 'cache_size': -65536, 'temp_store': 2,
+        }
+        with self.connections['first'].cursor() as cursor:
+            for pragma, value in expected.items():
+                cursor.execute(f"PRAGMA {pragma}")
+                self.assertEqual(cursor.fetchone()[0], value, pragma)
+
+    def test_write_transactions_take_the_lock_up_front(self):
+        first, second = self.connections['first'], self.connections['second']
+        with first.cursor() as cursor:
+            cursor.execute("CREATE TABLE t (x)")
+        with transaction.atomic(using='first'):
+            with self.assertRaisesMessage(OperationalError, "database is locked"):
+                with transaction.atomic(using='second'):
+                    pass
+            # WAL readers do not wait for the writer.
+            with second.cursor() as cursor:
+                cursor.execute("SELECT count(*) FROM t")
+                self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class CatalogView:
+    replica_reads = True
+
+
+class AccountView:
+    pass
+
+
+@override_settings(
+    DATABASE_REPLICAS={'replica_a': 3, 'replica_b': 1, 'replica_off': 0},
+    REPLICA_ROUTING={'STICKY_SECONDS': 10, 'HEALTH_CHECK_SECONDS': 5, 'RETRY_SECONDS': 30},
+)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        self.connections = {alias: mock.MagicMock() for alias in ('replica_a', 'replica_b', 'replica_off')}
+        patcher = mock.patch('api.routers.connections', mock.MagicMock(
+            __getitem__=lambda _, alias: self.connections.get(alias, connection),
+        ))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        replica_pool.reset()
+
+    def handle(self, request, view, write=False, read=None):
+        """
+        Run ``request`` through the middleware; the "view" reads a model
+        (through ``read(read_alias)`` if given), optionally writes first, and
+        reports the alias the read went to.
+        """
+        seen = {}
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            if write:
+                self.router.db_for_write(Book)
+            read_alias = lambda: self.router.db_for_read(Book)
+            seen['read'] = read(read_alias) if read else read_alias()
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        response = middleware(request)
+        return seen['read'], response
+
+    def test_weighted_choice_among_replicas(self):
+        pool = ReplicaPool()
+        random_state = random.getstate()
+        random.seed(7)
+        picks = Counter(pool.choose() for _ in range(4000))
+        random.setstate(random_state)
+        self.assertEqual(set(picks), {'replica_a', 'replica_b'})
+        self.assertAlmostEqual(picks['replica_a'] / 4000, 0.75, delta=0.05)
+
+    def test_failing_replica_is_skipped_until_retry(self):
+        pool = ReplicaPool()
+        self.connections['replica_a'].cursor.side_effect = OperationalError
+        with mock.patch('api.routers.time.monotonic', return_value=100):
+            self.assertEqual({pool.choose() for _ in range(50)}, {'replica_b'})
+        self.assertEqual(self.connections['replica_a'].cursor.call_count, 1)
+
+        self.connections['replica_a'].cursor.side_effect = None
+        with mock.patch('api.routers.time.monotonic', return_value=131):
+            self.assertIn('replica_a', {pool.choose() for _ in range(50)})
+
+    def test_primary_when_every_replica_is_down(self):
+        for alias in self.connections:
+            self.connections[alias].cursor.side_effect = OperationalError
+        self.assertEqual(ReplicaPool().choose(), 'default')
+
+    def test_missing_sqlite_replica_is_unhealthy(self):
+        with tempfile.TemporaryDirectory() as location:
+            missing = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(location, 'missing.sqlite3')}
+            self.connections['replica_a'] = ConnectionHandler({'default': {}, 'replica_a': missing})['replica_a']
+            try:
+                self.assertFalse(ReplicaPool().healthy('replica_a', time.monotonic()))
+            finally:
+                self.connections['replica_a'].close()
+
+    def test_only_safe_reads_of_opted_in_views_use_replicas(self):
+        self.assertIn(self.handle(self.factory.get('/'), CatalogView)[0], {'replica_a', 'replica_b'})
+        self.assertEqual(self.handle(self.factory.get('/'), AccountView)[0], 'default')
+        self.assertEqual(self.handle(self.factory.post('/'), CatalogView)[0], 'default')
+        self.assertEqual(self.handle(self.factory.get('/'), CatalogView, write=True)[0], 'default')
+        self.assertEqual(self.router.db_for_read(Book), 'default')
+
+    def test_catalog_cache_misses_use_the_primary_after_a_change(self):
+        catalog = CatalogCache(LRUCache(), DjangoCache())
+        read = lambda read_alias: catalog.get_or_set(str(uuid.uuid4()), read_alias)[0]
+        # A cold miss on a catalog that did not change is served by a replica.
+        self.assertIn(self.handle(self.factory.get('/'), CatalogView, read=read)[0], {'replica_a', 'replica_b'})
+
+        change_markers.touch('book')
+        self.assertEqual(self.handle(self.factory.get('/'), CatalogView, read=read)[0], 'default')
+        # Later reads in the same request still use the replica.
+        read_after = lambda read_alias: (read(read_alias), read_alias())[1]
+        self.assertNotEqual(self.handle(self.factory.get('/'), CatalogView, read=read_after)[0], 'default')
+        with mock.patch('api.routers.time.time', return_value=time.time() + 11):
+            self.assertNotEqual(self.handle(self.factory.get('/'), CatalogView, read=read)[0], 'default')
+
+    @override_settings(CATALOG_CACHE={'SINGLE_WORKER': True})
+    def test_recently_changed_tables_are_validated_against_the_primary(self):
+        class View:
+            @conditional_get('author')
+            def get(self, request, read_alias):
+                return HttpResponse(read_alias())
+
+        change_markers.touch('author')
+        read = lambda read_alias: View().get(self.factory.get('/'), read_alias).content.decode()
+        self.assertEqual(self.handle(self.factory.get('/'), CatalogView, read=read)[0], 'default')
+        with mock.patch('api.routers.time.time', return_value=time.time() + 11):
+            self.assertNotEqual(self.handle(self.factory.get('/'), CatalogView, read=read)[0], 'default')
+
+    def test_clients_read_their_writes(self):
+        auth = {'HTTP_AUTHORIZATION': 'Bearer token-1'}
+        _, response = self.handle(self.factory.post('/', **auth), AccountView, write=True)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        # Pinned by the token even without the cookie, and by the cookie alone.
+        self.assertEqual(self.handle(self.factory.get('/', **auth), CatalogView)[0], 'default')
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.handle(request, CatalogView)[0], 'default')
+
+        other = {'HTTP_AUTHORIZATION': 'Bearer token-2'}
+        self.assertNotEqual(self.handle(self.factory.get('/', **other), CatalogView)[0], 'default')
+
+    @override_settings(DATABASE_REPLICAS={})
+    def test_no_replicas_configured(self):
+        read, response = self.handle(self.factory.post('/'), CatalogView, write=True)
+        self.assertEqual(read, 'default')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.handle(self.factory.get('/'), CatalogView)[0], 'default')
+
+
+class AsyncReadEndpointTests(LibraryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.books = self.make_books(3)
+        Borrow.objects.create(user=self.user, book=self.books[0], borrow_date=date.today(), due_date=date.today())
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'headers': {'Authorization': f"Bearer {token}"}}
+
+    async def test_book_endpoints_match_the_sync_views(self):
+        sync_list = await sync_to_async(lambda: self.client.get('/api/book/').json())()
+        response = await self.async_client.get('/api/async/book/')
+        self.assertEqual(response.json(), sync_list)
+
+        page = (await self.async_client.get('/api/async/book/', {'page_size': 2})).json()
+        self.assertEqual(len(page['results']), 2)
+        self.assertIsNotNone(page['next'])
+
+        response = await self.async_client.get(f'/api/async/book/{self.books[1].id}/')
+        self.assertEqual(response.json()['title'], self.books[1].title)
+
+    async def test_throttles_are_shared_with_the_sync_views(self):
+        self.addCleanup(SlidingWindowRateThrottle.blocked.clear)
+        for _ in range(10):
+            await sync_to_async(self.client.get)('/api/book/')
+        for _ in range(10):
+            self.assertEqual((await self.async_client.get('/api/async/book/')).status_code, 200)
+        response = await self.async_client.get('/api/async/book/')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(response.has_header('Retry-After'))
+
+    @override_settings(CATALOG_CACHE={'SINGLE_WORKER': True})
+    async def test_catalog_cache_and_conditional_get(self):
+        first = await self.async_client.get('/api/async/book/')
+        second = await self.async_client.get('/api/async/book/', headers={'If-None-Match': first['ETag']})
+        self.assertEqual((first['X-Cache'], second.status_code), ('MISS', 304))
+        response = await self.async_client.get('/api/async/book/', {'author': 'Author'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        response = await self.async_client.get('/api/async/book/', {'author': 'Author'})
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        await sync_to_async(UserAccount.objects.filter(pk=self.user.pk).update)(is_staff=True)
+        user_cache.clear()
+        auth = {'Authorization': self.auth['headers']['Authorization']}
+        etag = (await self.async_client.get('/api/async/authors/', headers=auth))['ETag']
+        response = await self.async_client.get('/api/async/authors/', headers=dict(auth, **{'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 304)
+
+    async def test_authenticated_endpoints(self):
+        response = await self.async_client.get('/api/async/borrow/')
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.async_client.get('/api/async/borrow/', **self.auth)
+        self.assertEqual([row['book'] for row in response.json()], [self.books[0].title])
+
+        response = await self.async_client.get(f'/api/async/users/{self.user.id}/penalties/', **self.auth)
+        self.assertEqual(response.json()['penalty_point'], 0)
+
+        response = await self.async_client.get('/api/async/authors/', **self.auth)
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,85 @@
+from django.conf import settings
+from rest_framework import throttling
+
+from .cache import DjangoCache, LRUCache
+
+
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    """
+    Sliding-window rate limit built from two fixed-size counters.
+
+    DRF's throttles keep the full request history per client in the cache,
+    so every check reads, unpickles and rewrites a list that grows with the
+    rate. Here each client has one integer counter per window, incremented
+    atomically in the shared ``THROTTLE_CACHE``. The request count over the
+    last ``duration`` seconds is estimated as the previous window's count,
+    weighted by how much of it still overlaps, plus the current count.
+
+    Once a client is over the limit, this process remembers until when, and
+    rejects further requests from it without touching the shared cache.
+    """
+
+    cache = DjangoCache(getattr(settings, 'THROTTLE_CACHE', 'default'))
+    blocked = LRUCache(max_entries=10000)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        blocked_until = self.blocked.get(self.key)
+        if blocked_until is not None and blocked_until > self.now:
+            self.retry_after = blocked_until - self.now
+            return False
+
+        window, offset = divmod(self.now, self.duration)
+        elapsed = offset / self.duration
+        current_key = f"{self.key}:{int(window)}"
+        current = self.increment(current_key)
+        previous = self.cache.get(f"{self.key}:{int(window) - 1}", 0)
+
+        if previous * (1 - elapsed) + current <= self.num_requests:
+            return True
+
+        # Rejected requests do not count against the client.
+        self.cache.decr(current_key)
+        self.retry_after = self.retry_delay(previous, current - 1, elapsed)
+        self.blocked.set(self.key, self.now + self.retry_after, self.retry_after)
+        return False
+
+    def increment(self, key):
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            # Counters outlive their window by one window, while they are
+            # still needed as the "previous" count.
+            if self.cache.add(key, 1, int(self.duration * 2) + 1):
+                return 1
+            return self.cache.incr(key)
+
+    def retry_delay(self, previous, current, elapsed):
+        """
+        Seconds until the estimate leaves room for one more request.
+        """
+        room = self.num_requests - 1
+        if current <= room and previous:
+            needed = 1 - (room - current) / previous
+            return max((needed - elapsed) * self.duration, 0.001)
+        # The current window alone is full; wait until enough of it slides out.
+        needed = 1 - room / current if current else 0
+        return (1 - elapsed + needed) * self.duration
+
+    def wait(self):
+        return self.retry_after
+
+
+class UserRateThrottle(SlidingWindowRateThrottle, throttling.UserRateThrottle):
+    pass
+
+
+class AnonRateThrottle(SlidingWindowRateThrottle, throttling.AnonRateThrottle):
+    pass
@@ -3,11 +3,27 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from .views import (
     UserRegistrationAPIView,
     BookInfoAPIView,
+    BookSearchAPIView,
+    BookRecommendationsAPIView,
     AuthorsAPIView,
     CategoryAPIView,
     BorrowBookAPIView,
+    BorrowHistoryAPIView,
     BookReturnAPIView,
+    BatchBorrowAPIView,
+    BatchReturnAPIView,
+    HoldAPIView,
     GetPenaltiesInfoAPIView,
+    BookExportAPIView,
+    BorrowExportAPIView,
+    MetricsAPIView,
+)
+from .async_views import (
+    AsyncBookInfoView,
+    AsyncAuthorsView,
+    AsyncCategoryView,
+    AsyncBorrowListView,
+    AsyncPenaltiesInfoView,
 )
 
 urlpatterns = [
@@ -16,12 +32,32 @@ urlpatterns = [
 
     path('book/', BookInfoAPIView.as_view()),
     path('book/<uuid:id>/', BookInfoAPIView.as_view()),
+    path('book/search/', BookSearchAPIView.as_view()),
+    path('book/<uuid:id>/recommendations/', BookRecommendationsAPIView.as_view()),
 
     path('authors/', AuthorsAPIView.as_view()),
     path('categories/', CategoryAPIView.as_view()),
 
     path('borrow/', BorrowBookAPIView.as_view()),
+    path('borrows/', BorrowHistoryAPIView.as_view()),
     path('return/', BookReturnAPIView.as_view()),
+    path('borrow/batch/', BatchBorrowAPIView.as_view()),
+    path('return/batch/', BatchReturnAPIView.as_view()),
+    path('holds/', HoldAPIView.as_view()),
+    path('holds/<uuid:id>/', HoldAPIView.as_view()),
 
     path('users/<uuid:id>/penalties/', GetPenaltiesInfoAPIView.as_view()),
+
+    path('export/books/', BookExportAPIView.as_view()),
+    path('export/borrows/', BorrowExportAPIView.as_view()),
+
+    path('metrics/', MetricsAPIView.as_view()),
+
+    # Async read endpoints for the ASGI deployment (same payloads as above).
+    path('async/book/', AsyncBookInfoView.as_view()),
+    path('async/book/<uuid:id>/', AsyncBookInfoView.as_view()),
+    path('async/authors/', AsyncAuthorsView.as_view()),
+    path('async/categories/', AsyncCategoryView.as_view()),
+    path('async/borrow/', AsyncBorrowListView.as_view()),
+    path('async/users/<uuid:id>/penalties/', AsyncPenaltiesInfoView.as_view()),
 ]
\ No newline at end of file
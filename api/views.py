@@ -1,3 +1,4 @@
+from django.http import HttpResponse
 from django.shortcuts import render, get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
@@ -5,15 +6,45 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.db import transaction
 from django.contrib.auth import get_user_model
-from datetime import date, timedelta
-from .models import Book, Author, Category, Borrow
+import uuid
+from datetime import date
+from urllib.parse import urlencode
+from .models import Book, Author, Category, Borrow, BookNeighbour, Hold
+from .pagination import KeysetPaginator, InvalidCursor
+from .search import search_books
+from .cache import catalog_cache
+from .conditional import conditional_get
+from .exports import book_export, borrow_export, EXPORT_FORMATS
+from .metrics import registry
+from .circulation import (
+    borrow_book,
+    borrow_books,
+    borrow_history,
+    cancel_hold,
+    merge_history,
+    place_hold,
+    return_books,
+    add_penalty_points,
+    release_borrow_slots,
+    release_copies,
+    with_queue_position,
+    BorrowError,
+    OPEN_HOLDS,
+    MAX_BATCH_SIZE,
+)
 from .serializers import (
     UserRegistrationSerializer, 
     BookInfoSerializer,
+    BookInfoValuesSerializer,
     AuthorSerializer,
+    AuthorValuesSerializer,
     CategorySerializer,
+    CategoryValuesSerializer,
     BookCreateSerializer,
-    BorrowListSerializser,
+    BookNeighbourValuesSerializer,
+    BorrowListValuesSerializer,
+    BorrowHistoryValuesSerializer,
+    HoldValuesSerializer,
     PenaltyPointSerializer,
 )
 
@@ -31,27 +62,57 @@ class UserRegistrationAPIView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+BOOK_LIST_PARAMS = ("author", "category", "cursor", "page_size")
+
+
+def book_list_key(params):
+    return "books:" + urlencode(sorted((k, v) for k, v in params.items() if v is not None))
+
+
 class BookInfoAPIView(APIView):
     permission_classes = [AllowAny]
+    replica_reads = True
 
+    @conditional_get('book', 'author', 'category')
     def get(self, request, id=None):
         if id:
-            book = Book.objects.filter(id=id).first()
-            if not book:
+            data, hit = catalog_cache.get_or_set(f"book:{id}", lambda: self.book_detail(id))
+            if data is None:
                 return Response({"msg": "no book found"}, status=status.HTTP_404_NOT_FOUND)
-            serializer = BookInfoSerializer(book)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-
-        author = request.query_params.get("author")
-        category = request.query_params.get("category")
+            return self.cached_response(data, hit)
+
+        params = {key: request.query_params.get(key) for key in BOOK_LIST_PARAMS}
+        try:
+            data, hit = catalog_cache.get_or_set(book_list_key(params), lambda: self.book_list(**params))
+        except InvalidCursor:
+            return Response({"msg": "invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+        return self.cached_response(data, hit)
+
+    def cached_response(self, data, hit):
+        response = Response(data, status=status.HTTP_200_OK)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+    def book_detail(self, id):
+        book = Book.objects.select_related('author', 'category').filter(id=id).first()
+        if not book:
+            return None
+        return dict(BookInfoSerializer(book).data)
 
+    def book_list(self, author=None, category=None, cursor=None, page_size=None):
         books = Book.objects.all()
         if author:
             books = books.filter(author__name__icontains=author)
         if category:
             books = books.filter(category__name__icontains=category)
-        serializer = BookInfoSerializer(books, many=True) 
-        return Response(serializer.data)
+
+        if cursor is None and page_size is None:
+            return BookInfoValuesSerializer.serialize(books)
+
+        paginator = KeysetPaginator(ordering=('title', 'id'), page_size=page_size)
+        rows = BookInfoValuesSerializer.serialize(paginator.page_queryset(books, cursor))
+        results, next_cursor = paginator.page(rows)
+        return {"results": results, "next": next_cursor}
     
     def post(self, request):
         if not request.user.is_authenticated or not request.user.is_staff:
@@ -74,13 +135,43 @@ class BookInfoAPIView(APIView):
         
 
 
+class BookSearchAPIView(APIView):
+    permission_classes = [AllowAny]
+    replica_reads = True
+
+    def get(self, request):
+        query = request.query_params.get("q", "")
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 20)), 100))
+        except ValueError:
+            return Response({"msg": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+
+        books = search_books(query, limit)
+        serializer = BookInfoSerializer(books, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class BookRecommendationsAPIView(APIView):
+    """
+    "Readers also borrowed": the book's precomputed neighbours, best first.
+    Empty until ``api.tasks.compute_recommendations`` has run.
+    """
+    permission_classes = [AllowAny]
+    replica_reads = True
+
+    def get(self, request, id):
+        neighbours = BookNeighbour.objects.filter(book_id=id).order_by('rank')
+        return Response(BookNeighbourValuesSerializer.serialize(neighbours), status=status.HTTP_200_OK)
+
+
 class AuthorsAPIView(APIView):
     permission_classes = [IsAdminUser]
+    replica_reads = True
 
+    @conditional_get('author')
     def get(self, request):
-        authors = Author.objects.all()
-        serializer = AuthorSerializer(authors, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        authors = AuthorValuesSerializer.serialize(Author.objects.all())
+        return Response(authors, status=status.HTTP_200_OK)
 
     def post(self, request):
         serializer = AuthorSerializer(data=request.data)
@@ -93,11 +184,12 @@ class AuthorsAPIView(APIView):
 
 class CategoryAPIView(APIView):
     permission_classes = [IsAdminUser]
+    replica_reads = True
 
+    @conditional_get('category')
     def get(self, request):
-        categories = Category.objects.all()
-        serializer = CategorySerializer(categories, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        categories = CategoryValuesSerializer.serialize(Category.objects.all())
+        return Response(categories, status=status.HTTP_200_OK)
     
     def post(self, request):
         serializer = CategorySerializer(data=request.data)
@@ -111,42 +203,104 @@ class BorrowBookAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        borrow = Borrow.objects.filter(user=request.user)
-
-        serializer = BorrowListSerializser(borrow, many=True)
-
-        if serializer:
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response({"msg": "no borrow data found"}, status=status.HTTP_404_NOT_FOUND)
+        return borrow_history_response(request, {'user_id': request.user.pk}, BorrowListValuesSerializer)
 
     def post(self, request):
         book_id = request.data.get('book_id')
 
         if not book_id:
             return Response({"msg": "book_id is required"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        book = get_object_or_404(Book, id=book_id)
 
-        current_borrow = Borrow.objects.filter(user=request.user, return_date__isnull=True).count()
+        try:
+            borrow_book(request.user, book_id)
+        except BorrowError as e:
+            return Response({"msg": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        if current_borrow >= 3:
-            return Response({"msg": "can't borrow book. borrow limit reached"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"msg": "borrow info added"}, status=status.HTTP_200_OK)
 
-        if book.available_copies < 1:
-            return Response({"msg": "this book is currenlty unavailable"}, status=status.HTTP_400_BAD_REQUEST)
 
-        with transaction.atomic():
-            book.available_copies -= 1
-            book.save()
+def borrow_history_response(request, filters, serializer, paged=False):
+    params = {
+        key: request.query_params.get(key)
+        for key in ("status", "cursor", "page_size")
+    }
+    try:
+        querysets, paginator = borrow_history(filters, paged=paged, **params)
+        rows = merge_history([serializer.serialize(queryset) for queryset in querysets], paginator)
+    except BorrowError as e:
+        return Response({"msg": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except InvalidCursor:
+        return Response({"msg": "invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
 
-            borrow = Borrow.objects.create(
-                user=request.user,
-                book=book,
-                borrow_date=date.today(),
-                due_date=date.today() + timedelta(days=14)
-            )
+    if paginator is None:
+        return Response(rows, status=status.HTTP_200_OK)
+    results, next_cursor = paginator.page(rows)
+    return Response({"results": results, "next": next_cursor}, status=status.HTTP_200_OK)
 
-        return Response({"msg": "borrow info added"}, status=status.HTTP_200_OK)
+
+class BorrowHistoryAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        filters = {}
+        user_id = request.query_params.get("user")
+        if user_id:
+            try:
+                filters['user_id'] = uuid.UUID(user_id)
+            except ValueError:
+                return Response({"msg": "user must be a user id"}, status=status.HTTP_400_BAD_REQUEST)
+        # Unlike the per-user /api/borrow/, always one page at a time.
+        return borrow_history_response(request, filters, BorrowHistoryValuesSerializer, paged=True)
+
+
+def get_batch_ids(request, key):
+    ids = request.data.get(key)
+    if not isinstance(ids, list) or not ids:
+        return None, Response({"msg": f"{key} must be a non-empty list"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > MAX_BATCH_SIZE:
+        return None, Response({"msg": f"at most {MAX_BATCH_SIZE} items per batch"}, status=status.HTTP_400_BAD_REQUEST)
+    return ids, None
+
+
+class BatchBorrowAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        book_ids, error = get_batch_ids(request, 'book_ids')
+        if error:
+            return error
+
+        user = request.user
+        user_id = request.data.get('user_id')
+        if user_id:
+            if not request.user.is_staff:
+                return Response({"msg": "only admin users can borrow for another user"}, status=status.HTTP_403_FORBIDDEN)
+            try:
+                user_id = uuid.UUID(str(user_id))
+            except ValueError:
+                return Response({"msg": "invalid user_id"}, status=status.HTTP_400_BAD_REQUEST)
+            user = get_object_or_404(User, id=user_id)
+
+        try:
+            results = borrow_books(user, book_ids)
+        except BorrowError as e:
+            return Response({"msg": str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+class BatchReturnAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        borrow_ids, error = get_batch_ids(request, 'borrow_ids')
+        if error:
+            return error
+
+        try:
+            results = return_books(request.user, borrow_ids)
+        except BorrowError as e:
+            return Response({"msg": str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({"results": results}, status=status.HTTP_200_OK)
 
 
 class BookReturnAPIView(APIView):
@@ -154,7 +308,6 @@ class BookReturnAPIView(APIView):
 
     def post(self, request):
         borrow_id = request.data.get('borrow_id')
-        user = request.user
 
         if not borrow_id:
             return Response({"msg": "borrow_id required to return a book"}, status=status.HTTP_400_BAD_REQUEST)
@@ -166,30 +319,92 @@ class BookReturnAPIView(APIView):
 
         with transaction.atomic():
             today = date.today()
-            borrow.return_date = today
-            borrow.save()
+            closed = Borrow.objects.filter(id=borrow.id, return_date__isnull=True).update(return_date=today)
+            if not closed:
+                return Response({"msg": "book already returned"}, status=status.HTTP_400_BAD_REQUEST)
+            release_borrow_slots({borrow.user_id: 1})
 
-            date_differ = (today - borrow.due_date).days
+            if borrow.due_date < today:
+                add_penalty_points({borrow.user_id: 1})
 
-            if date_differ > 0:
-                user.penalty_point += 1
-                user.save()
-            
-            borrow.book.total_copies += 1
-            borrow.book.save()
+            release_copies({borrow.book_id: 1})
 
 
         return Response({"msg": "book returned successfull"}, status=status.HTTP_200_OK)
     
+class HoldAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        holds = with_queue_position(
+            Hold.objects.filter(user_id=request.user.pk, status__in=OPEN_HOLDS)
+        ).order_by('created_at', 'id')
+        return Response(HoldValuesSerializer.serialize(holds), status=status.HTTP_200_OK)
+
+    def post(self, request):
+        book_id = request.data.get('book_id')
+
+        if not book_id:
+            return Response({"msg": "book_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            book_id = uuid.UUID(str(book_id))
+        except ValueError:
+            return Response({"msg": "invalid book_id"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            hold = place_hold(request.user, book_id)
+        except BorrowError as e:
+            return Response({"msg": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        position = with_queue_position(Hold.objects.filter(id=hold.id)).values_list('position', flat=True).get()
+        return Response(
+            {"msg": "hold placed", "hold_id": str(hold.id), "position": position},
+            status=status.HTTP_200_OK,
+        )
+
+    def delete(self, request, id):
+        try:
+            cancel_hold(request.user, id)
+        except BorrowError as e:
+            return Response({"msg": str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({"msg": "hold cancelled"}, status=status.HTTP_200_OK)
+
+
 class GetPenaltiesInfoAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, id):
         req_user = request.user
-        user = User.objects.get(id=id)
-
-        if not (req_user.is_staff or req_user == user):
+        if not (req_user.is_staff or req_user.pk == id):
             return Response({"error": "Permission denied"}, status=status.HTTP_403_FORBIDDEN)
-    
+
+        # request.user may come from the user cache; penalties are read fresh.
+        user = get_object_or_404(User, id=id)
         serializer = PenaltyPointSerializer(user)
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class ExportAPIView(APIView):
+    permission_classes = [IsAdminUser]
+    export = None
+
+    def get(self, request):
+        fmt = request.query_params.get("output", "ndjson")
+        if fmt not in EXPORT_FORMATS:
+            return Response({"msg": "output must be ndjson or csv"}, status=status.HTTP_400_BAD_REQUEST)
+        return self.export(fmt)
+
+
+class BookExportAPIView(ExportAPIView):
+    export = staticmethod(book_export)
+
+
+class BorrowExportAPIView(ExportAPIView):
+    export = staticmethod(borrow_export)
+
+
+class MetricsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,309 @@
+"""
+End-to-end benchmark of every route in api/urls.py.
+
+Seeds a synthetic library with the ``seed_library`` command, then drives each
+endpoint in-process through DRF's test client with real JWT authentication.
+For every endpoint it records p50/p95/p99 latency, queries per request and
+throughput, and writes the results to a JSON file so runs of different
+versions can be diffed.
+
+    python -m benchmarks.api_endpoints --books 100000 --users 20000 --requests 200
+    python -m benchmarks.api_endpoints --db library.sqlite3 --no-seed --output before.json
+"""
+import argparse
+import importlib.util
+import json
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from benchmarks.common import benchmark_settings, percentiles, setup_django
+
+
+class Scenario:
+    """
+    One endpoint under test. ``build(ctx, i)`` returns the
+    ``(path, data, user)`` of the i-th request; ``user`` may be None.
+    """
+
+    def __init__(self, name, route, method, build, expect=(200,)):
+        self.name = name
+        self.route = route
+        self.method = method
+        self.build = build
+        self.expect = expect
+
+
+def scenarios():
+    return [
+        Scenario('register', 'register/', 'post', lambda ctx, i: (
+            '/api/register/',
+            {'email': f"new.{ctx.run}.{i}@example.com", 'username': f"n{ctx.run}{i}"[:12], 'password': "password"},
+            None,
+        )),
+        Scenario('login', 'login/', 'post', lambda ctx, i: (
+            '/api/login/', {'email': ctx.patron(i).email, 'password': "password"}, None,
+        )),
+        Scenario('book_list', 'book/', 'get', lambda ctx, i: (
+            '/api/book/', {'page_size': 50}, None,
+        )),
+        Scenario('book_list_filtered', 'book/', 'get', lambda ctx, i: (
+            '/api/book/', {'category': ctx.rng.choice(ctx.category_names)}, None,
+        )),
+        Scenario('book_detail', 'book/<uuid:id>/', 'get', lambda ctx, i: (
+            f'/api/book/{ctx.rng.choice(ctx.book_ids)}/', None, None,
+        )),
+        Scenario('book_recommendations', 'book/<uuid:id>/recommendations/', 'get', lambda ctx, i: (
+            f'/api/book/{ctx.rng.choice(ctx.recommended_ids or ctx.book_ids)}/recommendations/', None, None,
+        )),
+        Scenario('book_search', 'book/search/', 'get', lambda ctx, i: (
+            '/api/book/search/', {'q': ctx.rng.choice(["river", "night garden", "mem*", "ocean"])}, None,
+        )),
+        Scenario('authors', 'authors/', 'get', lambda ctx, i: ('/api/authors/', None, ctx.admin)),
+        Scenario('categories', 'categories/', 'get', lambda ctx, i: ('/api/categories/', None, ctx.admin)),
+        Scenario('borrow', 'borrow/', 'post', lambda ctx, i: (
+            '/api/borrow/', {'book_id': str(ctx.available_book(i))}, ctx.patron(i),
+        )),
+        Scenario('borrow_list', 'borrow/', 'get', lambda ctx, i: ('/api/borrow/', None, ctx.patron(i))),
+        Scenario('borrow_history_page', 'borrow/', 'get', lambda ctx, i: (
+            '/api/borrow/', {'page_size': 20, 'status': 'returned'}, ctx.patron(i),
+        )),
+        Scenario('staff_borrow_history', 'borrows/', 'get', lambda ctx, i: (
+            '/api/borrows/', {'page_size': 50, 'status': ctx.rng.choice(['active', 'overdue', 'returned'])}, ctx.admin,
+        )),
+        Scenario('return', 'return/', 'post', lambda ctx, i: (
+            '/api/return/', {'borrow_id': str(ctx.open_borrow(i))}, ctx.patron(i),
+        )),
+        Scenario('borrow_batch', 'borrow/batch/', 'post', lambda ctx, i: (
+            '/api/borrow/batch/',
+            {'book_ids': [str(ctx.available_book(i * 3 + n)) for n in range(3)]},
+            ctx.patron(i),
+        )),
+        Scenario('return_batch', 'return/batch/', 'post', lambda ctx, i: (
+            '/api/return/batch/', {'borrow_ids': [str(b) for b in ctx.open_borrows(i)]}, ctx.patron(i),
+        )),
+        Scenario('hold_place', 'holds/', 'post', lambda ctx, i: (
+            '/api/holds/', {'book_id': str(ctx.held_book(i))}, ctx.patron(i),
+        )),
+        Scenario('hold_list', 'holds/', 'get', lambda ctx, i: ('/api/holds/', None, ctx.patron(i))),
+        Scenario('hold_cancel', 'holds/<uuid:id>/', 'delete', lambda ctx, i: (
+            f'/api/holds/{ctx.open_hold(i)}/', None, ctx.patron(i),
+        )),
+        Scenario('penalties', 'users/<uuid:id>/penalties/', 'get', lambda ctx, i: (
+            f'/api/users/{ctx.patron(i).id}/penalties/', None, ctx.patron(i),
+        )),
+        Scenario('export_books', 'export/books/', 'get', lambda ctx, i: ('/api/export/books/', None, ctx.admin)),
+        Scenario('export_borrows', 'export/borrows/', 'get', lambda ctx, i: (
+            '/api/export/borrows/', {'output': 'csv'}, ctx.admin,
+        )),
+        Scenario('metrics', 'metrics/', 'get', lambda ctx, i: ('/api/metrics/', None, ctx.admin)),
+        Scenario('async_book_list', 'async/book/', 'get', lambda ctx, i: (
+            '/api/async/book/', {'page_size': 50}, None,
+        )),
+        Scenario('async_book_detail', 'async/book/<uuid:id>/', 'get', lambda ctx, i: (
+            f'/api/async/book/{ctx.rng.choice(ctx.book_ids)}/', None, None,
+        )),
+        Scenario('async_authors', 'async/authors/', 'get', lambda ctx, i: ('/api/async/authors/', None, ctx.admin)),
+        Scenario('async_categories', 'async/categories/', 'get', lambda ctx, i: (
+            '/api/async/categories/', None, ctx.admin,
+        )),
+        Scenario('async_borrow_list', 'async/borrow/', 'get', lambda ctx, i: (
+            '/api/async/borrow/', None, ctx.patron(i),
+        )),
+        Scenario('async_penalties', 'async/users/<uuid:id>/penalties/', 'get', lambda ctx, i: (
+            f'/api/async/users/{ctx.patron(i).id}/penalties/', None, ctx.patron(i),
+        )),
+    ]
+
+
+class Context:
+    def __init__(self, requests, seed):
+        from django.contrib.auth.hashers import make_password
+        from api.models import Author, Book, BookNeighbour, Category, UserAccount
+
+        self.rng = random.Random(seed)
+        self.run = f"{self.rng.getrandbits(20):x}"
+        self.book_ids = list(Book.objects.values_list('id', flat=True)[:5000])
+        self.recommended_ids = list(
+            BookNeighbour.objects.filter(rank=1).values_list('book_id', flat=True)[:5000]
+        )
+        self.category_names = list(Category.objects.values_list('name', flat=True))
+        self.available = list(
+            Book.objects.filter(available_copies__gt=0)
+            .order_by('-available_copies').values_list('id', flat=True)[:requests * 3]
+        )
+        # Holds can only be placed on books with no copy on the shelf.
+        self.held = list(Book.objects.filter(available_copies=0).values_list('id', flat=True)[:requests])
+        if not self.held:
+            self.held = [Book.objects.create(
+                title=f"Bench hold {self.run}", description="benchmark", total_copies=0,
+                author=Author.objects.first(), category=Category.objects.first(),
+            ).id]
+
+        # Dedicated patrons with no open borrows, one per request, so the
+        # write scenarios never run into the borrow limit.
+        password = make_password("password")
+        self.patrons = UserAccount.objects.bulk_create([
+            UserAccount(
+                email=f"bench.{self.run}.{i}@example.com",
+                username=f"b{self.run}{i}"[:12],
+                password=password,
+            )
+            for i in range(requests)
+        ])
+
+        self.admin = UserAccount.objects.create_superuser(
+            email=f"bench.admin.{self.run}@example.com", username=f"a{self.run}"[:12], password="password",
+        )
+        self.tokens = {}
+
+    def patron(self, i):
+        return self.patrons[i % len(self.patrons)]
+
+    def available_book(self, i):
+        return self.available[i % len(self.available)]
+
+    def open_borrows(self, i):
+        from api.models import Borrow
+        return list(
+            Borrow.objects.filter(user=self.patron(i), return_date__isnull=True)
+            .values_list('id', flat=True)
+        )
+
+    def open_borrow(self, i):
+        return self.open_borrows(i)[0]
+
+    def held_book(self, i):
+        return self.held[i % len(self.held)]
+
+    def open_hold(self, i):
+        from api.models import Hold
+        return Hold.objects.filter(user=self.patron(i), status=Hold.Status.WAITING).values_list('id', flat=True)[0]
+
+    def token(self, user):
+        from rest_framework_simplejwt.tokens import RefreshToken
+        if user.pk not in self.tokens:
+            self.tokens[user.pk] = str(RefreshToken.for_user(user).access_token)
+        return self.tokens[user.pk]
+
+
+def run_scenario(scenario, ctx, client, requests):
+    from django.db import connection
+
+    queries = []
+    latencies = []
+    errors = 0
+
+    def count(execute, sql, params, many, context):
+        count.n += 1
+        return execute(sql, params, many, context)
+
+    for i in range(requests):
+        # Building the request may itself query (e.g. to find an open
+        # borrow); that work is not part of the measurement.
+        path, data, user = scenario.build(ctx, i)
+        headers = {'HTTP_AUTHORIZATION': f"Bearer {ctx.token(user)}"} if user else {}
+        count.n = 0
+        with connection.execute_wrapper(count):
+            started = time.perf_counter()
+            response = getattr(client, scenario.method)(path, data, format='json' if scenario.method == 'post' else None, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            latencies.append(time.perf_counter() - started)
+        queries.append(count.n)
+        if response.status_code not in scenario.expect:
+            errors += 1
+
+    total = sum(latencies)
+    return {
+        'route': scenario.route,
+        'method': scenario.method.upper(),
+        'requests': requests,
+        'errors': errors,
+        'latency_ms': percentiles(latencies),
+        'queries_per_request': {
+            'mean': round(sum(queries) / len(queries), 2),
+            'max': max(queries),
+        },
+        'throughput_per_s': round(requests / total, 1) if total else None,
+    }
+
+
+def uncovered_routes(names):
+    from api.urls import urlpatterns
+    covered = {scenario.route for scenario in scenarios() if scenario.name in names}
+    return sorted(str(pattern.pattern) for pattern in urlpatterns if str(pattern.pattern) not in covered)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', help='SQLite file to use (default: a new temp file)')
+    parser.add_argument('--no-seed', action='store_true', help='benchmark the data already in --db')
+    parser.add_argument('--books', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--authors', type=int, default=1000)
+    parser.add_argument('--borrows-per-user', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=100, help='requests per endpoint')
+    parser.add_argument('--only', nargs='*', help='scenario names to run')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+
+    db_path = setup_django(args.db, settings_overrides=benchmark_settings())
+
+    from django.core.management import call_command
+    from rest_framework.test import APIClient
+
+    if not args.no_seed:
+        call_command(
+            'seed_library', books=args.books, users=args.users, authors=args.authors,
+            borrows_per_user=args.borrows_per_user, seed=args.seed, verbosity=0,
+        )
+        # The worker-only dependencies; without them the endpoint serves empty lists.
+        if importlib.util.find_spec('scipy'):
+            from api.recommendations import update_neighbours
+            update_neighbours(full=True)
+
+    ctx = Context(args.requests, args.seed)
+    client = APIClient()
+    selected = [s for s in scenarios() if not args.only or s.name in args.only]
+
+    results = {}
+    for scenario in selected:
+        results[scenario.name] = run_scenario(scenario, ctx, client, args.requests)
+        row = results[scenario.name]
+        print(
+            f"{scenario.name:20} p50 {row['latency_ms']['p50']:8.2f} ms  "
+            f"p99 {row['latency_ms']['p99']:8.2f} ms  "
+            f"{row['queries_per_request']['mean']:6.1f} q/req  "
+            f"{row['throughput_per_s']:8.1f} req/s  errors {row['errors']}"
+        )
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'database': str(db_path),
+            'scale': {k: getattr(args, k) for k in ('books', 'users', 'authors', 'borrows_per_user')},
+            'requests_per_endpoint': args.requests,
+            'uncovered_routes': uncovered_routes({s.name for s in selected}),
+        },
+        'endpoints': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Load comparison of the sync (WSGI) and async (ASGI) read endpoints.
+
+In-process mode (default) seeds a throwaway database and drives the same
+reads through the sync DRF views with a pool of N threads, and through the
+async views with N concurrent asyncio tasks. The catalog response cache is
+disabled so both sides do the same database and serialization work.
+
+HTTP mode measures real servers started separately, for example
+
+    gunicorn core.wsgi -w 4 -b 127.0.0.1:8000
+    uvicorn core.asgi:application --workers 4 --port 8001
+    python -m benchmarks.asgi_vs_wsgi --wsgi-url http://127.0.0.1:8000 \\
+        --asgi-url http://127.0.0.1:8001 --token <access token> --concurrency 200
+
+Both modes print and optionally save (``--output``) throughput and latency
+percentiles per endpoint and concurrency level.
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from benchmarks.common import benchmark_settings, percentiles, setup_django
+
+# (name, sync path, async path, needs auth)
+ENDPOINTS = [
+    ('book_list', '/api/book/?page_size=50', '/api/async/book/?page_size=50', False),
+    ('book_detail', '/api/book/{book_id}/', '/api/async/book/{book_id}/', False),
+    ('borrow_list', '/api/borrow/', '/api/async/borrow/', True),
+    ('penalties', '/api/users/{user_id}/penalties/', '/api/async/users/{user_id}/penalties/', True),
+]
+
+
+def summarize(latencies, elapsed, errors):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_per_s': round(len(latencies) / elapsed, 1),
+        'latency_ms': percentiles(latencies),
+    }
+
+
+def run_wsgi_in_process(path, headers, concurrency, requests):
+    from django.test import Client
+
+    def one(_):
+        client = Client()
+        started = time.perf_counter()
+        response = client.get(path, **{f"HTTP_{k.upper()}": v for k, v in headers.items()})
+        return time.perf_counter() - started, response.status_code != 200
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    return summarize([r[0] for r in results], elapsed, sum(r[1] for r in results))
+
+
+async def run_asgi_in_process(path, headers, concurrency, requests):
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            started = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            return time.perf_counter() - started, response.status_code != 200
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return summarize([r[0] for r in results], elapsed, sum(r[1] for r in results))
+
+
+async def http_get(url, headers):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    lines = [f"GET {target} HTTP/1.1", f"Host: {parts.netloc}", "Connection: close"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+async def run_http(url, headers, concurrency, requests):
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            started = time.perf_counter()
+            try:
+                failed = await http_get(url, headers) != 200
+            except OSError:
+                failed = True
+            return time.perf_counter() - started, failed
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return summarize([r[0] for r in results], elapsed, sum(r[1] for r in results))
+
+
+def prepare_in_process(args):
+    overrides = benchmark_settings()
+    overrides['CATALOG_CACHE'] = {'BACKEND': 'lru', 'MAX_ENTRIES': 0}
+    setup_django(args.db, settings_overrides=overrides)
+
+    from django.core.management import call_command
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from api.models import Book, UserAccount
+
+    call_command('seed_library', books=args.books, users=args.users, seed=1, verbosity=0)
+    user = UserAccount.objects.filter(active_borrow_count__gt=0).first() or UserAccount.objects.first()
+    values = {'book_id': Book.objects.values_list('id', flat=True).first(), 'user_id': user.id}
+    token = str(RefreshToken.for_user(user).access_token)
+    return values, token
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--requests', type=int, default=1000, help='requests per endpoint and level')
+    parser.add_argument('--wsgi-url', help='base URL of a running WSGI server (HTTP mode)')
+    parser.add_argument('--asgi-url', help='base URL of a running ASGI server (HTTP mode)')
+    parser.add_argument('--token', help='access token for the authenticated endpoints (HTTP mode)')
+    parser.add_argument('--book-id', help='book id for the detail endpoint (HTTP mode)')
+    parser.add_argument('--user-id', help='user id of --token (HTTP mode)')
+    parser.add_argument('--db', help='SQLite file for in-process mode (default: a new temp file)')
+    parser.add_argument('--books', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    http_mode = bool(args.wsgi_url and args.asgi_url)
+    if http_mode:
+        values, token = {'book_id': args.book_id, 'user_id': args.user_id}, args.token
+    else:
+        values, token = prepare_in_process(args)
+
+    report = []
+    for name, sync_path, async_path, needs_auth in ENDPOINTS:
+        if needs_auth and not token or '{' in sync_path and None in values.values():
+            print(f"{name:12} skipped (missing token or ids)")
+            continue
+        headers = {'Authorization': f"Bearer {token}"} if needs_auth else {}
+        for concurrency in args.concurrency:
+            row = {'endpoint': name, 'concurrency': concurrency}
+            if http_mode:
+                row['wsgi'] = asyncio.run(run_http(
+                    args.wsgi_url + sync_path.format(**values), headers, concurrency, args.requests))
+                row['asgi'] = asyncio.run(run_http(
+                    args.asgi_url + async_path.format(**values), headers, concurrency, args.requests))
+            else:
+                row['wsgi'] = run_wsgi_in_process(
+                    sync_path.format(**values), headers, concurrency, args.requests)
+                row['asgi'] = asyncio.run(run_asgi_in_process(
+                    async_path.format(**values), headers, concurrency, args.requests))
+            report.append(row)
+            print(
+                f"{name:12} c={concurrency:<4} "
+                f"wsgi {row['wsgi']['throughput_per_s']:8.1f} req/s p99 {row['wsgi']['latency_ms']['p99']:8.1f} ms | "
+                f"asgi {row['asgi']['throughput_per_s']:8.1f} req/s p99 {row['asgi']['latency_ms']['p99']:8.1f} ms | "
+                f"errors {row['wsgi']['errors']}/{row['asgi']['errors']}"
+            )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'mode': 'http' if http_mode else 'in-process', 'results': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Borrow storm on a single hot title.
+
+Starts N threads that all try to borrow the same book, each attempt made by a
+different patron so the per-user limit never interferes, and reports
+throughput and how many borrows were handed out beyond the available copies.
+
+    python -m benchmarks.borrow_contention --threads 16 --attempts 50 --copies 100
+    python -m benchmarks.borrow_contention --mode legacy
+"""
+import argparse
+import json
+import threading
+import time
+
+from benchmarks.common import setup_django
+
+
+def legacy_borrow(user, book_id):
+    # The read-check-save sequence the borrow view used before the
+    # conditional UPDATE; kept here as the baseline.
+    from datetime import date, timedelta
+    from django.db import transaction
+    from api.circulation import BorrowError
+    from api.models import Book, Borrow
+
+    book = Book.objects.get(id=book_id)
+    if Borrow.objects.filter(user=user, return_date__isnull=True).count() >= 3:
+        raise BorrowError("can't borrow book. borrow limit reached")
+    if book.available_copies < 1:
+        raise BorrowError("this book is currenlty unavailable")
+    with transaction.atomic():
+        book.available_copies -= 1
+        book.save()
+        Borrow.objects.create(
+            user=user, book=book,
+            borrow_date=date.today(), due_date=date.today() + timedelta(days=14),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--attempts', type=int, default=50, help='borrow attempts per thread')
+    parser.add_argument('--copies', type=int, default=100)
+    parser.add_argument('--mode', choices=['atomic', 'legacy'], default='atomic')
+    parser.add_argument('--db', help='SQLite file to use (default: a new temp file)')
+    args = parser.parse_args()
+
+    db_path = setup_django(args.db)
+
+    from django.db import OperationalError, connection
+    from api.circulation import BorrowError, borrow_book
+    from api.models import Author, Book, Borrow, Category, UserAccount
+
+    author = Author.objects.create(name="Hot Author", bio="bio")
+    category = Category.objects.create(name="Hot Category")
+    book = Book.objects.create(
+        title="Hot Title", description="Everyone wants it",
+        author=author, category=category, total_copies=args.copies,
+    )
+    users = UserAccount.objects.bulk_create([
+        UserAccount(email=f"patron{i}@example.com", username=f"p{i}")
+        for i in range(args.threads * args.attempts)
+    ])
+    connection.close()
+
+    borrow = borrow_book if args.mode == 'atomic' else legacy_borrow
+    counts = {'ok': 0, 'rejected': 0, 'locked': 0}
+    lock = threading.Lock()
+    start_gate = threading.Barrier(args.threads)
+
+    def worker(patrons):
+        local = {'ok': 0, 'rejected': 0, 'locked': 0}
+        start_gate.wait()
+        for user in patrons:
+            try:
+                borrow(user, book.id)
+                local['ok'] += 1
+            except BorrowError:
+                local['rejected'] += 1
+            except OperationalError:
+                local['locked'] += 1
+        connection.close()
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    threads = [
+        threading.Thread(target=worker, args=(users[i::args.threads],))
+        for i in range(args.threads)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    book.refresh_from_db()
+    borrows = Borrow.objects.filter(book=book).count()
+    attempts = args.threads * args.attempts
+    result = {
+        'mode': args.mode,
+        'database': str(db_path),
+        'threads': args.threads,
+        'attempts': attempts,
+        'copies': args.copies,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(attempts / elapsed, 1),
+        'borrowed': counts['ok'],
+        'rejected': counts['rejected'],
+        'locked_errors': counts['locked'],
+        'available_copies_left': book.available_copies,
+        'oversold': max(0, borrows - (args.copies - book.available_copies)),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
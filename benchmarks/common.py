@@ -0,0 +1,78 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks run against a throwaway file-backed SQLite database so that they
+exercise real locking between connections, which the in-memory test database
+cannot do. Import this module and call ``setup_django()`` before touching any
+model.
+"""
+import os
+import statistics
+import tempfile
+
+# core.settings requires these; benchmarks never talk to a broker or the ESP.
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+for name, value in {
+    'CELERY_BROKER_URL': 'memory://',
+    'CELERY_RESULT_BACKEND': 'cache+memory://',
+    'DEFAULT_FROM_EMAIL': 'bench@example.com',
+    'SENDINBLUE_API_KEY': 'bench',
+}.items():
+    os.environ.setdefault(name, value)
+
+
+def setup_django(db_path=None, settings_overrides=None, **overrides):
+    """
+    Point Django at a fresh SQLite file, migrate it and return its path.
+    Extra keyword arguments are merged into ``DATABASES['default']``;
+    ``settings_overrides`` replaces top-level settings before apps load.
+    """
+    if db_path is None:
+        handle, db_path = tempfile.mkstemp(prefix='library-bench-', suffix='.sqlite3')
+        os.close(handle)
+        os.unlink(db_path)
+
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = db_path
+    settings.DATABASES['default'].update(overrides)
+    for name, value in (settings_overrides or {}).items():
+        setattr(settings, name, value)
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return db_path
+
+
+def benchmark_settings():
+    """
+    Settings for driving the API in-process: no throttling, any host, and no
+    DEBUG query log growing with every request.
+    """
+    from django.conf import settings
+    rest_framework = dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_CLASSES=[])
+    return {
+        'DEBUG': False,
+        'ALLOWED_HOSTS': ['*'],
+        'REST_FRAMEWORK': rest_framework,
+        'EMAIL_BACKEND': 'django.core.mail.backends.locmem.EmailBackend',
+    }
+
+
+def percentiles(samples):
+    """
+    Return p50/p95/p99 of ``samples`` (in seconds) as milliseconds.
+    """
+    if not samples:
+        return {'p50': None, 'p95': None, 'p99': None}
+    if len(samples) == 1:
+        value = round(samples[0] * 1000, 3)
+        return {'p50': value, 'p95': value, 'p99': value}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {
+        'p50': round(cuts[49] * 1000, 3),
+        'p95': round(cuts[94] * 1000, 3),
+        'p99': round(cuts[98] * 1000, 3),
+    }
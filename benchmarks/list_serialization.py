@@ -0,0 +1,85 @@
+"""
+ModelSerializer against the values_list fast path for large list responses.
+
+Seeds a throwaway database, then serializes the first ``--rows`` books and
+authors both ways: DRF ``many=True`` serializers over model instances
+(``select_related`` for books) and the ``ValuesSerializer`` subclasses in
+``api.serializers``. Times include the query, as in the views. The outputs
+are checked to be identical before timing.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from benchmarks.common import benchmark_settings, setup_django
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db', help='SQLite file to use (default: a new temp file)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    setup_django(args.db, settings_overrides=benchmark_settings())
+    from django.core.management import call_command
+    from api.models import Author, Book
+    from api.serializers import (
+        AuthorSerializer,
+        AuthorValuesSerializer,
+        BookInfoSerializer,
+        BookInfoValuesSerializer,
+    )
+
+    if Book.objects.count() < args.rows:
+        call_command('seed_library', books=args.rows, authors=args.rows, users=1, seed=1, verbosity=0)
+
+    books = Book.objects.order_by('id')[:args.rows]
+    authors = Author.objects.order_by('id')[:args.rows]
+    cases = [
+        ('books', lambda: BookInfoSerializer(books.select_related('author', 'category'), many=True).data,
+         lambda: BookInfoValuesSerializer.serialize(books)),
+        ('authors', lambda: AuthorSerializer(authors, many=True).data,
+         lambda: AuthorValuesSerializer.serialize(authors)),
+    ]
+
+    report = []
+    for name, model_serializer, values_serializer in cases:
+        expected = json.loads(json.dumps(model_serializer()))
+        if values_serializer() != expected:
+            raise SystemExit(f"{name}: fast path output differs from the model serializer")
+        slow_best, slow_median = best_of(model_serializer, args.repeat)
+        fast_best, fast_median = best_of(values_serializer, args.repeat)
+        row = {
+            'list': name,
+            'rows': len(expected),
+            'model_serializer_ms': round(slow_best * 1000, 1),
+            'values_serializer_ms': round(fast_best * 1000, 1),
+            'model_serializer_median_ms': round(slow_median * 1000, 1),
+            'values_serializer_median_ms': round(fast_median * 1000, 1),
+            'speedup': round(slow_best / fast_best, 1),
+        }
+        report.append(row)
+        print(
+            f"{name:8} {row['rows']:>6} rows: ModelSerializer {row['model_serializer_ms']:8.1f} ms | "
+            f"ValuesSerializer {row['values_serializer_ms']:7.1f} ms | {row['speedup']}x"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
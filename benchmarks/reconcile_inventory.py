@@ -0,0 +1,100 @@
+"""
+Inventory reconciliation over a large catalog.
+
+Seeds a throwaway database, knocks ``available_copies`` out of line on a
+fraction of the books, then times ``reconcile_available_copies`` fixing them
+and a second run that finds nothing to fix. With ``--concurrent-borrows``
+a thread keeps borrowing and returning while the first run is in progress;
+the script exits non-zero if any counter is still off afterwards.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+
+from benchmarks.common import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--books', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--drift', type=float, default=0.01, help='fraction of books to put out of line')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--pause', type=float, default=0.01, help='seconds between ranges')
+    parser.add_argument('--concurrent-borrows', action='store_true')
+    parser.add_argument('--db', help='SQLite file to use (default: a new temp file)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    setup_django(args.db)
+    from django.core.management import call_command
+    from django.db import OperationalError, connection
+    from django.db.models import F
+    from api.circulation import BorrowError, borrow_book, reconcile_available_copies, return_books
+    from api.models import Book, UserAccount
+
+    if Book.objects.count() < args.books:
+        call_command('seed_library', books=args.books, users=args.users, borrows_per_user=5, seed=1, verbosity=0)
+    reconcile_available_copies(chunk_size=args.chunk_size)
+
+    ids = list(Book.objects.values_list('id', flat=True))
+    drifted = random.Random(1).sample(ids, int(len(ids) * args.drift))
+    for start in range(0, len(drifted), 500):
+        Book.objects.filter(id__in=drifted[start:start + 500]).update(available_copies=F('available_copies') + 1)
+    connection.close()
+
+    stop = threading.Event()
+    borrows = {'borrowed': 0, 'returned': 0, 'locked': 0}
+
+    def borrower():
+        rng = random.Random(2)
+        users = list(UserAccount.objects.filter(active_borrow_count=0)[:50])
+        while not stop.is_set():
+            user = rng.choice(users)
+            try:
+                borrow = borrow_book(user, rng.choice(ids))
+                borrows['borrowed'] += 1
+                return_books(user, [borrow.id])
+                borrows['returned'] += 1
+            except BorrowError:
+                pass
+            except OperationalError:
+                borrows['locked'] += 1
+        connection.close()
+
+    thread = threading.Thread(target=borrower) if args.concurrent_borrows else None
+    if thread:
+        thread.start()
+    started = time.perf_counter()
+    try:
+        first = reconcile_available_copies(chunk_size=args.chunk_size, pause=args.pause)
+        first_s = time.perf_counter() - started
+    finally:
+        if thread:
+            stop.set()
+            thread.join()
+
+    started = time.perf_counter()
+    second = reconcile_available_copies(chunk_size=args.chunk_size, pause=args.pause)
+    second_s = time.perf_counter() - started
+
+    result = {
+        'books': len(ids),
+        'drift_injected': len(drifted),
+        'first_run': dict(first, seconds=round(first_s, 2)),
+        'second_run': dict(second, seconds=round(second_s, 2)),
+        'concurrent_borrows': borrows if thread else None,
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if first['drifted'] != len(drifted) or second['drifted']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
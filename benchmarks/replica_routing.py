@@ -0,0 +1,121 @@
+"""
+Read-replica routing against two local SQLite files.
+
+Seeds a primary database, copies it to one or more replica files and runs
+the API in-process with ``DATABASE_REPLICAS`` pointing at the copies. It
+reports how catalog reads spread over the replicas, then checks
+read-your-writes: a book added to the primary only is missing on the
+replicas, yet a client that just wrote is pinned to the primary and sees it.
+Catalog reads stay on the primary for ``STICKY_SECONDS`` after the catalog
+changes, so the script shortens that window and waits it out where a check
+needs the replicas.
+The script exits non-zero when a routing check fails.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.common import benchmark_settings, setup_django
+
+STICKY_SECONDS = 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--replicas', type=int, default=2)
+    parser.add_argument('--weights', type=int, nargs='+', help='weight per replica (default: all 1)')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='library-replicas-')
+    primary = os.path.join(workdir, 'primary.sqlite3')
+    weights = args.weights or [1] * args.replicas
+    replicas = {f'replica_{i}': os.path.join(workdir, f'replica_{i}.sqlite3') for i in range(args.replicas)}
+
+    from django.conf import settings
+    for alias, path in replicas.items():
+        settings.DATABASES[alias] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}
+    overrides = benchmark_settings()
+    overrides['CATALOG_CACHE'] = {'BACKEND': 'lru', 'MAX_ENTRIES': 0}
+    overrides['DATABASE_REPLICAS'] = dict(zip(replicas, weights))
+    overrides['REPLICA_ROUTING'] = {'STICKY_SECONDS': STICKY_SECONDS}
+    setup_django(primary, settings_overrides=overrides)
+
+    from django.core.management import call_command
+    from django.db import connections
+    from django.test import Client
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from api.models import Author, Book, Category, UserAccount
+
+    call_command('seed_library', books=args.books, users=args.users, seed=1, verbosity=0)
+    connections.close_all()
+    for path in replicas.values():
+        shutil.copyfile(primary, path)
+    # Seeding changed the catalog; the copies are up to date once the window passed.
+    time.sleep(STICKY_SECONDS)
+
+    served = Counter()
+
+    def count(alias):
+        def wrapper(execute, sql, params, many, context):
+            served[alias] += 1
+            return execute(sql, params, many, context)
+        return wrapper
+
+    for alias in connections:
+        connections[alias].execute_wrappers.append(count(alias))
+
+    client = Client()
+    book_ids = list(Book.objects.values_list('id', flat=True)[:100])
+    served.clear()
+    for i in range(args.requests):
+        client.get('/api/book/', {'page_size': 50}) if i % 2 else client.get(f'/api/book/{book_ids[i % 100]}/')
+    spread = dict(served)
+    print(f"{args.requests} catalog reads, queries per database: {spread}")
+
+    # A book that only exists on the primary, as if replication lagged.
+    book = Book.objects.create(
+        title="Fresh arrival", description="", total_copies=1,
+        author=Author.objects.first(), category=Category.objects.first(),
+    )
+    # A replica lagging longer than the window after a catalog change.
+    time.sleep(STICKY_SECONDS)
+    patron, other = UserAccount.objects.all()[:2]
+    writer = {'HTTP_AUTHORIZATION': f"Bearer {RefreshToken.for_user(patron).access_token}"}
+    reader = {'HTTP_AUTHORIZATION': f"Bearer {RefreshToken.for_user(other).access_token}"}
+
+    checks = {
+        'replica lags behind the primary': Client().get(f'/api/book/{book.id}/').status_code == 404,
+    }
+    borrowed = client.post('/api/borrow/', {'book_id': str(book.id)}, **writer)
+    checks['write goes to the primary'] = borrowed.status_code == 200
+    checks['writer reads its write (token pin)'] = (
+        Client().get(f'/api/book/{book.id}/', **writer).status_code == 200
+    )
+    checks['writer reads its write (cookie pin)'] = (
+        client.get(f'/api/book/{book.id}/').status_code == 200
+    )
+    checks['other clients keep reading replicas'] = (
+        Client().get(f'/api/book/{book.id}/', **reader).status_code == 404
+    )
+    for name, ok in checks.items():
+        print(f"{'ok  ' if ok else 'FAIL'} {name}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'queries_per_database': spread, 'checks': checks}, f, indent=2)
+    shutil.rmtree(workdir, ignore_errors=True)
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
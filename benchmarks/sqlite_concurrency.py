@@ -0,0 +1,199 @@
+"""
+Mixed read/write load on SQLite: default settings against the production profile.
+
+Each profile runs in its own process on a freshly seeded database. Threads
+drive the real WSGI handler, so connections are opened and closed (or kept,
+with ``CONN_MAX_AGE``) per request exactly as under gunicorn. Every thread is
+a patron with its own token: reads are book pages, book details and the
+patron's open borrows; writes borrow a book or return the last one borrowed.
+Reports throughput, p50/p95/p99 latency and requests that failed with
+"database is locked".
+
+    python -m benchmarks.sqlite_concurrency --threads 16 --seconds 10 --write-ratio 0.2
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import benchmark_settings, percentiles, setup_django
+
+PROFILES = ('default', 'production')
+
+
+def run_profile(args):
+    from core.sqlite import production_profile
+
+    database = {}
+    if args.profile == 'production':
+        database = production_profile({}, conn_max_age=600)
+    db_path = setup_django(settings_overrides=benchmark_settings(), **database)
+    # Failed requests are counted below; their tracebacks would drown the report.
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.management import call_command
+    from django.core.signals import got_request_exception
+    from django.db import OperationalError, connection
+    from django.test import RequestFactory
+    from rest_framework_simplejwt.tokens import RefreshToken
+    from api.models import Book, UserAccount
+
+    call_command('seed_library', books=args.books, users=args.threads, borrows_per_user=0,
+                 seed=1, verbosity=0)
+    Book.objects.update(total_copies=10 ** 6, available_copies=10 ** 6)
+    book_ids = [str(pk) for pk in Book.objects.values_list('id', flat=True)]
+    tokens = [str(RefreshToken.for_user(user).access_token) for user in UserAccount.objects.all()[:args.threads]]
+    connection.close()
+
+    handler = WSGIHandler()
+    factory = RequestFactory()
+    results = {'read': [], 'write': []}
+    errors = {'locked': 0, 'other': 0}
+    lock = threading.Lock()
+    start_gate = threading.Barrier(len(tokens))
+    deadline = [0.0]
+
+    locked = threading.local()
+
+    def on_exception(sender, request=None, **kwargs):
+        error = sys.exc_info()[1]
+        locked.seen = isinstance(error, OperationalError) and 'locked' in str(error)
+
+    got_request_exception.connect(on_exception)
+
+    def call(method, path, token, data=None):
+        auth = {'HTTP_AUTHORIZATION': f"Bearer {token}"}
+        if method == 'post':
+            request = factory.post(path, data, content_type='application/json', **auth)
+        else:
+            request = factory.get(path, data, **auth)
+        environ = dict(request.environ, **{'wsgi.errors': io.StringIO()})
+        status = []
+        response = handler(environ, lambda s, headers: status.append(int(s.split()[0])))
+        body = b"".join(response)
+        response.close()  # request_finished: close_old_connections()
+        return status[0], body
+
+    def worker(token, seed):
+        rng = random.Random(seed)
+        borrowed = []
+        local = {'read': [], 'write': []}
+        local_errors = {'locked': 0, 'other': 0}
+        start_gate.wait()
+        while time.perf_counter() < deadline[0]:
+            write = rng.random() < args.write_ratio
+            started = time.perf_counter()
+            if not write:
+                choice = rng.random()
+                if choice < 0.4:
+                    status, _ = call('get', '/api/book/', token, {'page_size': 20})
+                elif choice < 0.8:
+                    status, _ = call('get', f'/api/book/{rng.choice(book_ids)}/', token)
+                else:
+                    status, _ = call('get', '/api/borrow/', token, {'status': 'active'})
+            elif borrowed and (len(borrowed) >= 3 or rng.random() < 0.5):
+                status, _ = call('post', '/api/return/', token, {'borrow_id': borrowed.pop()})
+            else:
+                status, _ = call('post', '/api/borrow/', token, {'book_id': rng.choice(book_ids)})
+                if status == 200:
+                    _, body = call('get', '/api/borrow/', token, {'status': 'active'})
+                    rows = json.loads(body)
+                    rows = rows['results'] if isinstance(rows, dict) else rows
+                    known = set(borrowed)
+                    borrowed.extend(row['id'] for row in rows if row['id'] not in known)
+            elapsed = time.perf_counter() - started
+            if getattr(locked, 'seen', False):
+                locked.seen = False
+                local_errors['locked'] += 1
+            elif status >= 400:
+                local_errors['other'] += 1
+            else:
+                local['write' if write else 'read'].append(elapsed)
+        connection.close()
+        with lock:
+            for kind, samples in local.items():
+                results[kind].extend(samples)
+            for kind, count in local_errors.items():
+                errors[kind] += count
+
+    threads = [threading.Thread(target=worker, args=(token, i)) for i, token in enumerate(tokens)]
+    deadline[0] = time.perf_counter() + args.seconds
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode")
+        journal_mode = cursor.fetchone()[0]
+    connection.close()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
+
+    completed = len(results['read']) + len(results['write'])
+    return {
+        'profile': args.profile,
+        'journal_mode': journal_mode,
+        'threads': len(tokens),
+        'seconds': args.seconds,
+        'write_ratio': args.write_ratio,
+        'requests': completed,
+        'throughput_per_s': round(completed / args.seconds, 1),
+        'reads': {'count': len(results['read']), **percentiles(results['read'])},
+        'writes': {'count': len(results['write']), **percentiles(results['write'])},
+        'locked_errors': errors['locked'],
+        'other_errors': errors['other'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profile', choices=PROFILES, help='run one profile in this process')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.profile:
+        report = [run_profile(args)]
+    else:
+        # One process per profile: settings and connections are per process.
+        report = []
+        for profile in PROFILES:
+            handle, path = tempfile.mkstemp(suffix='.json')
+            os.close(handle)
+            command = [
+                sys.executable, '-m', 'benchmarks.sqlite_concurrency', '--profile', profile,
+                '--threads', str(args.threads), '--seconds', str(args.seconds),
+                '--write-ratio', str(args.write_ratio), '--books', str(args.books), '--output', path,
+            ]
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            with open(path) as f:
+                report.extend(json.load(f))
+            os.unlink(path)
+
+    for row in report:
+        print(
+            f"{row['profile']:10} {row['journal_mode']:8} {row['throughput_per_s']:8.1f} req/s | "
+            f"read p50 {row['reads']['p50']} ms p99 {row['reads']['p99']} ms | "
+            f"write p50 {row['writes']['p50']} ms p99 {row['writes']['p99']} ms | "
+            f"locked {row['locked_errors']} other {row['other_errors']}"
+        )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
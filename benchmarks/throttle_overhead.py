@@ -0,0 +1,90 @@
+"""
+Per-request overhead of DRF's history-list throttle against the sliding-window
+counter throttle in ``api.throttling``.
+
+Each throttle is checked for one client whose recent history already holds
+``--history`` requests, under a rate high enough that the check passes. The
+blocked case measures a client that is over its limit. Both run on a
+local-memory cache, which pickles values like the network backends do but
+without a round trip, so the numbers isolate the throttle's own cost.
+"""
+import argparse
+import json
+import time
+from types import SimpleNamespace
+
+from benchmarks import common  # noqa: F401  (environment defaults)
+
+
+def make_throttles(rate):
+    from rest_framework import throttling
+    from api import throttling as sliding
+
+    class DRFThrottle(throttling.UserRateThrottle):
+        pass
+
+    class SlidingThrottle(sliding.UserRateThrottle):
+        pass
+
+    DRFThrottle.rate = SlidingThrottle.rate = rate
+    return {'drf': DRFThrottle, 'sliding_window': SlidingThrottle}
+
+
+def reset(throttle_class):
+    from django.core.cache import cache
+    cache.clear()
+    if hasattr(throttle_class, 'blocked'):
+        throttle_class.blocked.clear()
+
+
+def measure(throttle_class, request, now, calls):
+    throttle = throttle_class()
+    throttle.timer = lambda: now
+    started = time.perf_counter()
+    for _ in range(calls):
+        throttle.allow_request(request, None)
+    return (time.perf_counter() - started) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--history', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+
+    request = SimpleNamespace(user=SimpleNamespace(is_authenticated=True, pk='bench-user'), META={})
+    now = 1_000_000.0
+    report = []
+    for history in args.history:
+        # The limit sits far above the history, so every measured call passes
+        # and (for DRF) appends to a list of about ``history`` timestamps.
+        throttles = make_throttles(f"{(history + args.calls) * 10}/day")
+        row = {'history': history}
+        for name, throttle_class in throttles.items():
+            reset(throttle_class)
+            warmup = throttle_class()
+            warmup.timer = lambda: now - 1
+            for _ in range(history):
+                warmup.allow_request(request, None)
+            row[name] = round(measure(throttle_class, request, now, args.calls) * 1e6, 2)
+        report.append(row)
+        print(f"history {history:>6}: drf {row['drf']:9.2f} us/check | sliding window {row['sliding_window']:7.2f} us/check")
+
+    blocked = {}
+    for name, throttle_class in make_throttles('10/day').items():
+        reset(throttle_class)
+        measure(throttle_class, request, now, 11)
+        blocked[name] = round(measure(throttle_class, request, now, args.calls) * 1e6, 2)
+    print(f"over the limit: drf {blocked['drf']:9.2f} us/check | sliding window {blocked['sliding_window']:7.2f} us/check")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'allowed': report, 'blocked': blocked}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
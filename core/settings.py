@@ -3,6 +3,8 @@ from datetime import timedelta
 import environ
 import os
 
+from .sqlite import production_profile
+
 env = environ.Env()
 environ.Env.read_env()
 
@@ -47,6 +49,8 @@ INSTALLED_APPS += [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.routers.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,6 +90,38 @@ DATABASES = {
     }
 }
 
+# Read replicas as alias -> weight; every alias must be in DATABASES. Catalog
+# reads are spread over them (see api.routers), everything else uses default.
+# REPLICA_SQLITE_PATHS adds SQLite files, e.g. copies of db.sqlite3.
+DATABASE_REPLICAS = {}
+for i, path in enumerate(env.list('REPLICA_SQLITE_PATHS', default=[])):
+    DATABASES[f'replica_{i}'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path}
+    DATABASE_REPLICAS[f'replica_{i}'] = 1
+
+# SQLITE_PRODUCTION=1 turns on WAL, tuned pragmas, BEGIN IMMEDIATE for write
+# transactions and persistent connections (see core/sqlite.py). Persistent
+# connections only pay off under WSGI; ASGI opens one per request anyway.
+if env.bool('SQLITE_PRODUCTION', default=False):
+    DATABASES = {
+        alias: production_profile(database, conn_max_age=env.int('CONN_MAX_AGE', default=600))
+        for alias, database in DATABASES.items()
+    }
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+REPLICA_ROUTING = {
+    'STICKY_SECONDS': 10,
+    'HEALTH_CHECK_SECONDS': 5,
+    'RETRY_SECONDS': 30,
+}
+
+# Borrows returned more than AFTER_DAYS ago are moved to the archive table
+# by api.tasks.archive_borrows, BATCH_SIZE rows per transaction.
+BORROW_ARCHIVE = {
+    'AFTER_DAYS': env.int('BORROW_ARCHIVE_AFTER_DAYS', default=365),
+    'BATCH_SIZE': 5000,
+}
+
 CELERY_TIMEZONE = "Asia/Dhaka"
 CELERY_BROKER_URL = env("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = env("CELERY_RESULT_BACKEND")
@@ -139,11 +175,11 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedUserJWTAuthentication',
     ),
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.UserRateThrottle',
-        'rest_framework.throttling.AnonRateThrottle',
+        'api.throttling.UserRateThrottle',
+        'api.throttling.AnonRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'user': '100/day',    
@@ -153,6 +189,44 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = 'api.UserAccount'
 
+# Per-view request metrics served at /api/metrics/. With a sample rate above
+# zero, that share of requests records its SQL and is logged to
+# 'api.slow_requests' when slower than SLOW_REQUEST_SECONDS.
+METRICS = {
+    'ENABLED': env.bool('METRICS_ENABLED', default=False),
+    'SLOW_REQUEST_SECONDS': 1.0,
+    'SLOW_REQUEST_SAMPLE_RATE': env.float('SLOW_REQUEST_SAMPLE_RATE', default=0.0),
+}
+
+# Throttle counters, read-your-writes pins, catalog versions and change
+# markers live here. The default cache is per process; when running several
+# workers set CACHE_URL to a shared one, e.g. redis://localhost:6379/1.
+CACHES = {'default': env.cache('CACHE_URL', default='locmemcache://')}
+
+# Cache holding the throttle counters. Point it at a cache shared by all
+# workers (Redis, Memcached) so limits apply across processes.
+THROTTLE_CACHE = 'default'
+
+# Serialized catalog responses. BACKEND is 'lru' (per-process) or 'django'
+# (the CACHE_ALIAS cache). VERSION_CACHE holds the invalidation counter and
+# should be a shared cache when running several workers. It also holds the
+# change markers behind ETag/Last-Modified, which are only sent when it is
+# shared, or when SINGLE_WORKER says one process serves all requests.
+CATALOG_CACHE = {
+    'BACKEND': env('CATALOG_CACHE_BACKEND', default='lru'),
+    'MAX_ENTRIES': 2048,
+    'TIMEOUT': 300,
+    'CACHE_ALIAS': 'default',
+    'VERSION_CACHE': 'default',
+    'SINGLE_WORKER': env.bool('SINGLE_WORKER', default=False),
+}
+
+# Users resolved from access tokens are kept per process for TIMEOUT seconds.
+AUTH_USER_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TIMEOUT': 60,
+}
+
 # djangosimple-jwt settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
@@ -161,6 +235,7 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'ALGORITHM': 'HS256',
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'api.serializers.LibraryTokenObtainPairSerializer',
 }
 
 EMAIL_BACKEND = "anymail.backends.sendinblue.EmailBackend"